@@ -0,0 +1,64 @@
+"""
+Microbenchmark of the Vector operations against the original implementation (type checks that construct a Vector, no slots, no in-place operators).
+
+    python -m benchmarks.bench_vector
+"""
+
+import timeit
+
+from src.vector import Vector
+
+
+class LegacyVector():
+    """The original Vector, reduced to the operations benchmarked here."""
+
+    def __init__(self, x, y, z=None):
+        if z == None:
+            z = 0
+        self.x, self.y, self.z = x, y, z
+
+    def __add__(self, other):
+        if type(other) == type(LegacyVector(0, 0)):
+            return LegacyVector(self.x + other.x, self.y + other.y, self.z + other.z)
+        raise TypeError("Scalars cannot be added to vectors!")
+
+    def __mul__(self, other):
+        if type(other) == type(0) or type(other) == type(0.0):
+            return LegacyVector(self.x * other, self.y * other, self.z * other)
+        raise TypeError("Only scalars can be multiplied with vectors!")
+
+    def dot(self, other):
+        if type(other) == type(LegacyVector(0, 0)):
+            return self.x * other.x + self.y * other.y + self.z * other.z
+        raise TypeError("Dot products must be done with vectors!")
+
+
+# (name, legacy statement, new statement), both run with v, w and s defined.
+OPERATIONS = [
+    ('construct', 'LegacyVector(1.0, 2.0, 3.0)', 'Vector(1.0, 2.0, 3.0)'),
+    ('v + w', 'v + w', 'v + w'),
+    ('v * s', 'v * s', 'v * s'),
+    ('v += w', 'v += w', 'v += w'),
+    ('v += w * s', 'v += w * s', 'v.axpy(s, w)'),
+    ('v.dot(w)', 'v.dot(w)', 'v.dot(w)'),
+]
+
+
+def timePerOp(statement, vectorClass, number):
+    setup = 'v = cls(1.0, 2.0, 3.0); w = cls(0.5, -1.0, 2.0); s = 1e-3'
+    namespace = {'cls': vectorClass, 'LegacyVector': LegacyVector, 'Vector': Vector}
+    return min(timeit.repeat(statement, setup, repeat=5, number=number, globals=namespace)) / number
+
+
+def main(number=200000):
+    print("%-12s %12s %12s %9s" % ('operation', 'legacy (ns)', 'new (ns)', 'speedup'))
+    results = dict()
+    for name, legacy, new in OPERATIONS:
+        before, after = timePerOp(legacy, LegacyVector, number), timePerOp(new, Vector, number)
+        results[name] = (before, after)
+        print("%-12s %12.1f %12.1f %8.2fx" % (name, before * 1e9, after * 1e9, before / after))
+    return results
+
+
+if __name__ == "__main__":
+    main()
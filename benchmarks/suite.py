@@ -0,0 +1,182 @@
+"""
+Throughput and scaling benchmarks of the physics and vector hot paths, with results stored as JSON to compare commits and plot scaling curves.
+
+    python -m benchmarks.suite --output results.json                   # full run, a few minutes
+    python -m benchmarks.suite --smoke                                  # small sizes and short timings, a few seconds
+    python -m benchmarks.suite --output new.json --compare old.json     # also prints the ratio to an earlier run
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import timeit
+
+import numpy as np
+
+import demos
+from src import data_parse as dp
+from src import nbody as nb
+from src.vector import Vector
+
+from .bench_vector import OPERATIONS
+
+
+SIZES = (2, 9, 100, 1000, 10000)
+LISTSIZES = (2, 9, 100, 1000)           # list mode is O(N^2) in Python: 10k bodies take minutes per step
+SMOKESIZES = (2, 9, 100)
+
+
+def randomSystem(N, arrays=False, seed=0):
+    # N Earth-like bodies spread over a few au, with small random velocities (a cluster for timing, not for physics).
+    rng = np.random.default_rng(seed)
+    nBody = nb.NBody(arrays=arrays)
+    for i, (pos, vel) in enumerate(zip(rng.normal(0, 1.5e11, (N, 3)).tolist(), rng.normal(0, 3e4, (N, 3)).tolist())):
+        nBody.addBody(nb.Body('body%d' % i, 6e24, 6.4e6)(Vector(*pos), Vector(*vel)))
+    return nBody
+
+
+def measure(function, budget, repeat=5):
+    # Times calls of a function: as many per run as fit in about budget / repeat seconds (at least one), over "repeat" runs.
+    # Returns (median, minimum) seconds per call, and the number of calls per run.
+    timer = timeit.Timer(function)
+    once = timer.timeit(1)
+    number = max(1, int(budget / repeat / max(once, 1e-9)))
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return statistics.median(times), min(times), number
+
+
+def result(group, name, median, minimum, number, **extra):
+    entry = dict(group=group, name=name, seconds=median, min=minimum, number=number)
+    entry.update(extra)
+    return entry
+
+
+
+def benchVector(budget):
+    results = []
+    namespace = {'Vector': Vector}
+    for name, _, statement in OPERATIONS:
+        setup = 'v = Vector(1.0, 2.0, 3.0); w = Vector(0.5, -1.0, 2.0); s = 1e-3'
+        timer = timeit.Timer(statement, setup, globals=namespace)
+        number = max(1000, int(budget / 5 / max(timer.timeit(1000) / 1000, 1e-9)))
+        times = [t / number for t in timer.repeat(repeat=5, number=number)]
+        results.append(result('vector', name, statistics.median(times), min(times), number))
+    return results
+
+
+def benchUpdate(budget, sizes, listsizes, deltatime=60):
+    results = []
+    for arrays in (False, True):
+        for N in (sizes if arrays else listsizes):
+            nBody = randomSystem(N, arrays)
+            nBody.update(deltatime)             # warm up (engine import, first force evaluation)
+            repeat = 5 if N < 10000 else 3
+            median, minimum, number = measure(lambda: nBody.update(deltatime), budget, repeat)
+            results.append(result('update', 'update %s N=%d' % ('arrays' if arrays else 'list', N), median, minimum, number,
+                                  N=N, mode='arrays' if arrays else 'list', bodystepspersec=N / median))
+    return results
+
+
+def benchCopy(budget, sizes, listsizes):
+    results = []
+    for arrays in (False, True):
+        for N in (sizes if arrays else listsizes):
+            nBody = randomSystem(N, arrays)
+            median, minimum, number = measure(nBody.__copy__, budget, 3 if N >= 10000 else 5)
+            results.append(result('copy', 'copy %s N=%d' % ('arrays' if arrays else 'list', N), median, minimum, number, N=N, mode='arrays' if arrays else 'list'))
+    return results
+
+
+def benchData(budget):
+    dp.getData('Earth')             # catalog loaded (from the cache) before timing lookups
+    median, minimum, number = measure(lambda: dp.getData('Earth'), budget)
+    return [result('data', 'getData', median, minimum, number)]
+
+
+def benchScenes(budget):
+    results = []
+    for name, scene in sorted(demos.SCENES.items()):
+        median, minimum, number = measure(scene, budget)
+        results.append(result('scene', 'scene %s' % name, median, minimum, number, N=scene().N))
+    return results
+
+
+
+def environment(smoke):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return dict(commit=commit, date=time.strftime('%Y-%m-%dT%H:%M:%S'), python=platform.python_version(), numpy=np.__version__,
+                platform=platform.platform(), processor=platform.processor() or platform.machine(), cpus=os.cpu_count(), smoke=smoke)
+
+
+def runSuite(smoke=False, groups=None, log=None):
+    # Runs the benchmark groups (all by default) and returns the results document.
+    budget = 0.05 if smoke else 1.0
+    sizes, listsizes = (SMOKESIZES, SMOKESIZES) if smoke else (SIZES, LISTSIZES)
+    suite = [('vector', lambda: benchVector(budget)),
+             ('update', lambda: benchUpdate(budget, sizes, listsizes)),
+             ('copy', lambda: benchCopy(budget, sizes, listsizes)),
+             ('data', lambda: benchData(budget)),
+             ('scene', lambda: benchScenes(budget))]
+
+    results = []
+    for group, bench in suite:
+        if groups != None and group not in groups:
+            continue
+        for entry in bench():
+            results.append(entry)
+            if log != None:
+                log(formatResult(entry))
+    return dict(environment=environment(smoke), results=results)
+
+
+def formatResult(entry, baseline=None):
+    seconds = entry['seconds']
+    text = "%-28s %14s" % (entry['name'], formatSeconds(seconds))
+    if 'bodystepspersec' in entry:
+        text += "  %10.4g bodies x steps/s" % entry['bodystepspersec']
+    if baseline != None:
+        text += "  %6.2fx vs baseline" % (baseline['seconds'] / seconds)
+    return text
+
+
+def formatSeconds(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return "%.3f %s" % (seconds / scale, unit)
+    return "%.1f ns" % (seconds * 1e9)
+
+
+def compare(document, baseline):
+    # Returns lines comparing every result with the same name in a baseline document (speedup > 1 is faster now).
+    old = {entry['name']: entry for entry in baseline['results']}
+    return [formatResult(entry, old[entry['name']]) for entry in document['results'] if entry['name'] in old]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmarks.")
+    parser.add_argument('--smoke', action='store_true', help="small sizes and short timings, to check the suite runs")
+    parser.add_argument('--output', help="JSON file to write the results to")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--groups', nargs='+', choices=['vector', 'update', 'copy', 'data', 'scene'], help="only run these groups")
+    args = parser.parse_args(argv)
+
+    document = runSuite(smoke=args.smoke, groups=args.groups, log=None if args.compare else print)
+    if args.compare != None:
+        with open(args.compare) as f:
+            print("\n".join(compare(document, json.load(f))))
+    if args.output != None:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=1)
+    return document
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,11 @@
-from .earth_and_moon import earth_and_moon_sim
-from .solar_system import solar_system_sim
-from .trappist_1 import trappist_1_sim
\ No newline at end of file
+from .earth_and_moon import earth_and_moon_sim, earth_and_moon_scene
+from .solar_system import solar_system_sim, solar_system_scene, asteroid_belt_sim, asteroid_belt_scene
+from .trappist_1 import trappist_1_sim, trappist_1_scene
+
+# Physics-only scene builders by name, for headless runs.
+SCENES = {
+    'earth_and_moon': earth_and_moon_scene,
+    'solar_system': solar_system_scene,
+    'asteroid_belt': asteroid_belt_scene,
+    'trappist_1': trappist_1_scene,
+}
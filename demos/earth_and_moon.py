@@ -2,23 +2,35 @@
 Main file for the program.
 """
 
-from src import simulation
+from src import nbody as nb
 from src import data_parse as dp
 from src.vector import Vector
 
 
-def earth_and_moon_sim():
-    sim = simulation.AstrophysicsSimulation((900,900), sim_speed=36000, title=b"Earth and Moon System")
+def earth_and_moon_scene(nBody=None):
+    # Adds the bodies of the system to an NBody (a new one by default) and returns it. Needs no rendering.
+    if nBody == None:
+        nBody = nb.NBody()
 
-    sim.centeredBodyIndex = 0      # starts around the earth
-
-    sim.addPrefabBody("Earth")
-    sim.addPrefabBody("Moon")
+    nBody.addBody(nb.prefabBody("Earth"))
+    nBody.addBody(nb.prefabBody("Moon"))
 
     moon_data = dp.getData("Moon")
-    sim.NBody[1](moon_data['semimajor_axis'] * Vector(1, 0, 0), moon_data['orbital_velocity'] * Vector(0,1))
+    nBody[1](moon_data['semimajor_axis'] * Vector(1, 0, 0), moon_data['orbital_velocity'] * Vector(0,1))
+
+    return nBody
+
+
+def earth_and_moon_sim(engine=None, integrator=None, process=False):
+    from src import simulation
+
+    sim = simulation.AstrophysicsSimulation((900,900), sim_speed=36000, title=b"Earth and Moon System", engine=engine, integrator=integrator, process=process)
+
+    sim.centeredBodyIndex = 0      # starts around the earth
+
+    earth_and_moon_scene(sim.NBody)
     
-    sim.zoomout = moon_data['semimajor_axis'] * 2.5      # z direction
+    sim.zoomout = dp.getData("Moon")['semimajor_axis'] * 2.5      # z direction
 
     return sim
 
@@ -4,26 +4,62 @@ Main file for the program.
 
 import math
 
-from src import simulation
+from src import nbody as nb
 from src import data_parse as dp
 from src.vector import Vector
 
 
-def solar_system_sim():
-    sim = simulation.AstrophysicsSimulation((900,900), sim_speed=36000, title=b"Solar System")
+def solar_system_scene(nBody=None):
+    # Adds the bodies of the system to an NBody (a new one by default) and returns it. Needs no rendering.
+    if nBody == None:
+        nBody = nb.NBody()
 
-    sim.centeredBodyIndex = 0      # starts around the sun
     system_inclination = dp.getData("Earth")['inclination']      # inclination starts around the earth
 
-    sim.addPrefabBodies(["Sun", "Mercury", "Venus", "Earth", "Mars", "Jupiter", "Saturn", "Uranus", "Neptune"])
+    for name in ["Sun", "Mercury", "Venus", "Earth", "Mars", "Jupiter", "Saturn", "Uranus", "Neptune"]:
+        nBody.addBody(nb.prefabBody(name))
 
-    for body in sim.NBody[1:]:
+    for body in nBody[1:]:
         data = dp.getData(body.name)
         incline_x = 0 #math.cos(math.pi/2 + data['inclination'] - system_inclination)
 
         body(data['semimajor_axis'] * Vector(math.sqrt(1 - incline_x**2), 0, incline_x), data['orbital_velocity'] * Vector(0,1))
+
+    return nBody
+
+
+def solar_system_sim(engine=None, integrator=None, process=False):
+    from src import simulation
+
+    sim = simulation.AstrophysicsSimulation((900,900), sim_speed=36000, title=b"Solar System", engine=engine, integrator=integrator, process=process)
+
+    sim.centeredBodyIndex = 0      # starts around the sun
+
+    solar_system_scene(sim.NBody)
     
     sim.zoomout = dp.getData("Mars")['semimajor_axis'] * 2.5      # z direction
 
     return sim
 
+
+
+
+def asteroid_belt(nBody, count=20000):
+    # Adds "count" massless test particles in the main asteroid belt (semimajor axes of 2.1 to 3.3 AU) about the first body of an NBody and returns it.
+    from src import particles
+
+    AU = dp.getData("Earth")['semimajor_axis']
+    nBody.addParticles(particles.belt(nBody[0], count, a=(2.1 * AU, 3.3 * AU), e=(0.0, 0.2), i=(0.0, 0.3), seed=0))
+    return nBody
+
+
+def asteroid_belt_scene(nBody=None):
+    # The solar system with a main asteroid belt of test particles. Needs no rendering.
+    return asteroid_belt(solar_system_scene(nBody))
+
+
+def asteroid_belt_sim(engine=None, integrator='wh', process=False):
+    sim = solar_system_sim(engine=engine, integrator=integrator, process=process)
+    asteroid_belt(sim.NBody)
+    sim.zoomout = dp.getData("Jupiter")['semimajor_axis'] * 2.5
+    return sim
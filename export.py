@@ -0,0 +1,49 @@
+"""
+Offscreen export entry point for the program.
+Renders a trajectory file (see headless.py --trajectory) at a fixed simulated-time cadence to image files or a video, without opening a window.
+Needs PyOpenGL with Mesa's OSMesa, and ffmpeg for videos.
+
+    python export.py run.traj --cadence 86400 --frames frames/%05d.png --processes 8
+    python export.py run.traj --cadence 86400 --video run.mp4 --fps 30 --center 3 --bodyscale 20
+"""
+
+import argparse
+import sys
+import time
+
+from src import export
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a trajectory file to images or a video.")
+    parser.add_argument('trajectory', help="trajectory file")
+    parser.add_argument('--cadence', type=float, required=True, help="simulated time between frames (in s)")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--frames', help="image file pattern with the frame number, e.g. frames/%%05d.png (.ppm needs no Pillow)")
+    output.add_argument('--video', help="video file, encoded by ffmpeg")
+    parser.add_argument('--fps', type=float, default=30, help="video frame rate (default 30)")
+    parser.add_argument('--size', type=int, nargs=2, default=(900, 900), metavar=('WIDTH', 'HEIGHT'), help="frame size in pixels (default 900 900)")
+    parser.add_argument('--start', type=float, help="simulated time of the first frame (default: start of the trajectory)")
+    parser.add_argument('--end', type=float, help="simulated time of the last frame (default: end of the trajectory)")
+    parser.add_argument('--processes', type=int, help="rendering processes (default: all cores)")
+    parser.add_argument('--center', type=int, default=0, help="index of the body the camera looks at (default 0)")
+    parser.add_argument('--zoomout', type=float, help="camera distance from the centered body (in m)")
+    parser.add_argument('--unitscale', type=float, default=export.DEFAULTVIEW['unitscale'], help="meters per GL unit")
+    parser.add_argument('--bodyscale', type=float, default=1.0, help="scale factor of all bodies")
+    parser.add_argument('--focusscale', type=float, default=1.0, help="extra scale factor of the stars")
+    args = parser.parse_args(argv)
+
+    view = dict(centeredBodyIndex=args.center, zoomout=args.zoomout, unitscale=args.unitscale, bodyscale=args.bodyscale, focusscale=args.focusscale)
+    encoder = export.videoCommand(args.video, args.size, args.fps) if args.video != None else None
+
+    t = time.perf_counter()
+    frames = export.exportFrames(args.trajectory, args.cadence, pattern=args.frames, encoder=encoder, size=args.size, view=view,
+                                 start=args.start, end=args.end, processes=args.processes)
+    elapsed = time.perf_counter() - t
+    print("%d frames in %.1f s (%.1f frames/s)" % (frames, elapsed, frames / elapsed if elapsed > 0 else 0))
+    return frames
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit()
@@ -0,0 +1,113 @@
+"""
+Headless entry point for the program.
+Steps a demo system or a scene file with a fixed dt and reports the throughput, without opening a window (OpenGL is never imported).
+
+    python headless.py solar_system --dt 3600 --steps 10000 --integrator leapfrog
+    python headless.py resources/scenes/inner_solar_system.xml --dt 3600 --until 3.15e7
+    python headless.py --resume run.npz --dt 3600 --until 3.15e7 --checkpoint run.npz
+    python headless.py debris.xml --dt 600 --steps 100000 --collisions merge --softening 1e5
+"""
+
+import argparse
+import os
+import sys
+
+import demos
+from src import checkpoint
+from src import collisions
+from src import diagnostics
+from src import profiling
+from src import runner
+from src import trajectory
+from src.nbody import NBody
+
+
+def loadSystem(scene, engine=None, integrator=None):
+    # Builds an NBody from a demo name (with or without the "_sim" suffix) or a scene file path.
+    nBody = NBody(engine=engine, integrator=integrator)
+    name = scene[:-len('_sim')] if scene.endswith('_sim') else scene
+    if name in demos.SCENES:
+        return demos.SCENES[name](nBody)
+    if os.path.isfile(scene):
+        return runner.loadScene(scene, nBody)
+    raise ValueError("Unknown scene '%s'. Use a scene file or one of: %s." % (scene, ', '.join(demos.SCENES)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a simulation without rendering it.")
+    parser.add_argument('scene', nargs='?', help="demo name (%s) or scene file" % ', '.join(demos.SCENES))
+    parser.add_argument('--dt', type=float, required=True, help="fixed simulated timestep (in s)")
+    length = parser.add_mutually_exclusive_group(required=True)
+    length.add_argument('--steps', type=int, help="number of steps")
+    length.add_argument('--until', type=float, help="simulated end time (in s)")
+    parser.add_argument('--engine', help="force engine (array-backed), e.g. direct, barnes-hut, particle-mesh, p3m")
+    parser.add_argument('--integrator', help="integrator (array-backed), e.g. euler, leapfrog, yoshida4, yoshida6, rk4, hermite, block, wh")
+    parser.add_argument('--workers', type=int, help="worker processes for the direct force engine (array-backed)")
+    parser.add_argument('--trajectory', help="file to stream the trajectory to")
+    parser.add_argument('--every', type=int, default=1, help="steps between trajectory frames (default 1)")
+    parser.add_argument('--checkpoint', help="file to checkpoint the state to, periodically and at the end")
+    parser.add_argument('--checkpoint-every', type=int, default=1000, help="steps between checkpoints (default 1000)")
+    parser.add_argument('--resume', help="checkpoint file to resume from, instead of a scene")
+    parser.add_argument('--profile', action='store_true', help="report the time spent in each phase of the update")
+    parser.add_argument('--diagnostics', type=int, metavar='EVERY', help="sample the energy and momenta every EVERY steps and report their drift")
+    parser.add_argument('--collisions', choices=collisions.Collisions.POLICIES, help="merge touching bodies, or only log them (merges change the number of bodies, which trajectories do not allow)")
+    parser.add_argument('--encounter', type=float, default=0.0, help="also log passes closer than this distance (in m, with --collisions)")
+    parser.add_argument('--softening', type=float, help="Plummer softening length of the pair forces (in m)")
+    args = parser.parse_args(argv)
+
+    if args.resume != None:
+        nBody = checkpoint.loadCheckpoint(args.resume)
+        if args.engine != None:                 # switches the restored run to another engine or integrator
+            nBody.setEngine(args.engine)
+        if args.integrator != None:
+            nBody.setIntegrator(args.integrator)
+    elif args.scene != None:
+        nBody = loadSystem(args.scene, args.engine, args.integrator)
+    else:
+        parser.error("a scene or --resume is required")
+    if args.workers != None:
+        nBody.setWorkers(args.workers)
+    if args.profile:
+        nBody.setProfiler()
+    if args.softening != None:
+        nBody.setSoftening(args.softening)
+    if args.collisions != None:
+        nBody.setCollisions(args.collisions, encounter=args.encounter, log=lambda event: print(collisions.formatEvent(event)))
+
+    callbacks = []
+    sampler = None
+    if args.trajectory != None:
+        callbacks.append(trajectory.TrajectoryWriter(args.trajectory, nBody, every=args.every))
+        callbacks[-1].record(nBody)                         # initial conditions
+    if args.diagnostics != None:
+        sampler = diagnostics.Diagnostics(nBody, every=args.diagnostics)
+        callbacks.append(sampler)
+    if args.checkpoint != None:
+        callbacks.append(checkpoint.Checkpointer(args.checkpoint, every=args.checkpoint_every))
+
+    def callback(nBody, step):
+        for c in callbacks:
+            c(nBody, step)
+
+    try:
+        stats = runner.run(nBody, args.dt, steps=args.steps, until=args.until, callback=callback if callbacks else None)
+    finally:
+        for c in callbacks:
+            if hasattr(c, 'close'):
+                c.close()
+    if args.checkpoint != None:
+        checkpoint.saveCheckpoint(nBody, args.checkpoint)
+
+    print(runner.formatStats(stats))
+    if sampler != None:
+        print(diagnostics.formatReport(sampler.report()))
+    if args.profile:
+        print("phases: " + profiling.formatPhases(nBody.profiler.report(), order=('reset', 'forces', 'integration', 'rotation', 'collisions')))
+    if nBody.collisions != None:
+        print("%(merge)d merges, %(collision)d collisions, %(encounter)d encounters" % nBody.collisions.counts)
+    return stats
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit()
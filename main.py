@@ -5,7 +5,7 @@ Main file for the program.
 import demos
 
 def main():
-    sim = demos.earth_and_moon_sim()        # options are "earth_and_moon_sim", "solar_system_sim", "trappist_1_sim"
+    sim = demos.earth_and_moon_sim()        # options are "earth_and_moon_sim", "solar_system_sim", "asteroid_belt_sim", "trappist_1_sim"
     sim.main()
     sys.exit()
 
@@ -0,0 +1,173 @@
+"""
+Contains the NBody checkpoint and restore functions.
+A checkpoint is a NumPy .npz archive holding every Body field, the test particles, the simulated time, the softening and collision settings and the pickled force engine and integrator (without the caches they rebuild identically), so a restored run continues bit for bit like an uninterrupted one.
+Checkpoints contain pickled objects: only restore checkpoints from trusted sources.
+"""
+
+import os
+import pickle
+import tempfile
+import threading
+
+import numpy as np
+
+from . import nbody as nb
+from .vector import Vector
+
+
+VERSION = 1
+
+
+def checkpointData(nBody):
+    # Returns a consistent snapshot of nBody as a dict of arrays, ready to be written by writeCheckpoint.
+    bodies = nBody.bodies
+    data = dict()
+    data['version'] = np.array(VERSION)
+    data['time'] = np.array(nBody.time, dtype=np.float64)
+    data['arrays'] = np.array(nBody.state != None)
+    data['names'] = np.array([body.name for body in bodies], dtype=str)
+    data['types'] = np.array([str(body.body_type) for body in bodies], dtype=str)
+    data['obliquity'] = np.array([body.obliquity for body in bodies], dtype=np.float64)
+    data['softening'] = np.array(nBody.softening, dtype=np.float64)
+    if nBody.collisions != None:
+        data['collisions'] = np.array(nBody.collisions.policy)
+        data['encounter'] = np.array(nBody.collisions.encounter, dtype=np.float64)
+        data['large'] = np.array(nBody.collisions.large)
+
+    if nBody.state != None:
+        for field in nb.StateArrays.FIELDS:
+            data[field] = getattr(nBody.state, field).copy()
+        solver = pickle.dumps((nBody.engine, nBody.integrator), protocol=pickle.HIGHEST_PROTOCOL)
+        data['solver'] = np.frombuffer(solver, dtype=np.uint8)
+        data['caches'] = np.array(nBody.integrator.currentCaches(nBody), dtype=str)          # restored from the state, not stored twice
+        if nBody.particles != None:
+            data['particlepos'] = nBody.particles.pos.copy()
+            data['particlevel'] = nBody.particles.vel.copy()
+            data['particleacc'] = nBody.particles.acc.copy()
+    else:
+        for field in nb.StateArrays.VECTORS:
+            data[field] = np.array([[getattr(body, field).x, getattr(body, field).y, getattr(body, field).z] for body in bodies], dtype=np.float64).reshape(-1, 3)
+        for field in nb.StateArrays.SCALARS:
+            data[field] = np.array([getattr(body, field) for body in bodies], dtype=np.float64)
+    return data
+
+
+def writeCheckpoint(data, filepath):
+    # Writes a checkpoint snapshot atomically: to a temporary file in the same directory, which then replaces filepath.
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, temppath = tempfile.mkstemp(prefix='.checkpoint-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temppath, filepath)
+    except BaseException:
+        if os.path.exists(temppath):
+            os.remove(temppath)
+        raise
+
+
+def saveCheckpoint(nBody, filepath):
+    writeCheckpoint(checkpointData(nBody), filepath)
+
+
+def loadCheckpoint(filepath):
+    # Returns a new NBody restored from a checkpoint file.
+    with np.load(filepath, allow_pickle=False) as data:
+        if int(data['version']) > VERSION:
+            raise ValueError("Checkpoint version %d is newer than this program (%d)." % (int(data['version']), VERSION))
+
+        nBody = nb.NBody()
+        if bool(data['arrays']):
+            engine, integrator = pickle.loads(data['solver'].tobytes())
+            nBody.setEngine(engine)
+            nBody.setIntegrator(integrator)
+        if 'softening' in data and data['softening'].item():
+            nBody.setSoftening(data['softening'].item())
+        if 'collisions' in data:
+            nBody.setCollisions(data['collisions'].item(), encounter=data['encounter'].item(), large=data['large'].item())
+
+        vectors = {field: data[field].tolist() for field in nb.StateArrays.VECTORS}
+        scalars = {field: data[field].tolist() for field in nb.StateArrays.SCALARS}
+        for i, name in enumerate(data['names'].tolist()):
+            body_type = data['types'][i].item()
+            body = nb.Body(name, scalars['mass'][i], scalars['radius'][i], obliquity=data['obliquity'][i].item(), body_type=None if body_type == 'None' else body_type)
+            nBody.addBody(body(*[Vector(*vectors[field][i]) for field in nb.StateArrays.VECTORS], scalars['angle'][i], scalars['angular_velocity'][i]))
+
+        if 'particlepos' in data:
+            from .particles import TestParticles
+            nBody.addParticles(TestParticles(data['particlepos'], data['particlevel']))
+            nBody.particles.acc[:] = data['particleacc']
+        if 'caches' in data:
+            nBody.integrator.recache(nBody, data['caches'].tolist())
+        nBody.time = data['time'].item()
+    return nBody
+
+
+
+class Checkpointer:
+    """Periodic automatic checkpointing, usable as a runner callback. Every "every" steps the state is snapshotted in memory and written atomically by a background thread.
+    If a write is still in progress when the next snapshot is taken, only the newest pending snapshot is kept, so the physics loop never waits for the disk."""
+
+    def __init__(self, filepath, every=1000):
+        self.filepath = filepath
+        self.every = every
+        self.calls = 0
+        self.written = 0
+
+        self.pending = None
+        self.closing = False
+        self.error = None
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.writeLoop, daemon=True)
+        self.thread.start()
+
+
+    def __call__(self, nBody, step=None):
+        self.calls += 1
+        if self.calls % self.every == 0:
+            self.request(nBody)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def request(self, nBody):
+        # Snapshots nBody now and queues it for writing.
+        if self.error != None:
+            raise self.error
+        data = checkpointData(nBody)
+        with self.condition:
+            self.pending = data
+            self.condition.notify()
+
+
+    def writeLoop(self):
+        while True:
+            with self.condition:
+                while self.pending == None and not self.closing:
+                    self.condition.wait()
+                if self.pending == None:
+                    return
+                data, self.pending = self.pending, None
+            try:
+                writeCheckpoint(data, self.filepath)
+                self.written += 1
+            except Exception as e:
+                self.error = e
+
+
+    def close(self):
+        # Writes any pending snapshot and stops the writer thread.
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.thread.join()
+        if self.error != None:
+            raise self.error
@@ -0,0 +1,189 @@
+"""
+Contains the close-encounter and collision detection of an NBody.
+Bodies are binned in a spatial hash of uniform cells rebuilt every step in expected O(N): the cell of every body is hashed into a table of about 2N buckets,
+the bodies are grouped by bucket with a linear-time radix sort, and each body is only compared with the bodies of its own and the neighbouring cells.
+A Collisions policy attached with NBody.setCollisions checks the pairs after every update, and merges or only logs the bodies that touch or pass within an encounter distance.
+"""
+
+import numpy as np
+
+from .barneshut import raggedRange
+from .diagnostics import stateArrays
+
+
+PRIMES = np.array([73856093, 19349663, 83492791], dtype=np.int64)          # cell coordinate hash multipliers
+
+# Own cell and the 13 neighbouring cells "after" it, so that every pair of cells is visited once.
+OFFSETS = np.array([(0, 0, 0)] + [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) if (dx, dy, dz) > (0, 0, 0)], dtype=np.int64)
+
+
+class SpatialHash:
+    """A uniform grid of cubic cells of side "cellsize" over unbounded space, hashed into a power-of-two table of buckets (at least 2 per body).
+    Bodies of different cells that share a bucket are told apart by their cell coordinates, so hash collisions only cost time."""
+
+    def __init__(self, cellsize):
+        self.cellsize = cellsize
+        self.cells = None           # (N, 3) integer cell of every body
+        self.order = None           # body indices grouped by bucket
+        self.start = None           # first position of every bucket in order
+        self.count = None           # bodies in every bucket
+
+
+    def build(self, pos):
+        N = len(pos)
+        self.bits = max(1, (2 * N - 1).bit_length())
+        self.cells = np.floor(pos / self.cellsize).astype(np.int64)
+        buckets = self.bucket(self.cells)
+        self.count = np.bincount(buckets, minlength=1 << self.bits)
+        self.start = np.cumsum(self.count) - self.count
+        self.order = radixArgsort(buckets, self.bits)
+        return self
+
+
+    def bucket(self, cells):
+        h = cells[:, 0] * PRIMES[0] ^ cells[:, 1] * PRIMES[1] ^ cells[:, 2] * PRIMES[2]           # wraps around in int64
+        return h & ((1 << self.bits) - 1)
+
+
+    def candidates(self):
+        # Yields index arrays (i, j) of the unordered pairs of bodies in the same or adjacent cells, every pair once, one neighbouring cell offset at a time.
+        N = len(self.cells)
+        for k, offset in enumerate(OFFSETS):
+            neighbour = self.cells + offset
+            buckets = self.bucket(neighbour)
+            c = self.count[buckets]
+            i = np.repeat(np.arange(N), c)
+            j = self.order[raggedRange(self.start[buckets], c)]
+            keep = (self.cells[j] == neighbour[i]).all(axis=1)            # drops bodies of other cells hashed to the same bucket
+            if k == 0:
+                keep &= i < j
+            yield i[keep], j[keep]
+
+
+
+def radixArgsort(keys, bits):
+    # Stable argsort of non-negative integer keys below 2^bits in O(N), as passes over 16-bit digits (NumPy radix-sorts 16-bit keys).
+    order = np.arange(len(keys))
+    for shift in range(0, bits, 16):
+        digits = ((keys[order] >> shift) & 0xFFFF).astype(np.uint16)
+        order = order[np.argsort(digits, kind='stable')]
+    return order
+
+
+def closePairs(pos, radius, encounter=0.0, large=16):
+    # Returns index arrays (i, j) with i < j and the distances of the pairs of bodies closer than the sum of their radii or than "encounter" (in m).
+    # The cells are sized for the largest of the other bodies, and the "large" bodies of largest radius (e.g. the star and planets among debris) are checked against every body instead.
+    N = len(pos)
+    large = min(large, N)
+    big = np.argpartition(radius, N - large)[N - large:] if large > 0 else np.zeros(0, dtype=np.int64)
+    small = np.ones(N, dtype=bool)
+    small[big] = False
+    smallindex = np.flatnonzero(small)
+
+    pairs = []
+    for b in big:
+        j = np.flatnonzero(small | (np.arange(N) > b))             # pairs of two large bodies are taken once
+        pairs.append((np.full(len(j), b), j))
+
+    cellsize = max(encounter, 2 * radius[smallindex].max(initial=0.0))
+    if cellsize > 0 and len(smallindex) > 1:
+        grid = SpatialHash(cellsize).build(pos[smallindex])
+        pairs.extend((smallindex[i], smallindex[j]) for i, j in grid.candidates())
+
+    if not pairs:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    i, j = [np.concatenate(x) for x in zip(*pairs)]
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    d = pos[j] - pos[i]
+    distance = np.sqrt(np.einsum('ij,ij->i', d, d))
+    close = (distance < radius[i] + radius[j]) | (distance < encounter)
+    return i[close], j[close], distance[close]
+
+
+
+class Collisions:
+    """Close-encounter and collision handling of an NBody, applied after every update (see NBody.setCollisions) or called as a runner callback.
+    Bodies touch when they are closer than the sum of their radii. With policy 'merge' the lighter body of every touching pair is absorbed by the heavier one,
+    conserving mass, momentum and volume; with 'log' touching bodies are only recorded. Passes within "encounter" meters are recorded either way.
+    Every event is a dict appended to self.events (the latest "maxevents") and passed to "log" if it is given."""
+
+    POLICIES = ('merge', 'log')
+
+    def __init__(self, policy='merge', encounter=0.0, large=16, log=None, maxevents=10000):
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown collision policy '%s'. Options are: %s." % (policy, ', '.join(self.POLICIES)))
+        self.policy = policy
+        self.encounter = encounter
+        self.large = large
+        self.log = log
+        self.maxevents = maxevents
+        self.events = []
+        self.counts = dict(collision=0, encounter=0, merge=0)
+        self.active = dict()        # (body, body) -> 'collision' or 'encounter' for the close pairs of the last check, reported once per approach
+
+
+    def __call__(self, nBody, step=None):
+        # Checks the current state of an NBody and applies the policy. Returns the new events.
+        pos, vel, mass = stateArrays(nBody)
+        radius = nBody.state.radius if nBody.state != None else np.array([body.radius for body in nBody.bodies], dtype=float)
+        i, j, distance = closePairs(pos, radius, self.encounter, self.large)
+        touching = distance < radius[i] + radius[j]
+
+        events, merges, active, merged = [], [], dict(), set()
+        for k in np.argsort(distance):          # closest first, so that a body is merged with its nearest neighbour
+            a, b = nBody.bodies[i[k]], nBody.bodies[j[k]]
+            kind = 'collision' if touching[k] else 'encounter'
+            event = dict(time=nBody.time, kind=kind, bodies=(a.name, b.name), distance=float(distance[k]),
+                         speed=float(np.linalg.norm(vel[j[k]] - vel[i[k]])))
+            if kind == 'collision' and self.policy == 'merge':
+                if a in merged or b in merged:
+                    continue            # already merged this step, checked again after the next update
+                merged.update((a, b))
+                event['kind'] = 'merge'
+                merges.append((event, a, b))
+                continue
+            previous = self.active.get((a, b))
+            active[a, b] = kind if previous != 'collision' else previous
+            if previous == None or (previous, kind) == ('encounter', 'collision'):
+                events.append(event)
+        self.active = active
+
+        for event, a, b in merges:
+            survivor = self.merge(nBody, a, b)
+            event.update(survivor=survivor.name, mass=survivor.mass, radius=survivor.radius)
+            events.append(event)
+        for event in events:
+            self.record(event)
+        return events
+
+
+    def merge(self, nBody, a, b):
+        # Replaces two bodies by the heavier one with their total mass and momentum at their center of mass, and the radius of their total volume. Returns it.
+        survivor, absorbed = (a, b) if a.mass >= b.mass else (b, a)
+        mass = a.mass + b.mass
+        pos = (a.pos * a.mass + b.pos * b.mass) / mass
+        vel = (a.vel * a.mass + b.vel * b.mass) / mass
+        survivor.radius = (a.radius ** 3 + b.radius ** 3) ** (1 / 3)
+        survivor.mass = mass
+        survivor(pos, vel)
+        nBody.removeBody(absorbed)
+        return survivor
+
+
+    def record(self, event):
+        self.counts[event['kind']] += 1
+        self.events.append(event)
+        if len(self.events) > self.maxevents:
+            del self.events[0]
+        if self.log != None:
+            self.log(event)
+
+
+
+def formatEvent(event):
+    # "t = 12.0 d: merge Earth + Theia at 3.1e+06 m, 9.4e+03 m/s" (followed by the merged mass and radius).
+    text = "t = %.4g d: %s %s + %s at %.3g m, %.3g m/s" % (event['time'] / 86400, event['kind'], event['bodies'][0], event['bodies'][1], event['distance'], event['speed'])
+    if event['kind'] == 'merge':
+        text += " -> %s (%.4g kg, %.4g m)" % (event['survivor'], event['mass'], event['radius'])
+    return text
@@ -1,41 +1,153 @@
 """
 This local module handles xml parsing.
+The astronomical constants and body data are read into a Catalog once, on first access, from the package's resources directory (whatever the working directory).
+The parsed catalog is cached on disk (with marshal, which needs no import), and the cache is reused as long as the XML files are unchanged (same mtime and size, or else the same content hash).
 """
 
-import os 
+import marshal
+import os
 
-import xml.etree.cElementTree as ET
+
+RESOURCES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources')
+CONSTANTSPATH = os.path.join(RESOURCES, 'astronomical_constants.xml')
+DATAPATH = os.path.join(RESOURCES, 'astronomical_data.xml')
+CACHEVERSION = (2, marshal.version)
 
 
 def getXMLRoot(filepath):
+    import xml.etree.ElementTree as ET          # only needed when the cache is missing or stale
     return ET.parse(filepath).getroot()
 
 
-CONSTANTS = getXMLRoot(os.path.join('resources', 'astronomical_constants.xml'))
-DATA = getXMLRoot(os.path.join('resources', 'astronomical_data.xml'))
-
-
-def getConstantFromSymbol(symbol):
-    for constant in CONSTANTS.findall('c'):
-        if constant.find('symbol').text == symbol:
-            return float(constant.find('value').text) * 10 ** int(constant.find('value').get('order'))
-
-def getConstantFromName(name):
-    for constant in CONSTANTS.findall('c'):
-        if constant.find('name').text == name:
-            return float(constant.find('value').text) * 10 ** int(constant.find('value').get('order'))
-
-
-def getData(name):
+def defaultCachePath():
+    # $NBODY_CACHE, or catalog.cache in the user cache directory.
+    if os.environ.get('NBODY_CACHE'):
+        return os.environ['NBODY_CACHE']
+    directory = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(directory, 'nbody-simulation', 'catalog.cache')
+
+
+
+class Catalog:
+    """The astronomical constants, indexed by symbol and by name, and the body data, indexed by body name, parsed from the XML resources.
+    Nothing is read until the first lookup. cachepath=False disables the on-disk cache."""
+
+    def __init__(self, constantspath=CONSTANTSPATH, datapath=DATAPATH, cachepath=None):
+        self.constantspath = constantspath
+        self.datapath = datapath
+        self.cachepath = defaultCachePath() if cachepath == None else cachepath
+
+        self.loaded = False
+        self.fromcache = False
+        self.symbols = dict()       # symbol -> value (in SI units)
+        self.names = dict()         # name -> value (in SI units)
+        self.bodies = dict()        # body name -> dict of its data
+
+
+    def load(self):
+        if self.loaded:
+            return
+        sources = [fileSignature(self.constantspath), fileSignature(self.datapath)]
+        cached = self.readCache(sources)
+        if cached != None:
+            self.symbols, self.names, self.bodies = cached['symbols'], cached['names'], cached['bodies']
+            self.fromcache = True
+        else:
+            self.parse()
+            self.writeCache(sources)
+        self.loaded = True
+
+
+    def parse(self):
+        for constant in getXMLRoot(self.constantspath).findall('c'):
+            value = float(constant.find('value').text) * 10 ** int(constant.find('value').get('order'))
+            self.symbols.setdefault(constant.find('symbol').text, value)       # the first entry wins, as with a linear scan
+            self.names.setdefault(constant.find('name').text, value)
+
+        for element in getXMLRoot(self.datapath):
+            self.bodies.setdefault(element.tag, parseBody(element))
+
+
+    def readCache(self, sources):
+        # Returns the cached catalog if it was parsed from the same files, else None.
+        if not self.cachepath or not os.path.isfile(self.cachepath):
+            return None
+        try:
+            with open(self.cachepath, 'rb') as f:
+                cached = marshal.load(f)
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+        if not isinstance(cached, dict) or cached.get('version') != CACHEVERSION or len(cached.get('sources', [])) != len(sources):
+            return None
+
+        refresh = False
+        for old, new in zip(cached['sources'], sources):
+            if old['path'] != new['path']:
+                return None
+            if (old['mtime'], old['size']) != (new['mtime'], new['size']):
+                if old['sha1'] != fileHash(new['path']):        # touched but unchanged files keep the cache
+                    return None
+                refresh = True
+        if refresh:
+            self.symbols, self.names, self.bodies = cached['symbols'], cached['names'], cached['bodies']
+            self.writeCache(sources)
+        return cached
+
+
+    def writeCache(self, sources):
+        # Writes the catalog atomically; a cache that cannot be written is simply skipped.
+        if not self.cachepath:
+            return
+        import tempfile
+        cached = {'version': CACHEVERSION, 'sources': [dict(source, sha1=fileHash(source['path'])) for source in sources],
+                  'symbols': self.symbols, 'names': self.names, 'bodies': self.bodies}
+        try:
+            directory = os.path.dirname(os.path.abspath(self.cachepath))
+            os.makedirs(directory, exist_ok=True)
+            fd, temppath = tempfile.mkstemp(prefix='.catalog-', suffix='.tmp', dir=directory)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump(cached, f)
+            os.replace(temppath, self.cachepath)
+        except OSError:
+            if os.path.exists(temppath):
+                os.remove(temppath)
+
+
+    def constantFromSymbol(self, symbol):
+        self.load()
+        return self.symbols.get(symbol)
+
+
+    def constantFromName(self, name):
+        self.load()
+        return self.names.get(name)
+
+
+    def data(self, name):
+        # Returns a copy of the data of a body, so callers may modify it.
+        self.load()
+        if name not in self.bodies:
+            raise KeyError("No astronomical data for '%s'." % name)
+        return dict(self.bodies[name])
+
+
+    def __contains__(self, name):
+        self.load()
+        return name in self.bodies
+
+
+
+def parseBody(element):
+    # Returns the data of one body element: its type, and every numeric (in SI units) or text field of its data categories.
     d = dict()
-
-    element = DATA.find(name)
-
     d['type'] = element.find('type').text
 
     for category in ['physical_data', 'rotation_data', 'orbital_data']:
         subelement = element.find(category)
-        
+
         if subelement == None:    ## If one of the tags is missing
             continue
 
@@ -50,23 +162,58 @@ def getData(name):
                 d[child.tag] = float(text) * 10 ** int(o)
             except ValueError:                     ## If it is text
                 d[child.tag] = text
-    
+
     return d
 
-    
+
+def fileSignature(filepath):
+    stat = os.stat(filepath)
+    return {'path': os.path.abspath(filepath), 'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def fileHash(filepath):
+    import hashlib
+    with open(filepath, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+
+CATALOG = Catalog()
+
+
+def getConstantFromSymbol(symbol):
+    return CATALOG.constantFromSymbol(symbol)
+
+def getConstantFromName(name):
+    return CATALOG.constantFromName(name)
+
+
+def getData(name):
+    return CATALOG.data(name)
+
+
+def __getattr__(name):
+    # The raw XML roots of the resources, parsed only if something still asks for them.
+    if name == 'CONSTANTS':
+        return getXMLRoot(CONSTANTSPATH)
+    if name == 'DATA':
+        return getXMLRoot(DATAPATH)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
 
 
 if __name__ == '__main__':
     """ TESTS """
 
     print("Testing module . . .\n")
-    
-    Croot = getXMLRoot('data/astronomical_constants.xml')
+
+    Croot = getXMLRoot(CONSTANTSPATH)
     for constant in Croot.findall('c'):
         print("%s (%s) :  %s * 10^%s  %s" % (constant.find('name').text, constant.find('symbol').text, constant.find('value').text, constant.find('value').get('order'), constant.find('unit').text))
     print()
-    
-    Droot = getXMLRoot('data/astronomical_data.xml')
+
+    Droot = getXMLRoot(DATAPATH)
     for body in Droot:
         print(body.tag + ": ")
         for child in body.find('physical_data'):
@@ -76,4 +223,3 @@ if __name__ == '__main__':
                 print("   %s :  %s  %s" % (child.tag[0].upper() + child.tag[1:], child.text, child.get('unit')))
 
     print()
-
@@ -0,0 +1,239 @@
+"""
+Contains the conservation diagnostics of an NBody: total energy, linear and angular momentum, and the osculating orbital elements of every body.
+Diagnostics sampled along a run report the drift of each conserved quantity, to pick the largest dt and cheapest integrator that meet an energy-error budget.
+With the direct engine, the potential energy reuses the pair distances of the last force evaluation when it was at the current positions; otherwise it is computed in its own tiled pass.
+"""
+
+import math
+
+import numpy as np
+
+from . import nbody as nb
+from .lazy import lazyImport
+
+gravity = lazyImport(__package__ + '.gravity')          # only for G, loaded with the first diagnostics
+
+
+def stateArrays(nBody):
+    # Returns (pos, vel, mass) arrays of an NBody, gathering them from the bodies if it is not array-backed.
+    if nBody.state != None:
+        return nBody.state.pos, nBody.state.vel, nBody.state.mass
+    return (np.array([[b.pos.x, b.pos.y, b.pos.z] for b in nBody.bodies]).reshape(-1, 3),
+            np.array([[b.vel.x, b.vel.y, b.vel.z] for b in nBody.bodies]).reshape(-1, 3),
+            np.array([b.mass for b in nBody.bodies], dtype=float))
+
+
+def kineticEnergy(vel, mass):
+    return 0.5 * np.einsum('i,ik,ik->', mass, vel, vel)
+
+
+def potentialEnergy(pos, mass, maxpairs=2**20, softening=0.0):
+    # Gravitational potential energy, summed over row tiles of at most maxpairs pairs. Pair distances are Plummer-softened by "softening" (in m), like the forces.
+    N = len(pos)
+    rows = max(1, min(N, maxpairs // max(1, N)))
+    energy = 0.0
+    for start in range(0, N, rows):
+        stop = min(start + rows, N)
+        d = pos[np.newaxis, :, :] - pos[start:stop, np.newaxis, :]
+        r2 = np.einsum('ijk,ijk->ij', d, d)
+        if softening:
+            r2 += softening ** 2
+        r2[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        energy += mass[start:stop] @ (r2 ** -0.5 @ mass)
+    return -0.5 * gravity.G * energy
+
+
+def enginePotential(nBody):
+    # The potential energy from the potentials of the engine's last force evaluation, or None if they were not kept or not computed at the current positions.
+    engine = nBody.engine
+    if engine == None or getattr(engine, 'potential', None) is None:
+        return None
+    if engine.potentialpos.shape != nBody.state.pos.shape or not np.array_equal(engine.potentialpos, nBody.state.pos):
+        return None
+    return 0.5 * nBody.state.mass @ engine.potential
+
+
+def energy(nBody):
+    # Total (kinetic + potential) energy of an NBody.
+    pos, vel, mass = stateArrays(nBody)
+    potential = enginePotential(nBody) if nBody.state != None else None
+    if potential == None:
+        potential = potentialEnergy(pos, mass, softening=nBody.softening)
+    return kineticEnergy(vel, mass) + potential
+
+
+def momentum(vel, mass):
+    return mass @ vel
+
+
+def angularMomentum(pos, vel, mass):
+    # Total angular momentum about the origin.
+    return mass @ np.cross(pos, vel)
+
+
+def centralIndex(mass, central=None):
+    # The index of the central body: the given one, or the heaviest.
+    return int(np.argmax(mass)) if central == None else central
+
+
+def orbitalElements(pos, vel, mass, central=None):
+    # Osculating two-body elements of every body about the central body (the heaviest by default), each an (N,) array (NaN for the central body itself):
+    # semimajor axis a (m, negative for unbound orbits), eccentricity e, inclination i, longitude of the ascending node, argument of periapsis and true anomaly (rad, in [0, 2 pi)), and period (s, NaN if unbound).
+    # Angles are measured from the x axis in the xy reference plane; the node (or for circular orbits the periapsis) of orbits in that plane is taken on the x axis.
+    c = centralIndex(mass, central)
+    r = pos - pos[c]
+    v = vel - vel[c]
+    mu = gravity.G * (mass[c] + mass)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rnorm = np.linalg.norm(r, axis=1)
+        h = np.cross(r, v)
+        hnorm = np.linalg.norm(h, axis=1)
+        hhat = h / hnorm[:, np.newaxis]
+        rv = np.einsum('ij,ij->i', r, v)
+        v2 = np.einsum('ij,ij->i', v, v)
+
+        evec = ((v2 - mu / rnorm)[:, np.newaxis] * r - rv[:, np.newaxis] * v) / mu[:, np.newaxis]
+        e = np.linalg.norm(evec, axis=1)
+        specific = v2 / 2 - mu / rnorm
+        a = -mu / (2 * specific)
+        inclination = np.arccos(np.clip(hhat[:, 2], -1, 1))
+
+        node = np.stack([-h[:, 1], h[:, 0], np.zeros(len(h))], axis=1)           # z x h, towards the ascending node
+        nodenorm = np.linalg.norm(node, axis=1)
+        equatorial = nodenorm <= 1e-12 * hnorm
+        node[equatorial] = (1.0, 0.0, 0.0)
+        circular = e <= 1e-12
+        periapsis = np.where(circular[:, np.newaxis], node, evec)
+
+        ascending = np.where(equatorial, 0.0, np.arctan2(node[:, 1], node[:, 0]))
+        argument = angleBetween(node, periapsis, hhat)
+        anomaly = angleBetween(periapsis, r, hhat)
+        period = np.where(a > 0, 2 * np.pi * np.sqrt(np.abs(a) ** 3 / mu), np.nan)
+
+    elements = dict(a=a, e=e, i=inclination, ascendingnode=ascending, periapsis=argument, anomaly=anomaly, period=period)
+    for value in elements.values():
+        value[c] = np.nan
+    return elements
+
+
+def angleBetween(u, w, axis):
+    # The angle from u to w about "axis" (unit vectors normal to both), in [0, 2 pi).
+    angle = np.arctan2(np.einsum('ij,ij->i', axis, np.cross(u, w)), np.einsum('ij,ij->i', u, w))
+    return np.remainder(angle, 2 * np.pi)
+
+
+
+class Diagnostics:
+    """Conservation diagnostics of an NBody sampled every "every" calls (as a runner callback, or once per physics step), with the drift of each quantity since the first sample.
+    With the direct engine, the engine keeps the potentials of the force evaluation before each sample, so the energy needs no pair pass of its own when the integrator evaluated the forces at the final positions (e.g. leapfrog, yoshida4/6, rk4)."""
+
+    def __init__(self, nBody, every=1, elements=False, central=None, maxsamples=None):
+        self.every = every
+        self.elements = elements        # also sample the orbital elements
+        self.central = central
+        self.maxsamples = maxsamples    # samples kept (None for all); the initial values are always kept
+        self.calls = 0
+        self.reused = 0                 # samples whose potential came from the force pass
+
+        self.times, self.energies, self.momenta, self.angularmomenta, self.orbits = [], [], [], [], []
+        self.initial = None
+        self.scales = None              # sums of the per-body momentum and angular momentum magnitudes at the first sample
+        self.sample(nBody)
+        self.watchPotentials(nBody, every == 1)
+
+
+    def __call__(self, nBody, step=None):
+        # Runner callback: samples every "every"-th call, and has the engine keep potentials on the steps before a sample.
+        self.calls += 1
+        due = self.calls % self.every == 0
+        if due:
+            self.sample(nBody)
+        self.watchPotentials(nBody, (self.calls + 1) % self.every == 0)
+
+
+    def watchPotentials(self, nBody, enabled):
+        if nBody.engine != None and hasattr(nBody.engine, 'potentials'):
+            nBody.engine.potentials = enabled
+
+
+    def sample(self, nBody):
+        pos, vel, mass = stateArrays(nBody)
+        potential = enginePotential(nBody) if nBody.state != None else None
+        if potential == None:
+            potential = potentialEnergy(pos, mass, softening=nBody.softening)
+        else:
+            self.reused += 1
+
+        values = (nBody.time, kineticEnergy(vel, mass) + potential, momentum(vel, mass), angularMomentum(pos, vel, mass))
+        if self.initial == None:
+            self.initial = values
+            self.scales = (mass @ np.linalg.norm(vel, axis=1) or 1.0, mass @ np.linalg.norm(np.cross(pos, vel), axis=1) or 1.0)
+        for history, value in zip((self.times, self.energies, self.momenta, self.angularmomenta), values):
+            history.append(value)
+        if self.elements:
+            self.orbits.append(orbitalElements(pos, vel, mass, self.central))
+        if self.maxsamples != None and len(self.times) > self.maxsamples:
+            for history in (self.times, self.energies, self.momenta, self.angularmomenta, self.orbits):
+                if history:
+                    del history[0]
+
+
+    def energyErrors(self):
+        # Relative energy error of every sample, |E - E0| / |E0|.
+        return np.abs(np.array(self.energies) - self.initial[1]) / abs(self.initial[1])
+
+
+    def momentumErrors(self):
+        # Change of the total momentum and angular momentum, relative to the magnitude of their per-body terms at the first sample.
+        return [np.linalg.norm(np.array(history) - first, axis=1) / scale
+                for history, first, scale in ((self.momenta, self.initial[2], self.scales[0]), (self.angularmomenta, self.initial[3], self.scales[1]))]
+
+
+    def report(self):
+        # Drift summary: the latest and largest relative energy error, the secular energy drift (least-squares slope of the relative error, per simulated second),
+        # the largest relative momentum and angular momentum changes, and the number of samples.
+        errors = self.energyErrors()
+        signed = (np.array(self.energies) - self.initial[1]) / abs(self.initial[1])
+        times = np.array(self.times)
+        drift = np.polyfit(times - times[0], signed, 1)[0] if len(times) > 1 and times[-1] > times[0] else 0.0
+        momentumerror, angularerror = self.momentumErrors()
+        return dict(samples=len(self.times), time=float(times[-1] - self.initial[0]), energyerror=float(errors[-1]), maxenergyerror=float(errors.max()),
+                    energydrift=float(drift), momentumerror=float(momentumerror.max()), angularmomentumerror=float(angularerror.max()))
+
+
+    def elementDrift(self):
+        # Change of the semimajor axis and eccentricity of every body between the first and the latest kept samples, as (N,) arrays.
+        if len(self.orbits) < 2:
+            raise ValueError("Orbital elements are sampled with elements=True, at least twice.")
+        first, last = self.orbits[0], self.orbits[-1]
+        return dict(a=(last['a'] - first['a']) / first['a'], e=last['e'] - first['e'])
+
+
+
+def sweep(build, duration, deltatimes, integrators=('euler', 'leapfrog', 'yoshida4'), every=10):
+    # Runs a fresh system from build(nBody) (e.g. a demos scene builder) with every integrator and dt for "duration" simulated seconds.
+    # Returns one row per run: the integrator, dt, steps, force evaluations and wall time, with its drift report.
+    from . import runner
+
+    rows = []
+    for integrator in integrators:
+        for deltatime in deltatimes:
+            nBody = build(nb.NBody(integrator=integrator))
+            diagnostics = Diagnostics(nBody, every)
+            stats = runner.run(nBody, deltatime, steps=max(1, math.ceil(duration / deltatime - 1e-9)), callback=diagnostics)
+            row = dict(integrator=integrator, deltatime=deltatime, steps=stats['steps'], evaluations=nBody.integrator.evaluations, wall=stats['wall'])
+            row.update(diagnostics.report())
+            rows.append(row)
+    return rows
+
+
+def cheapest(rows, budget):
+    # The sweep row with the fewest force evaluations (then the least wall time) whose largest relative energy error is within budget, or None.
+    within = [row for row in rows if row['maxenergyerror'] <= budget]
+    return min(within, key=lambda row: (row['evaluations'], row['wall'])) if within else None
+
+
+def formatReport(report):
+    return "energy error %.3g (max %.3g, drift %.3g /s), momentum %.3g, angular momentum %.3g over %d samples" % (
+        report['energyerror'], report['maxenergyerror'], report['energydrift'], report['momentumerror'], report['angularmomentumerror'], report['samples'])
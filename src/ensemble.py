@@ -0,0 +1,249 @@
+"""
+Contains the ensemble mode, which steps many independent copies of the same system together.
+The state of M members with N bodies each is held in arrays with a leading ensemble axis, so every force evaluation covers all members in one vectorized call. Chunks of members can also be spread over a process pool.
+"""
+
+import concurrent.futures
+import copy
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from . import gravity
+from . import integrators
+from . import nbody as nb
+from .trajectory import stateOf
+from .vector import Vector
+
+
+# Kick-drift-kick weights of the symplectic integrators the ensemble supports (euler is kick-drift).
+COMPOSITIONS = {
+    'euler': None,
+    'leapfrog': (1,),
+    'verlet': (1,),
+    'yoshida4': integrators.Yoshida4.weights,
+    'yoshida6': integrators.Yoshida6.weights,
+}
+MEMBERFIELDS = ('pos', 'vel', 'mass', 'radius', 'angle', 'angular_velocity', 'initialenergy')
+
+
+class Ensemble:
+    """M independent copies (members) of a system of N bodies, stepped together. Positions and velocities are (M, N, 3) arrays, the other fields (M, N).
+    Members may differ in their initial conditions and masses, but they share the bodies' names, the time, the timestep and the Plummer softening length of the pair forces (see NBody.setSoftening)."""
+
+    def __init__(self, systems, integrator='leapfrog', maxpairs=2**20):
+        if integrator not in COMPOSITIONS:
+            raise ValueError("Unknown ensemble integrator '%s'. Options are: %s." % (integrator, ', '.join(COMPOSITIONS)))
+        if len(set(system.N for system in systems)) != 1:
+            raise ValueError("Every member of an ensemble needs the same number of bodies.")
+        if len(set(system.softening for system in systems)) != 1:
+            raise ValueError("Every member of an ensemble needs the same softening length.")
+
+        self.integrator = integrator
+        self.maxpairs = maxpairs
+        self.softening = systems[0].softening
+        self.M, self.N = len(systems), systems[0].N
+        self.time = systems[0].time
+        self.evaluations = 0
+        self.bodies = [dict(name=body.name, body_type=body.body_type, obliquity=body.obliquity) for body in systems[0].bodies]
+
+        states = [stateOf(system) for system in systems]
+        self.pos = np.array([state[0] for state in states], dtype=float).reshape(self.M, self.N, 3)
+        self.vel = np.array([state[1] for state in states], dtype=float).reshape(self.M, self.N, 3)
+        self.angle = np.array([state[2] for state in states], dtype=float).reshape(self.M, self.N)
+        for field in ['mass', 'radius', 'angular_velocity']:
+            setattr(self, field, np.array([[getattr(body, field) for body in system.bodies] for system in systems], dtype=float).reshape(self.M, self.N))
+
+        self.acc = None                 # accelerations at the current positions, None when they need evaluating
+        self.initialenergy = self.energy()
+
+
+    @classmethod
+    def perturbed(cls, nBody, M, scale=1e-6, seed=None, integrator='leapfrog', maxpairs=2**20):
+        # Returns an ensemble of M copies of nBody whose positions and velocities are scaled by independent random factors 1 + scale * N(0, 1).
+        # Member 0 is left unperturbed, as the reference.
+        rng = np.random.default_rng(seed)
+        ensemble = cls([nBody] * M, integrator, maxpairs)
+        ensemble.pos[1:] *= 1 + scale * rng.standard_normal(ensemble.pos[1:].shape)
+        ensemble.vel[1:] *= 1 + scale * rng.standard_normal(ensemble.vel[1:].shape)
+        ensemble.initialenergy = ensemble.energy()
+        return ensemble
+
+
+    def __len__(self):
+        return self.M
+
+
+    def accelerations(self):
+        if self.acc is None:
+            self.acc = batchedAccelerations(self.pos, self.mass, maxpairs=self.maxpairs, softening=self.softening)
+            self.evaluations += 1
+        return self.acc
+
+
+    def kick(self, deltatime):
+        self.vel += self.accelerations() * deltatime
+
+
+    def drift(self, deltatime):
+        self.pos += self.vel * deltatime
+        self.acc = None
+
+
+    def step(self, deltatime):
+        # Advances every member by deltatime, with the same update as the array-backed NBody integrator of that name.
+        weights = COMPOSITIONS[self.integrator]
+        if weights == None:
+            self.kick(deltatime)
+            self.drift(deltatime)
+        else:
+            for w in weights:
+                self.kick(w * deltatime / 2)
+                self.drift(w * deltatime)
+                self.kick(w * deltatime / 2)
+
+        self.angle += self.angular_velocity * deltatime
+        np.remainder(self.angle, 360, out=self.angle)
+        self.time += deltatime
+
+
+    def run(self, deltatime, steps, callback=None):
+        # Steps the ensemble "steps" times, calling callback(ensemble, step) after each step, and returns the final diagnostics.
+        for step in range(steps):
+            self.step(deltatime)
+            if callback != None:
+                callback(self, step)
+        return self.diagnostics()
+
+
+    def energy(self):
+        # Total (kinetic + potential) energy of every member, as an (M,) array.
+        kinetic = 0.5 * np.einsum('mi,mik,mik->m', self.mass, self.vel, self.vel)
+        return kinetic + batchedPotential(self.pos, self.mass, self.maxpairs, self.softening)
+
+
+    def momentum(self):
+        return np.einsum('mi,mik->mk', self.mass, self.vel)
+
+
+    def angularMomentum(self):
+        return np.einsum('mi,mik->mk', self.mass, np.cross(self.pos, self.vel))
+
+
+    def extent(self):
+        # Largest distance of a body from its member's centre of mass, (M,). Grows without bound when a body is ejected.
+        com = np.einsum('mi,mik->mk', self.mass, self.pos) / self.mass.sum(axis=1)[:, np.newaxis]
+        return np.linalg.norm(self.pos - com[:, np.newaxis, :], axis=2).max(axis=1)
+
+
+    def diagnostics(self):
+        # Per-member diagnostics, each an array with the ensemble axis first.
+        energy = self.energy()
+        results = dict()
+        results['energy'] = energy
+        results['energyerror'] = np.abs((energy - self.initialenergy) / self.initialenergy)
+        results['momentum'] = self.momentum()
+        results['angularmomentum'] = self.angularMomentum()
+        results['extent'] = self.extent()
+        return results
+
+
+    def members(self, indices):
+        # Returns a new ensemble made of the given members (an index array or slice).
+        ensemble = copy.copy(self)
+        for field in MEMBERFIELDS:
+            setattr(ensemble, field, getattr(self, field)[indices].copy())
+        ensemble.M = len(ensemble.mass)
+        ensemble.acc = None
+        return ensemble
+
+
+    def split(self, chunks):
+        return [self.members(indices) for indices in np.array_split(np.arange(self.M), chunks) if len(indices)]
+
+
+    @staticmethod
+    def concatenate(ensembles):
+        ensemble = copy.copy(ensembles[0])
+        for field in MEMBERFIELDS:
+            setattr(ensemble, field, np.concatenate([getattr(e, field) for e in ensembles]))
+        ensemble.M = len(ensemble.mass)
+        ensemble.acc = None
+        ensemble.evaluations = sum(e.evaluations for e in ensembles)
+        return ensemble
+
+
+    def toNBody(self, m):
+        # Returns member m as an array-backed NBody, e.g. to render or checkpoint it.
+        nBody = nb.NBody(integrator=self.integrator)
+        for i, description in enumerate(self.bodies):
+            body = nb.Body(description['name'], self.mass[m, i], self.radius[m, i], obliquity=description['obliquity'], body_type=description['body_type'])
+            nBody.addBody(body(Vector(*self.pos[m, i]), Vector(*self.vel[m, i]), angle=self.angle[m, i], angular_velocity=self.angular_velocity[m, i]))
+        nBody.time = self.time
+        nBody.setSoftening(self.softening)
+        return nBody
+
+
+
+def batchedAccelerations(pos, mass, out=None, maxpairs=2**20, softening=0.0):
+    # Direct-summation accelerations of every member: pos is (M, N, 3) and mass (M, N). Members are evaluated in groups holding at most maxpairs pair separations.
+    # Pair distances are Plummer-softened by "softening" (in m), as in gravity.tileAccelerations.
+    M, N = mass.shape
+    if out is None:
+        out = np.empty((M, N, 3))
+    group = max(1, min(M, maxpairs // max(1, N * N)))
+    diagonal = np.arange(N)
+    for start in range(0, M, group):
+        stop = min(start + group, M)
+        p = pos[start:stop]
+        d = p[:, np.newaxis, :, :] - p[:, :, np.newaxis, :]         # (m, N, N, 3) separations, d[m, i, j] = pos[m, j] - pos[m, i]
+        r2 = np.einsum('mijk,mijk->mij', d, d)
+        if softening:
+            r2 += softening ** 2
+        r2[:, diagonal, diagonal] = np.inf
+        inv3 = r2 ** -1.5
+        inv3 *= mass[start:stop, np.newaxis, :]
+        out[start:stop] = gravity.G * np.einsum('mij,mijk->mik', inv3, d)
+    return out
+
+
+def batchedPotential(pos, mass, maxpairs=2**20, softening=0.0):
+    # Gravitational potential energy of every member, (M,), softened like batchedAccelerations.
+    M, N = mass.shape
+    potential = np.empty(M)
+    group = max(1, min(M, maxpairs // max(1, N * N)))
+    diagonal = np.arange(N)
+    for start in range(0, M, group):
+        stop = min(start + group, M)
+        p = pos[start:stop]
+        d = p[:, np.newaxis, :, :] - p[:, :, np.newaxis, :]
+        r = np.sqrt(np.einsum('mijk,mijk->mij', d, d) + softening ** 2)
+        r[:, diagonal, diagonal] = np.inf
+        potential[start:stop] = -0.5 * gravity.G * np.einsum('mi,mij,mj->m', mass[start:stop], 1 / r, mass[start:stop])
+    return potential
+
+
+
+def runEnsemble(ensemble, deltatime, steps, processes=None, chunks=None):
+    # Steps an ensemble "steps" times, split in chunks of members over a pool of processes (all cores by default).
+    # Returns the stepped ensemble (the one given is left untouched) and its diagnostics. Each chunk is only sent to and from its worker once.
+    if processes == None:
+        processes = os.cpu_count()
+    if chunks == None:
+        chunks = processes
+    parts = ensemble.split(min(chunks, ensemble.M))
+
+    if processes <= 1 or len(parts) == 1:
+        results = [runChunk(part, deltatime, steps) for part in parts]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=mp.get_context('spawn')) as executor:
+            results = list(executor.map(runChunk, parts, [deltatime] * len(parts), [steps] * len(parts)))
+
+    stepped = Ensemble.concatenate(results)
+    return stepped, stepped.diagnostics()
+
+
+def runChunk(ensemble, deltatime, steps):
+    ensemble.run(deltatime, steps)
+    return ensemble
@@ -0,0 +1,188 @@
+"""
+Contains the offscreen frame exporter.
+A stored trajectory is rendered at a fixed simulated-time cadence, without a window, to numbered image files or to the input pipe of a video encoder.
+Frames are rendered in contiguous slices by a pool of processes, each with its own software (OSMesa) GL context, with the same camera and scaling as the interactive view.
+"""
+
+import concurrent.futures
+import multiprocessing as mp
+import os
+import subprocess
+
+import numpy as np
+
+from . import renderer
+from . import textures
+from .trajectory import Trajectory
+
+
+VIEWFIELDS = ('unitscale', 'bodyscale', 'focusscale', 'centeredBodyIndex', 'zoomout', 'fovy', 'znear', 'zfar')
+DEFAULTVIEW = dict(unitscale=400000000, bodyscale=1.0, focusscale=1.0, centeredBodyIndex=0, zoomout=None, fovy=45.0, znear=0.01, zfar=100000.0)
+
+
+def viewOf(sim):
+    # The camera and scaling settings of an AstrophysicsSimulation, to export with the view it is showing.
+    return {field: getattr(sim, field) for field in VIEWFIELDS if hasattr(sim, field)}
+
+
+def viewSettings(trajectory, view=None):
+    # Completes view settings with the defaults of the interactive view. Without a zoomout, the camera backs off 2.5 times the farthest initial distance from the centered body.
+    settings = dict(DEFAULTVIEW)
+    settings.update(view or dict())
+    if settings['zoomout'] == None:
+        pos = np.asarray(trajectory[0]['pos']) if len(trajectory) else np.zeros((1, 3))
+        settings['zoomout'] = 2.5 * max(np.linalg.norm(pos - pos[settings['centeredBodyIndex']], axis=1).max(), 1.0)
+    return settings
+
+
+def frameTimes(trajectory, cadence, start=None, end=None):
+    # The simulated times of the exported frames: every "cadence" seconds from start to end (the span of the trajectory by default).
+    if cadence <= 0:
+        raise ValueError("The cadence must be positive.")
+    start = trajectory.times[0] if start == None else start
+    end = trajectory.times[-1] if end == None else end
+    count = int(np.floor((end - start) / cadence * (1 + 1e-12))) + 1
+    return start + cadence * np.arange(max(count, 0))
+
+
+def videoCommand(filepath, size, fps=30):
+    # An ffmpeg command encoding raw RGB frames from its standard input (needs an even width and height for yuv420p).
+    return ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '%dx%d' % tuple(size), '-r', str(fps),
+            '-i', '-', '-pix_fmt', 'yuv420p', filepath]
+
+
+def writeImage(filepath, pixels):
+    # Writes (height, width, 3) uint8 pixels, as binary PPM for .ppm files (no dependency) or with Pillow for any other format.
+    if filepath.lower().endswith('.ppm'):
+        with open(filepath, 'wb') as f:
+            f.write(b'P6\n%d %d\n255\n' % (pixels.shape[1], pixels.shape[0]))
+            f.write(np.ascontiguousarray(pixels, dtype=np.uint8).tobytes())
+    else:
+        from PIL import Image
+        Image.fromarray(pixels).save(filepath)
+
+
+
+class FrameRenderer:
+    """Renders frames of a trajectory file into an offscreen context of its own, made current in this process.
+    The GL platform defaults to OSMesa; it must be chosen before OpenGL is first imported in the process."""
+
+    def __init__(self, filepath, size=(900, 900), view=None):
+        os.environ.setdefault('PYOPENGL_PLATFORM', 'osmesa')
+        from OpenGL import GL, GLU
+
+        self.trajectory = Trajectory(filepath)
+        self.view = viewSettings(self.trajectory, view)
+        self.width, self.height = size
+        bodies = self.trajectory.bodies
+        self.radius = np.array([body['radius'] for body in bodies], dtype=float)
+        self.obliquity = np.array([body['obliquity'] for body in bodies], dtype=float)
+        self.star = np.array([body['body_type'] == 'star' for body in bodies], dtype=bool)
+
+        self.context = renderer.OffscreenContext(self.width, self.height)
+        renderer.setupScene()
+        GL.glViewport(0, 0, self.width, self.height)
+        GL.glMatrixMode(GL.GL_PROJECTION)
+        GL.glLoadIdentity()
+        GLU.gluPerspective(self.view['fovy'], self.width / self.height, self.view['znear'], self.view['zfar'])
+        GL.glMatrixMode(GL.GL_MODELVIEW)
+
+        self.renderer = renderer.SphereRenderer()
+        self.renderer.setProjection(self.view['fovy'], self.width / self.height, self.view['znear'], self.view['zfar'], self.height)
+        self.renderer.create()
+
+        self.textures = textures.TextureManager()
+        self.bodytextures = [self.textures.texture(os.path.join(textures.MAPS, body['name'].lower() + '.jpg')) for body in bodies]     # Texture map convention
+        self.textures.wait()
+
+
+    def render(self, time):
+        # Returns the frame at a simulated time as (height, width, 3) uint8 pixels, top row first. Positions are interpolated between the stored frames.
+        from OpenGL import GL
+
+        view = self.view
+        pos = self.trajectory.positionsAt(time)
+        angle = self.trajectory.frameAt(time)['angle']
+        c = view['centeredBodyIndex'] if view['centeredBodyIndex'] < self.trajectory.N else 0
+        eye, radius = renderer.cameraView(pos, self.radius, self.star, c, view['unitscale'], view['bodyscale'], view['focusscale'], view['zoomout'])
+
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
+        GL.glLoadIdentity()
+        self.renderer.draw(eye, radius, angle, self.obliquity, self.bodytextures)
+        return self.context.pixels()
+
+
+    def close(self):
+        self.textures.close()
+        self.context.close()
+
+
+
+WORKER = None           # the FrameRenderer of a pool process
+
+
+def initWorker(filepath, size, view):
+    global WORKER
+    os.environ['PYOPENGL_PLATFORM'] = 'osmesa'
+    WORKER = FrameRenderer(filepath, size, view)
+
+
+def renderSlice(times, first, pattern=None, frames=None):
+    # Renders consecutive frames (numbered from "first") with the worker's renderer (or "frames"), and writes them to pattern % number.
+    # Returns the written paths, or the raw pixel bytes of the frames without a pattern.
+    frames = WORKER if frames == None else frames
+    results = []
+    for number, time in enumerate(times, first):
+        pixels = frames.render(time)
+        if pattern != None:
+            results.append(pattern % number)
+            writeImage(results[-1], pixels)
+        else:
+            results.append(pixels.tobytes())
+    return results
+
+
+def exportFrames(filepath, cadence, pattern=None, encoder=None, size=(900, 900), view=None, start=None, end=None, processes=None, slicesize=16):
+    # Renders a trajectory file every "cadence" simulated seconds, to image files named pattern % frame number (e.g. "frames/%05d.png"),
+    # or to the standard input of an encoder command (e.g. videoCommand("run.mp4", size)) as raw RGB frames in order. Returns the number of frames.
+    # Slices of "slicesize" frames are rendered by "processes" worker processes (all cores by default); at most two slices per worker are in flight.
+    if (pattern == None) == (encoder == None):
+        raise ValueError("Give either an image file pattern or an encoder command.")
+    times = frameTimes(Trajectory(filepath), cadence, start, end)
+    slices = [(times[i:i + slicesize], i) for i in range(0, len(times), slicesize)]
+    if processes == None:
+        processes = os.cpu_count()
+
+    if pattern != None and os.path.dirname(pattern):
+        os.makedirs(os.path.dirname(pattern), exist_ok=True)
+    pipe = subprocess.Popen(encoder, stdin=subprocess.PIPE) if encoder != None else None
+
+    def output(results):
+        if pipe != None:
+            for data in results:
+                pipe.stdin.write(data)
+
+    try:
+        if processes <= 1 or len(slices) <= 1:
+            frames = FrameRenderer(filepath, size, view)
+            try:
+                for part, first in slices:
+                    output(renderSlice(part, first, pattern, frames))
+            finally:
+                frames.close()
+        else:
+            context = mp.get_context('spawn')
+            with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=initWorker, initargs=(filepath, size, view)) as executor:
+                pending = []
+                for part, first in slices:
+                    pending.append(executor.submit(renderSlice, part, first, pattern))
+                    if len(pending) >= 2 * processes:
+                        output(pending.pop(0).result())         # in frame order, bounding the frames held in memory
+                for future in pending:
+                    output(future.result())
+    finally:
+        if pipe != None:
+            pipe.stdin.close()
+            if pipe.wait() != 0:
+                raise RuntimeError("The encoder exited with status %d." % pipe.returncode)
+    return len(times)
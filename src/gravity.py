@@ -0,0 +1,184 @@
+"""
+Contains the gravitational force engines used by array-backed NBody classes.
+Every engine takes (N, 3) positions and (N,) masses in SI units and returns (N, 3) accelerations.
+"""
+
+import numpy as np
+
+from . import data_parse as dp
+from .barneshut import BarnesHutEngine
+from .particlemesh import ParticleMeshEngine, P3MEngine
+
+
+G = dp.getConstantFromSymbol('G')
+PARALLELMIN = 256         # fewer bodies are always evaluated in-process, where a step is cheaper than the worker round trip
+
+
+class DirectEngine:
+    """Exact all-pairs (O(N^2)) gravity. The pairs are evaluated in row tiles so that no more than "maxpairs" pair separations are held in memory at once.
+    With more than one worker, the rows are split in balanced blocks across a pool of processes sharing the arrays (see parallel.WorkerPool).
+    While "potentials" is set, in-process evaluations also keep the potential of every body from the same pair distances (see diagnostics).
+    A nonzero "softening" length eps replaces 1/r^2 by the Plummer force r / (r^2 + eps^2)^(3/2), which stays finite for bodies that pass through each other."""
+
+    name = 'direct'
+    potentials = False
+    potential = None            # (N,) potentials (in J/kg) of the last evaluation, while potentials is set
+    potentialpos = None         # positions they were computed at
+
+    def __init__(self, maxpairs=2**20, workers=1, softening=0.0):
+        self.maxpairs = maxpairs
+        self.workers = workers
+        self.softening = softening
+        self.pool = None
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['pool'] = None            # processes are not pickled, a restored engine starts its own
+        state.pop('potential', None)    # nor the potentials, which the next evaluation computes again
+        state.pop('potentialpos', None)
+        return state
+
+
+    def setWorkers(self, workers):
+        # Number of processes the force sum is split across (1 evaluates it in this process).
+        if self.pool != None and self.pool.workers != workers:
+            self.pool.close()
+            self.pool = None
+        self.workers = workers
+
+
+    def workerPool(self, N):
+        # Returns the worker pool (started on first use), or None if N bodies are evaluated in this process.
+        if self.workers <= 1 or N < PARALLELMIN:
+            return None
+        if self.pool == None:
+            from .parallel import WorkerPool            # multiprocessing is only imported once workers are used
+            self.pool = WorkerPool(self.workers)
+        return self.pool
+
+
+    def accelerations(self, pos, mass, out=None):
+        N = len(pos)
+        if out is None:
+            out = np.empty((N, 3))
+        self.potential = self.potentialpos = None
+        if N == 0:
+            return out
+        if self.workerPool(N) != None:
+            return self.pool.accelerations(pos, mass, out, self.maxpairs, self.softening)
+
+        potential = np.empty(N) if self.potentials else None
+        rows = max(1, min(N, self.maxpairs // N))       # tile height, bounds the (rows, N, 3) temporary
+        for start in range(0, N, rows):
+            stop = min(start + rows, N)
+            out[start:stop] = tileAccelerations(pos[start:stop], pos, mass, np.arange(start, stop),
+                                                 None if potential is None else potential[start:stop], self.softening)
+        if potential is not None:
+            self.potential, self.potentialpos = potential, pos.copy()
+        return out
+
+
+    def accelerationsAndJerks(self, pos, vel, mass, out=None, jerk=None, targets=None):
+        # Also returns the jerks (time derivatives of the accelerations), for Hermite and block-timestep integrators.
+        # If "targets" (an index array) is given, only the rows of those bodies are computed, still due to every body.
+        N = len(pos)
+        if targets is None:
+            targets = np.arange(N)
+        M = len(targets)
+        if out is None:
+            out = np.empty((M, 3))
+        if jerk is None:
+            jerk = np.empty((M, 3))
+        if M == 0:
+            return out, jerk
+        if self.workerPool(N) != None:
+            return self.pool.accelerationsAndJerks(pos, vel, mass, targets, out, jerk, self.maxpairs, self.softening)
+
+        rows = max(1, min(M, self.maxpairs // N))
+        for start in range(0, M, rows):
+            stop = min(start + rows, M)
+            rowtargets = targets[start:stop]
+            out[start:stop], jerk[start:stop] = tileAccelerationsAndJerks(pos[rowtargets], vel[rowtargets], pos, vel, mass, rowtargets, self.softening)
+        return out, jerk
+
+
+
+def tileAccelerations(targets, pos, mass, exclude=None, potential=None, softening=0.0):
+    # Returns the accelerations of the "targets" positions due to every body in (pos, mass). If the targets are the rows pos[exclude], their self-interaction is skipped.
+    # If a potential array is given, the potentials of the targets are written to it as well. Pair distances are Plummer-softened by "softening" (in m).
+    d = pos[np.newaxis, :, :] - targets[:, np.newaxis, :]           # (T, N, 3) separation vectors
+    r2 = np.einsum('ijk,ijk->ij', d, d)
+    if softening:
+        r2 += softening ** 2
+    if exclude is not None:
+        r2[np.arange(len(targets)), exclude] = np.inf
+    if potential is not None:
+        potential[:] = -G * (r2 ** -0.5 @ mass)
+    inv3 = r2 ** -1.5
+    inv3 *= mass
+    return G * np.einsum('ij,ijk->ik', inv3, d)
+
+
+def fieldAccelerations(targets, pos, mass, softening=0.0, maxpairs=2**20, out=None):
+    # Returns the accelerations of M "targets" positions (e.g. massless test particles) due to the N bodies (pos, mass), in O(M N).
+    # With fewer bodies than targets (e.g. the planets of a belt of asteroids) the sum runs over the bodies one at a time, each a pass over every target,
+    # which keeps the temporaries at (M, 3); otherwise it is evaluated in row tiles of at most "maxpairs" pairs.
+    M, N = len(targets), len(pos)
+    if out is None:
+        out = np.empty((M, 3))
+    out[:] = 0
+    if N == 0 or M == 0:
+        return out
+    if N < M:
+        d, r2 = np.empty((M, 3)), np.empty(M)
+        for j in range(N):
+            np.subtract(pos[j], targets, out=d)
+            np.einsum('ij,ij->i', d, d, out=r2)
+            if softening:
+                r2 += softening ** 2
+            r2 **= -1.5
+            r2 *= G * mass[j]
+            d *= r2[:, np.newaxis]
+            out += d
+        return out
+    rows = max(1, maxpairs // N)
+    for start in range(0, M, rows):
+        stop = min(start + rows, M)
+        out[start:stop] = tileAccelerations(targets[start:stop], pos, mass, softening=softening)
+    return out
+
+
+def tileAccelerationsAndJerks(targets, targetvel, pos, vel, mass, exclude=None, softening=0.0):
+    # Like tileAccelerations, also returning the jerks of the targets.
+    d = pos[np.newaxis, :, :] - targets[:, np.newaxis, :]
+    dv = vel[np.newaxis, :, :] - targetvel[:, np.newaxis, :]
+    r2 = np.einsum('ijk,ijk->ij', d, d)
+    if softening:
+        r2 += softening ** 2
+    if exclude is not None:
+        r2[np.arange(len(targets)), exclude] = np.inf
+    inv3 = r2 ** -1.5
+    inv3 *= mass
+    rv = 3 * np.einsum('ijk,ijk->ij', d, dv) / r2 * inv3
+    acc = G * np.einsum('ij,ijk->ik', inv3, d)
+    jerk = G * (np.einsum('ij,ijk->ik', inv3, dv) - np.einsum('ij,ijk->ik', rv, d))
+    return acc, jerk
+
+
+
+ENGINES = {
+    'direct': DirectEngine,
+    'barnes-hut': BarnesHutEngine,
+    'particle-mesh': ParticleMeshEngine,
+    'p3m': P3MEngine,
+}
+
+
+def getEngine(engine, **options):
+    # Returns an engine instance from either an engine name or an existing engine.
+    if isinstance(engine, str):
+        if engine not in ENGINES:
+            raise ValueError("Unknown force engine '%s'. Options are: %s." % (engine, ', '.join(ENGINES)))
+        return ENGINES[engine](**options)
+    return engine
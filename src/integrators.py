@@ -0,0 +1,517 @@
+"""
+Contains the time integrators used by array-backed NBody classes.
+An integrator advances the positions and velocities of the NBody state arrays by one step, evaluating the force engine as few times as it can.
+"""
+
+import time
+
+import numpy as np
+
+from . import data_parse as dp
+from .diagnostics import centralIndex
+from .gravity import fieldAccelerations
+from .kepler import keplerDrift
+
+
+G = dp.getConstantFromSymbol('G')
+
+
+class Integrator:
+    """Base integrator class. Accelerations are only re-evaluated when the positions or masses have changed since the last evaluation, so a step can reuse the forces computed at the end of the previous one.
+    Integrators built on kick and drift also advance the NBody's test particles, with the same kicks and drifts as the bodies (see testparticles)."""
+
+    name = None
+    order = None
+    needsjerk = False
+    testparticles = True        # whether step advances nBody.particles
+    CACHES = ('cached', 'particlecached')          # caches holding copies of the NBody state, which are not pickled (see currentCaches)
+
+    def __init__(self):
+        self.evaluations = 0        # force evaluations so far
+        self.cached = None          # (pos, mass, acc) of the last force evaluation
+        self.particlecached = None  # (pos, mass, particle pos, particle acc) of the last test particle force evaluation
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.CACHES:
+            state[name] = None
+        return state
+
+
+    def reset(self):
+        # Forgets the cached forces and any other state carried from one step to the next, keeping the options.
+        self.cached = None
+        self.particlecached = None
+
+
+    def currentCaches(self, nBody):
+        # The names of the caches that describe the current state of nBody, which recache restores from the state alone (e.g. after a checkpoint).
+        state, particles = nBody.state, nBody.particles
+        names = ['cached'] if self.isCached(state) else []
+        if particles != None and self.isParticleCached(state, particles):
+            names.append('particlecached')
+        return names
+
+
+    def recache(self, nBody, names):
+        if 'cached' in names:
+            self.cache(nBody.state)
+        if 'particlecached' in names:
+            self.cacheParticles(nBody.state, nBody.particles)
+
+
+    def step(self, nBody, deltatime):
+        raise NotImplementedError
+
+
+    def accelerations(self, nBody):
+        # Makes sure state.acc holds the accelerations at the current positions and returns it.
+        state = nBody.state
+        if not self.isCached(state):
+            start = time.perf_counter()
+            nBody.engine.accelerations(state.pos, state.mass, out=state.acc)
+            profiler = nBody.profiler           # read once, another thread can clear it while stepping
+            if profiler != None:
+                profiler.add('forces', time.perf_counter() - start, nested=True)
+            self.evaluations += 1
+            self.cache(state)
+        return state.acc
+
+
+    def isCached(self, state):
+        if self.cached is None:
+            return False
+        pos, mass, acc = self.cached
+        return pos.shape == state.pos.shape and np.array_equal(pos, state.pos) and np.array_equal(mass, state.mass) and np.array_equal(acc, state.acc)
+
+
+    def cache(self, state):
+        self.cached = (state.pos.copy(), state.mass.copy(), state.acc.copy())
+
+
+    def particleAccelerations(self, nBody):
+        # Makes sure particles.acc holds the accelerations of the test particles due to the bodies at their current positions, and returns it.
+        state, particles = nBody.state, nBody.particles
+        if not self.isParticleCached(state, particles):
+            start = time.perf_counter()
+            fieldAccelerations(particles.pos, state.pos, state.mass, nBody.softening, out=particles.acc)
+            profiler = nBody.profiler
+            if profiler != None:
+                profiler.add('forces', time.perf_counter() - start, nested=True)
+            self.cacheParticles(state, particles)
+        return particles.acc
+
+
+    def cacheParticles(self, state, particles):
+        self.particlecached = (state.pos.copy(), state.mass.copy(), particles.pos.copy(), particles.acc.copy())
+
+
+    def isParticleCached(self, state, particles):
+        if self.particlecached is None:
+            return False
+        pos, mass, particlepos, particleacc = self.particlecached
+        return (pos.shape == state.pos.shape and particlepos.shape == particles.pos.shape and np.array_equal(pos, state.pos) and np.array_equal(mass, state.mass)
+                and np.array_equal(particlepos, particles.pos) and np.array_equal(particleacc, particles.acc))
+
+
+    def kick(self, nBody, deltatime):
+        nBody.state.vel += self.accelerations(nBody) * deltatime
+        if nBody.particles != None:
+            nBody.particles.vel += self.particleAccelerations(nBody) * deltatime
+
+
+    def drift(self, nBody, deltatime):
+        nBody.state.pos += nBody.state.vel * deltatime
+        if nBody.particles != None:
+            nBody.particles.pos += nBody.particles.vel * deltatime
+
+
+
+class Euler(Integrator):
+    """First-order semi-implicit (symplectic) Euler, as in Body.updateMotion. One force evaluation per step."""
+
+    name = 'euler'
+    order = 1
+
+    def step(self, nBody, deltatime):
+        self.kick(nBody, deltatime)
+        self.drift(nBody, deltatime)
+
+
+
+class Leapfrog(Integrator):
+    """Second-order kick-drift-kick leapfrog (velocity Verlet). One force evaluation per step, as the closing kick's accelerations open the next step."""
+
+    name = 'leapfrog'
+    order = 2
+
+    def step(self, nBody, deltatime):
+        self.kick(nBody, deltatime / 2)
+        self.drift(nBody, deltatime)
+        self.kick(nBody, deltatime / 2)
+
+
+
+class Composition(Leapfrog):
+    """A symmetric composition of leapfrog substeps of deltatime * w for each weight w. Consecutive half kicks share one force evaluation, so a step costs len(weights) evaluations."""
+
+    weights = ()
+
+    def step(self, nBody, deltatime):
+        for w in self.weights:
+            Leapfrog.step(self, nBody, w * deltatime)
+
+
+
+class Yoshida4(Composition):
+    """Fourth-order Yoshida (Forest-Ruth) composition. Three force evaluations per step."""
+
+    name = 'yoshida4'
+    order = 4
+    weights = (1 / (2 - 2 ** (1 / 3)), -2 ** (1 / 3) / (2 - 2 ** (1 / 3)), 1 / (2 - 2 ** (1 / 3)))
+
+
+
+class Yoshida6(Composition):
+    """Sixth-order Yoshida composition (solution A of Yoshida 1990). Seven force evaluations per step."""
+
+    name = 'yoshida6'
+    order = 6
+    w1, w2, w3 = -1.17767998417887, 0.235573213359357, 0.784513610477560
+    weights = (w3, w2, w1, 1 - 2 * (w1 + w2 + w3), w1, w2, w3)
+
+
+
+class RK4(Integrator):
+    """Classical fourth-order Runge-Kutta. Four force evaluations per step. Not symplectic, so its energy error grows steadily over long runs."""
+
+    name = 'rk4'
+    order = 4
+    testparticles = False
+
+    def step(self, nBody, deltatime):
+        state = nBody.state
+        x0, v0 = state.pos.copy(), state.vel.copy()
+        h = deltatime
+
+        a1 = self.accelerations(nBody).copy()
+        v1 = v0
+        state.pos[:] = x0 + 0.5 * h * v1
+        a2 = self.accelerations(nBody).copy()
+        v2 = v0 + 0.5 * h * a1
+        state.pos[:] = x0 + 0.5 * h * v2
+        a3 = self.accelerations(nBody).copy()
+        v3 = v0 + 0.5 * h * a2
+        state.pos[:] = x0 + h * v3
+        a4 = self.accelerations(nBody).copy()
+        v4 = v0 + h * a3
+
+        state.pos[:] = x0 + h / 6 * (v1 + 2 * v2 + 2 * v3 + v4)
+        state.vel[:] = v0 + h / 6 * (a1 + 2 * a2 + 2 * a3 + a4)
+
+
+
+class Hermite(Integrator):
+    """Fourth-order Hermite predictor-corrector. One acceleration and jerk evaluation per step; the engine must provide accelerationsAndJerks (e.g. 'direct')."""
+
+    name = 'hermite'
+    order = 4
+    testparticles = False
+    needsjerk = True
+
+    def __init__(self):
+        Integrator.__init__(self)
+        self.jerk = None
+
+
+    def reset(self):
+        Integrator.reset(self)
+        self.jerk = None
+
+
+    def accelerationsAndJerks(self, nBody, pos, vel, targets=None):
+        if not hasattr(nBody.engine, 'accelerationsAndJerks'):
+            raise ValueError("The %s integrator needs a force engine that computes jerks, such as 'direct'." % self.name)
+        self.evaluations += 1
+        start = time.perf_counter()
+        result = nBody.engine.accelerationsAndJerks(pos, vel, nBody.state.mass, targets=targets)
+        profiler = nBody.profiler
+        if profiler != None:
+            profiler.add('forces', time.perf_counter() - start, nested=True)
+        return result
+
+
+    def step(self, nBody, deltatime):
+        state = nBody.state
+        h = deltatime
+
+        if self.jerk is None or not self.isCached(state) or len(self.jerk) != len(state.pos):
+            state.acc[:], self.jerk = self.accelerationsAndJerks(nBody, state.pos, state.vel)
+        a0, j0 = state.acc.copy(), self.jerk
+
+        # Predict
+        xp = state.pos + h * state.vel + h ** 2 / 2 * a0 + h ** 3 / 6 * j0
+        vp = state.vel + h * a0 + h ** 2 / 2 * j0
+
+        # Evaluate and correct
+        a1, j1 = self.accelerationsAndJerks(nBody, xp, vp)
+        v1 = state.vel + h / 2 * (a0 + a1) + h ** 2 / 12 * (j0 - j1)
+        state.pos += h / 2 * (state.vel + v1) + h ** 2 / 12 * (a0 - a1)
+        state.vel[:] = v1
+
+        # The corrected positions differ slightly from the predicted ones the forces were evaluated at, which the Hermite scheme accepts.
+        state.acc[:] = a1
+        self.jerk = j1
+        self.cache(state)
+
+
+
+class BlockHermite(Hermite):
+    """Fourth-order Hermite with hierarchical (power-of-two) individual timesteps.
+    Each call to step advances every body by deltatime, in substeps of deltatime / 2^level chosen per body from the criterion dt = eta * |a| / |jerk|.
+    Only the bodies whose block is due are corrected and force-evaluated; the others are predicted to the block time.
+    A negative deltatime integrates backwards in time with the same blocks as |deltatime|."""
+
+    name = 'block'
+
+    def __init__(self, eta=0.02, maxlevel=20):
+        Hermite.__init__(self)
+        self.eta = eta
+        self.maxlevel = maxlevel
+
+        self.levels = None              # block level of every body at the end of the last step
+        self.blocks = 0                 # block substeps taken
+        self.bodyevaluations = 0        # per-body force evaluations done
+        self.sharedevaluations = 0      # per-body force evaluations a shared step at the smallest dt used would have done
+
+
+    def reset(self):
+        Hermite.reset(self)
+        self.levels = None
+
+
+    def step(self, nBody, deltatime):
+        state = nBody.state
+        N = len(state.pos)
+        if deltatime == 0:
+            return
+        if self.jerk is None or not self.isCached(state) or len(self.jerk) != N:
+            state.acc[:], self.jerk = self.accelerationsAndJerks(nBody, state.pos, state.vel)
+        x, v, a, j = state.pos, state.vel, state.acc, self.jerk
+
+        # Times are counted in integer ticks of deltatime / 2^maxlevel so that the blocks line up exactly.
+        ticks = 2 ** self.maxlevel
+        tick = deltatime / ticks
+        levels = self.timestepLevels(a, j, abs(deltatime))
+        steps = ticks >> levels
+        last = np.zeros(N, dtype=np.int64)          # tick of each body's last correction
+        finest = levels.max(initial=0)
+
+        now = 0
+        while now < ticks:
+            now = (last + steps).min()
+            active = np.flatnonzero(last + steps == now)
+
+            # Predict every body to the block time, then evaluate and correct the active ones.
+            dt = ((now - last) * tick)[:, np.newaxis]
+            xp = x + dt * v + dt ** 2 / 2 * a + dt ** 3 / 6 * j
+            vp = v + dt * a + dt ** 2 / 2 * j
+            a1, j1 = self.accelerationsAndJerks(nBody, xp, vp, targets=active)
+
+            h = (steps[active] * tick)[:, np.newaxis]
+            a0, j0, v0 = a[active], j[active], v[active]
+            v1 = v0 + h / 2 * (a0 + a1) + h ** 2 / 12 * (j0 - j1)
+            x[active] += h / 2 * (v0 + v1) + h ** 2 / 12 * (a0 - a1)
+            v[active] = v1
+            a[active] = a1
+            j[active] = j1
+            last[active] = now
+
+            # A body may move to a smaller block at any time, but only to the next larger one when the current time is a multiple of it.
+            current = levels[active]
+            wanted = self.timestepLevels(a1, j1, abs(deltatime))
+            aligned = now % (2 * steps[active]) == 0
+            levels[active] = np.where(wanted > current, wanted, np.where((wanted < current) & aligned, current - 1, current))
+            steps[active] = ticks >> levels[active]
+            finest = max(finest, levels[active].max())
+
+            self.blocks += 1
+            self.bodyevaluations += len(active)
+
+        self.levels = levels
+        self.sharedevaluations += N * 2 ** int(finest)
+        self.cache(state)
+
+
+    def timestepLevels(self, acc, jerk, deltatime):
+        # Returns the block level of each body: the smallest L with deltatime / 2^L below its timestep criterion (deltatime > 0).
+        a = np.linalg.norm(acc, axis=1)
+        j = np.linalg.norm(jerk, axis=1)
+        dt = np.full(len(a), np.inf)
+        np.divide(self.eta * a, j, out=dt, where=j > 0)
+        with np.errstate(divide='ignore'):
+            levels = np.ceil(np.log2(deltatime / dt))
+        return np.clip(levels, 0, self.maxlevel).astype(np.int64)
+
+
+    def savings(self):
+        # Returns (per-body force evaluations done, evaluations a shared timestep would have needed, fraction saved).
+        if self.sharedevaluations == 0:
+            return 0, 0, 0.0
+        return int(self.bodyevaluations), int(self.sharedevaluations), 1 - self.bodyevaluations / self.sharedevaluations
+
+
+
+class WisdomHolman(Integrator):
+    """Second-order Wisdom-Holman mixed-variable symplectic integrator, for systems dominated by one central body such as a star and its planets.
+    In democratic heliocentric coordinates (Duncan, Levison & Lee 1998) a step is half an interaction kick, half a jump (the reflex motion of the central body),
+    an analytic Kepler drift of every other body about the central body, and the jump and kick again. Only the forces between the other bodies go through the engine,
+    once per step, so dt can be a sizable fraction (about 1/20) of the shortest orbital period. state.acc is not kept up to date.
+    The central body is the body "central" (an index) if it is given, else the body that most others have as parent in the astronomical data, else the heaviest."""
+
+    name = 'wh'
+    order = 2
+    CACHES = Integrator.CACHES + ('written',)
+
+    def __init__(self, central=None):
+        Integrator.__init__(self)
+        self.central = central
+        self.coordinates = None     # (central, others, Q, P, center, velocity, acc) in democratic heliocentric coordinates, at the end of the last step
+        self.written = None         # (pos, vel, mass, particle pos, particle vel) at the end of the last step, while the coordinates still describe them
+
+
+    def reset(self):
+        Integrator.reset(self)
+        self.coordinates = None
+        self.written = None
+
+
+    def currentCaches(self, nBody):
+        return Integrator.currentCaches(self, nBody) + (['written'] if self.isCurrent(nBody) else [])
+
+
+    def recache(self, nBody, names):
+        Integrator.recache(self, nBody, names)
+        if 'written' in names:
+            self.write(nBody)
+
+
+    def write(self, nBody):
+        # Remembers the state the coordinates describe.
+        state, particles = nBody.state, nBody.particles
+        if particles != None:
+            self.written = (state.pos.copy(), state.vel.copy(), state.mass.copy(), particles.pos.copy(), particles.vel.copy())
+        else:
+            self.written = (state.pos.copy(), state.vel.copy(), state.mass.copy(), None, None)
+
+
+    def centralIndex(self, nBody):
+        if self.central != None:
+            return self.central
+        names = [body.name for body in nBody.bodies]
+        parents = [dp.getData(name).get('parent') for name in names if name in dp.CATALOG]
+        counts = [parents.count(name) for name in names]
+        if max(counts, default=0) > 0:
+            return counts.index(max(counts))
+        return centralIndex(nBody.state.mass)
+
+
+    def democratic(self, nBody):
+        # Positions relative to the central body (Q) and barycentric velocities (P) of the other bodies, followed by the test particles, with the barycenter's position and velocity.
+        state, particles = nBody.state, nBody.particles
+        c = self.centralIndex(nBody)
+        others = np.delete(np.arange(state.N), c)
+        total = state.mass.sum()
+        center, velocity = state.mass @ state.pos / total, state.mass @ state.vel / total
+        pos, vel = state.pos[others], state.vel[others]
+        if particles != None:
+            pos, vel = np.concatenate([pos, particles.pos]), np.concatenate([vel, particles.vel])
+        return c, others, pos - state.pos[c], vel - velocity, center, velocity, None
+
+
+    def isCurrent(self, nBody):
+        if self.written is None:
+            return False
+        state, particles = nBody.state, nBody.particles
+        pos, vel, mass, particlepos, particlevel = self.written
+        if pos.shape != state.pos.shape or (particles == None) != (particlepos is None):
+            return False
+        if particles != None and not (particlepos.shape == particles.pos.shape and np.array_equal(particlepos, particles.pos) and np.array_equal(particlevel, particles.vel)):
+            return False
+        return np.array_equal(pos, state.pos) and np.array_equal(vel, state.vel) and np.array_equal(mass, state.mass)
+
+
+    def interactions(self, nBody, Q, mass):
+        # Accelerations of the other bodies due to each other (but not the central body), and of the test particles (the rows after them) due to the other bodies.
+        n = len(mass)
+        acc = np.zeros_like(Q)
+        if n == 0 or (n == 1 and len(Q) == 1):
+            return acc
+        start = time.perf_counter()
+        if n >= 2:
+            nBody.engine.accelerations(Q[:n], mass, out=acc[:n])
+            self.evaluations += 1
+        if len(Q) > n:
+            fieldAccelerations(Q[n:], Q[:n], mass, nBody.softening, out=acc[n:])
+        profiler = nBody.profiler
+        if profiler != None:
+            profiler.add('forces', time.perf_counter() - start, nested=True)
+        return acc
+
+
+    def step(self, nBody, deltatime):
+        state, particles = nBody.state, nBody.particles
+        if state.N == 0:
+            return
+        if not self.isCurrent(nBody):
+            self.coordinates = self.democratic(nBody)
+        c, others, Q, P, center, velocity, acc = self.coordinates
+        centralmass, mass = state.mass[c], state.mass[others]
+        n = len(others)
+        h = deltatime / 2
+
+        # The interaction kicks of consecutive steps are at the same positions, so the closing one's accelerations open the next step.
+        # The test particles share the jumps of the bodies (the central body's reflex motion) and their Kepler drifts, in the same vectorized calls.
+        if acc is None:
+            acc = self.interactions(nBody, Q, mass)
+        P += acc * h
+        Q += (mass @ P[:n]) * (h / centralmass)
+        Q, P = keplerDrift(Q, P, G * centralmass, deltatime)
+        Q += (mass @ P[:n]) * (h / centralmass)
+        acc = self.interactions(nBody, Q, mass)
+        P += acc * h
+        center = center + velocity * deltatime
+        self.coordinates = (c, others, Q, P, center, velocity, acc)
+
+        state.pos[c] = center - mass @ Q[:n] / state.mass.sum()
+        state.pos[others] = Q[:n] + state.pos[c]
+        state.vel[c] = velocity - mass @ P[:n] / centralmass
+        state.vel[others] = P[:n] + velocity
+        if particles != None:
+            np.add(Q[n:], state.pos[c], out=particles.pos)
+            np.add(P[n:], velocity, out=particles.vel)
+        self.write(nBody)
+
+
+
+INTEGRATORS = {
+    'euler': Euler,
+    'leapfrog': Leapfrog,
+    'verlet': Leapfrog,
+    'yoshida4': Yoshida4,
+    'yoshida6': Yoshida6,
+    'rk4': RK4,
+    'hermite': Hermite,
+    'block': BlockHermite,
+    'wh': WisdomHolman,
+}
+
+
+def getIntegrator(integrator):
+    # Returns an integrator instance from either an integrator name or an existing integrator.
+    if isinstance(integrator, str):
+        if integrator not in INTEGRATORS:
+            raise ValueError("Unknown integrator '%s'. Options are: %s." % (integrator, ', '.join(INTEGRATORS)))
+        return INTEGRATORS[integrator]()
+    return integrator
@@ -0,0 +1,99 @@
+"""
+Contains the universal-variable Kepler solver of the Wisdom-Holman integrator.
+Many two-body orbits about fixed central masses are advanced at once, elliptic, parabolic and hyperbolic alike, with the f and g functions of the universal anomaly.
+"""
+
+import math
+
+import numpy as np
+
+
+# Series coefficients of C(z) = 1/2! - z/4! + z^2/6! - ... (first row) and S(z) = 1/3! - z/5! + z^2/7! - ... (second row).
+SERIES = np.array([[(-1) ** k / math.factorial(2 * k + offset) for k in range(12)] for offset in (2, 3)])
+
+
+def stumpff(z):
+    # The Stumpff functions C(z) and S(z), from their series for |z| < 1 (where the closed forms lose precision near 0, and where steps under a sixth of an orbit keep z).
+    zmax = float(np.abs(z).max(initial=0.0))
+    if zmax < 1:
+        return stumpffSeries(z, zmax)
+    s = np.sqrt(np.abs(z))
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        C = np.where(z > 0, (1 - np.cos(s)) / z, (np.cosh(s) - 1) / -z)
+        S = np.where(z > 0, (s - np.sin(s)) / s ** 3, (np.sinh(s) - s) / s ** 3)
+    small = np.abs(z) < 1
+    if small.any():
+        seriesC, seriesS = stumpffSeries(z, 1.0)
+        C, S = np.where(small, seriesC, C), np.where(small, seriesS, S)
+    return C, S
+
+
+def stumpffSeries(z, zmax):
+    # C(z) and S(z) together by Horner's rule, with as many terms as |z| <= zmax <= 1 needs to be accurate to rounding.
+    terms = 1
+    while terms < SERIES.shape[1] and zmax ** terms * abs(SERIES[0, terms]) > 1e-18:
+        terms += 1
+    CS = np.repeat(SERIES[:, terms - 1:terms], len(z), axis=1)
+    for k in range(terms - 2, -1, -1):
+        CS *= z
+        CS += SERIES[:, k:k + 1]
+    return CS[0], CS[1]
+
+
+def keplerDrift(pos, vel, mu, deltatime, tolerance=1e-6, maxiterations=50):
+    # Advances (N, 3) positions and velocities relative to central masses mu = G M (scalar or (N,)) by deltatime along their two-body orbits.
+    # Returns the new positions and velocities.
+    r0 = np.sqrt(np.einsum('ij,ij->i', pos, pos))
+    eta = np.einsum('ij,ij->i', pos, vel)
+    v2 = np.einsum('ij,ij->i', vel, vel)
+    sqrtmu = np.sqrt(mu)
+    alpha = 2 / r0 - v2 / mu                    # inverse semimajor axis, positive for bound orbits
+    beta = 1 - alpha * r0
+    a = eta / sqrtmu
+
+    # Initial guesses: for steps short against every orbit, the series of chi in powers of dt.
+    dt = deltatime
+    y = sqrtmu * dt
+    chi = y / r0
+    if (np.maximum(np.abs(alpha), 1 / r0) * chi * chi < 1).all():
+        chi = chi - a * y * y / (2 * r0 ** 3) + (a * a / 2 - r0 * beta / 6) * y ** 3 / r0 ** 5
+    else:
+        # Longer steps: bound orbits only need the time since the last whole period, starting from the fraction of the orbit it is,
+        # and unbound ones start from the straight-line path or the asymptotic estimate of Vallado (2013), whichever is the smaller.
+        bound = alpha > 0
+        period = 2 * np.pi / (sqrtmu * np.where(bound, alpha, 1.0) ** 1.5)
+        dt = np.where(bound, np.fmod(deltatime, period), deltatime)
+        y = sqrtmu * dt
+        chi = np.where(bound, y * alpha, y / r0)
+        if not bound.all():
+            with np.errstate(invalid='ignore', divide='ignore'):
+                sign = np.sign(dt)
+                asymptotic = sign * np.sqrt(-1 / alpha) * np.log(-2 * mu * alpha * dt / (eta + sign * np.sqrt(-mu / alpha) * beta))
+            chi = np.where(~bound & (np.abs(asymptotic) < np.abs(chi)), asymptotic, chi)
+
+    # Laguerre-Conway iterations on the universal Kepler equation F(chi) = 0, in terms of the functions G1 = chi (1 - z S), G2 = chi^2 C and G3 = chi^3 S of z = alpha chi^2.
+    # They converge from about any initial guess, and cubically near the root: once a correction is below "tolerance" times chi, the remaining error is at rounding level.
+    for _ in range(maxiterations):
+        chi2 = chi * chi
+        C, S = stumpff(alpha * chi2)
+        G2, G3 = chi2 * C, chi2 * chi * S
+        G1 = chi - alpha * G3
+        G0 = 1 - alpha * G2
+        F = a * G2 + beta * G3 + r0 * chi - y
+        dF = a * G1 + beta * G2 + r0
+        ddF = a * G0 + beta * G1
+        delta = 5 * F / (dF + np.copysign(np.sqrt(np.abs(16 * dF * dF - 20 * F * ddF)), dF))
+        chi = chi - delta
+        if (np.abs(delta) <= tolerance * np.abs(chi)).all():
+            break
+
+    chi2 = chi * chi
+    C, S = stumpff(alpha * chi2)
+    G2, G3 = chi2 * C, chi2 * chi * S
+    G1 = chi - alpha * G3
+    r = a * G1 + beta * G2 + r0
+    f = 1 - G2 / r0
+    g = dt - G3 / sqrtmu
+    fdot = -sqrtmu * G1 / (r * r0)
+    gdot = 1 - G2 / r
+    return f[:, np.newaxis] * pos + g[:, np.newaxis] * vel, fdot[:, np.newaxis] * pos + gdot[:, np.newaxis] * vel
@@ -0,0 +1,27 @@
+"""
+Contains the lazy import helper.
+Modules name their heavy dependencies (NumPy, the force engines) at the top as usual, but the dependencies are only loaded on first use, so physics-only and list-mode programs start quickly.
+"""
+
+import importlib.util
+import sys
+
+
+def lazyImport(name):
+    # Returns the module "name" if it is already imported, or else a module that imports itself on its first attribute access.
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec == None:
+        raise ImportError("No module named '%s'" % name, name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
@@ -3,18 +3,58 @@ Contains the astronomical Body and Nbody classes.
 It deals with the physics of the simulation.
 """
 
+import copy
 import os
 
 from . import data_parse as dp
+from .lazy import lazyImport
+from .state import StateArrays
 from .vector import Vector
 
+np = lazyImport('numpy')                            # only array-backed systems load NumPy and the engines
+gravity = lazyImport(__package__ + '.gravity')
+integrators = lazyImport(__package__ + '.integrators')
+
 
 G = dp.getConstantFromSymbol('G')
 PI = dp.getConstantFromName('Pi')
 
 
+def stateProperty(field, vector=False):
+    # A Body attribute that is stored on the body itself, or in its row of the NBody state arrays once the body belongs to an array-backed NBody.
+    local = '_' + field
+
+    def getter(self):
+        if self.state is None:
+            return getattr(self, local)
+        if vector:
+            return Vector(*getattr(self.state, field)[self.index].tolist())
+        return float(getattr(self.state, field)[self.index])
+
+    def setter(self, value):
+        if self.state is None:
+            if vector and value is not getattr(self, local, None):
+                value = value.copy()        # never share a vector another body or caller may update in place
+            setattr(self, local, value)
+        elif vector:
+            getattr(self.state, field)[self.index] = (value.x, value.y, value.z)
+        else:
+            getattr(self.state, field)[self.index] = value
+
+    return property(getter, setter)
+
+
+
 class Body:
     """An astronomical body class. It contains data methods for the properties of an astronomical body such as its motion over time. Enter data in SI units."""
+
+    pos = stateProperty('pos', vector=True)
+    vel = stateProperty('vel', vector=True)
+    acc = stateProperty('acc', vector=True)
+    mass = stateProperty('mass')
+    radius = stateProperty('radius')
+    angle = stateProperty('angle')
+    angular_velocity = stateProperty('angular_velocity')
     
     def __init__(self, name, mass, radius, rotational_velocity=None, obliquity=None, body_type=None):
         # Enter data in SI units.
@@ -23,6 +63,9 @@ class Body:
         if obliquity == None:
             obliquity = 0
 
+        self.state = None       # StateArrays of the array-backed NBody that holds this body (None when the body holds its own state)
+        self.index = None
+
         self.name = name
         self.body_type = body_type
 
@@ -58,6 +101,14 @@ class Body:
         return Body(self.name, self.mass, self.radius, obliquity=self.obliquity, body_type=self.body_type)(self.pos, self.vel, self.acc, self.angle, self.angular_velocity)
 
 
+    def bind(self, state, index=None):
+        # Moves the body's state into row "index" of the given StateArrays, or back onto the body itself if state is None.
+        values = [(field, getattr(self, field)) for field in StateArrays.FIELDS]
+        self.state, self.index = state, index
+        for field, value in values:
+            setattr(self, field, value)
+
+
     def updateRotation(self, deltatime):
         # Updates the angle based on the angular velocity over a given deltatime.
         self.angle = (self.angle + self.angular_velocity * deltatime) % 360
@@ -65,36 +116,53 @@ class Body:
 
     def updateMotion(self, deltatime):
         # Updates the position and velocity vectors based on the acceleration vector over a given deltatime. Based on the standard equations of motion.
-        self.vel += self.acc * deltatime
-        self.pos += self.vel * deltatime
+        self.vel = self.vel.axpy(deltatime, self.acc)
+        self.pos = self.pos.axpy(deltatime, self.vel)
 
 
     def updateKinematicMotion(self, deltatime):
         # Updates the position and velocity vectors based on the acceleration vector over a given deltatime. Based on the kinematic equations.
-        pvel = self.vel
-        self.vel += self.acc * deltatime
-        self.pos += 0.5 * (self.vel + pvel) * deltatime
+        self.pos = self.pos.axpy(deltatime, self.vel).axpy(0.5 * deltatime * deltatime, self.acc)
+        self.vel = self.vel.axpy(deltatime, self.acc)
 
 
     def updateForceAcceleration(self, forces):
         # Updates the acceleration based on the sum of the forces. Based on Newton's second law.
-        sumforces = Vector(0, 0)
+        acc = self.acc
         for f in forces:
-            sumforces += f
-        self.acc += sumforces / self.mass
+            acc.axpy(1 / self.mass, f)
+        self.acc = acc
 
 
     def resetAcceleration(self):
-        self.acc = Vector(0, 0)
+        acc = self.acc
+        acc.x = acc.y = acc.z = 0
+        self.acc = acc
 
 
 
 class NBody:
-    """A class that contains a list of astronomical body classes and methods that deal with their interaction."""
+    """A class that contains a list of astronomical body classes and methods that deal with their interaction.
+    In array-backed mode the body state lives in contiguous NumPy arrays (self.state) and the bodies are views of their rows."""
    
-    def __init__(self):
+    def __init__(self, arrays=False, engine=None, integrator=None):
         self.bodies = []
         self.N = 0
+        self.time = 0               # simulated time (in s)
+
+        self.state = None           # StateArrays, only in array-backed mode
+        self.engine = None          # Force engine, only in array-backed mode
+        self.integrator = None      # Integrator, only in array-backed mode
+        self.workers = None         # Worker processes for the force engine (None keeps the engine's own setting)
+        self.profiler = None        # Profiler timing the update phases, only while profiling
+        self.softening = 0.0        # Plummer softening length of the pair forces (in m)
+        self.collisions = None      # collisions.Collisions checked after every update, only while set
+        self.particles = None       # particles.TestParticles feeling the bodies' gravity but exerting none, only in array-backed mode
+
+        if arrays or engine != None:
+            self.setEngine('direct' if engine == None else engine)
+        if integrator != None:
+            self.setIntegrator(integrator)
 
 
     def __getitem__(self, key):
@@ -102,20 +170,104 @@ class NBody:
 
 
     def __copy__(self):
-        newNBody = NBody()
+        # The copy gets its own engine (without the worker processes, which it starts on first use) and integrator with the same options, and no force caches.
+        integrator = copy.deepcopy(self.integrator)
+        if integrator != None:
+            integrator.reset()
+        newNBody = NBody(engine=copy.deepcopy(self.engine), integrator=integrator)
+        newNBody.workers = self.workers
         for body in self.bodies:
             newNBody.addBody(body.__copy__())
+        newNBody.time = self.time
+        newNBody.softening = self.softening
+        if self.particles != None:
+            newNBody.particles = self.particles.copy()
         return newNBody
 
 
+    def setEngine(self, engine, **options):
+        # Selects the force engine by name (see gravity.ENGINES) or instance, switching to array-backed mode if needed.
+        self.engine = gravity.getEngine(engine, **options)
+        if self.softening and hasattr(self.engine, 'softening'):
+            self.engine.softening = self.softening
+        if self.workers != None and hasattr(self.engine, 'setWorkers'):
+            self.engine.setWorkers(self.workers)
+        if self.state == None:
+            self.state = StateArrays(self.N)
+            for body in self.bodies:
+                body.bind(self.state, self.state.append())
+        if self.integrator == None:
+            self.integrator = integrators.Euler()
+
+
+    def setIntegrator(self, integrator):
+        # Selects the integrator by name (see integrators.INTEGRATORS) or instance, switching to array-backed mode if needed.
+        self.integrator = integrators.getIntegrator(integrator)
+        if self.state == None:
+            self.setEngine('direct')
+
+
+    def setWorkers(self, workers=None):
+        # Splits the force evaluations across "workers" processes (all CPU cores by default), switching to array-backed mode if needed.
+        if self.state == None:
+            self.setEngine('direct')
+        if not hasattr(self.engine, 'setWorkers'):
+            raise ValueError("The %s engine does not support worker processes." % self.engine.name)
+        self.workers = os.cpu_count() if workers == None else workers
+        self.engine.setWorkers(self.workers)
+
+
+    def setProfiler(self, profiler=True):
+        # Times the phases of every update ('reset', 'forces', 'integration', 'rotation', 'collisions') and counts the 'steps' in a profiling.Profiler (True for a new one), or stops profiling with None.
+        if profiler == True:
+            from .profiling import Profiler
+            profiler = Profiler()
+        self.profiler = profiler or None
+
+
+    def setSoftening(self, softening):
+        # Plummer-softens the pair forces by a length "softening" (in m, 0 for Newtonian forces), in list mode and in engines that support it.
+        if self.engine != None and not hasattr(self.engine, 'softening'):
+            raise ValueError("The %s engine does not support softening." % self.engine.name)
+        self.softening = softening
+        if self.engine != None:
+            self.engine.softening = softening
+
+
+    def setCollisions(self, collisions='merge', **options):
+        # Checks for touching and close bodies after every update with a collisions.Collisions (or a new one with the policy name and options), or stops checking with None.
+        if isinstance(collisions, str):
+            from .collisions import Collisions
+            collisions = Collisions(collisions, **options)
+        self.collisions = collisions
+
+
     def addBody(self, body):
+        if self.state != None:
+            body.bind(self.state, self.state.append())
         self.bodies.append(body)
         self.N += 1
 
 
+    def addParticles(self, particles):
+        # Adds massless test particles (a particles.TestParticles, e.g. from particles.belt or particles.ring), switching to array-backed mode if needed.
+        if self.state == None:
+            self.setEngine('direct')
+        if self.particles == None:
+            self.particles = particles.copy()
+        else:
+            self.particles.add(particles)
+
+
     def removeBody(self, body):
         self.bodies.remove(body)
         self.N -= 1
+        if self.state != None:
+            i = body.index
+            body.bind(None)
+            self.state.remove(i)
+            for j, other in enumerate(self.bodies[i:], i):
+                other.index = j
 
 
     def searchBody(self, i=None, name=None):
@@ -135,9 +287,31 @@ class NBody:
 
 
     def update(self, deltatime):        # delatime is the simulated time
+        self.time += deltatime
+        profiler = self.profiler
+        if profiler != None:
+            profiler.count('steps')
+            profiler.start()
+        if self.state != None:
+            self.updateArrays(deltatime)
+        else:
+            self.updateList(deltatime)
+
+        if self.collisions != None:
+            self.collisions(self)
+            if profiler != None:
+                profiler.lap('collisions')
+
+
+    def updateList(self, deltatime):
+        # List-mode version of update, summing the pair forces body by body.
+        profiler = self.profiler
+
         # Reset bodies' acceleration.
         for body in self.bodies:
             body.resetAcceleration()
+        if profiler != None:
+            profiler.lap('reset')
 
         # Update gravitational forces and bodies' acceleration.
         for i in range(self.N - 1):
@@ -147,19 +321,46 @@ class NBody:
                 force = self.forceBetween(i, j)
 
                 forces.append(force)
-                self[j].updateForceAcceleration([-force])
+                self[j].acc.axpy(-1 / self[j].mass, force)      # list mode: the body's own vector, updated in place
 
             self[i].updateForceAcceleration(forces)
+        if profiler != None:
+            profiler.lap('forces')
         
-        # Update bodies' motion vectors (velocity and position).
+        # Update bodies' motion vectors (velocity and position), then their rotation.
         for body in self.bodies:
             body.updateMotion(deltatime)
+        if profiler != None:
+            profiler.lap('integration')
+        for body in self.bodies:
             body.updateRotation(deltatime)
+        if profiler != None:
+            profiler.lap('rotation')
+
+
+    def updateArrays(self, deltatime):
+        # Array-backed version of update. The integrator advances the motion, computing all accelerations with the force engine in vectorized passes.
+        state, profiler = self.state, self.profiler
+        if self.particles != None and not self.integrator.testparticles:
+            raise ValueError("The %s integrator does not support test particles. Use e.g. 'leapfrog' or 'wh'." % self.integrator.name)
+        self.integrator.step(self, deltatime)
+        if profiler != None:
+            profiler.lap('integration')        # the force evaluations within are timed as 'forces'
+
+        state.angle += state.angular_velocity * deltatime
+        np.remainder(state.angle, 360, out=state.angle)
+        if profiler != None:
+            profiler.lap('rotation')
 
 
     def forceBetween(self, i, j):
         # Calculation of the gravitational force vector of i as affected by j. Based on Newton's universal law of gravitation. 
-        return (self[j].pos - self[i].pos) * (G * self[j].mass  * self[i].mass / (abs(self[j].pos - self[i].pos) ** 3))
+        d = self[j].pos - self[i].pos
+        if self.softening:
+            d *= G * self[j].mass * self[i].mass / (d.dot(d) + self.softening ** 2) ** 1.5
+        else:
+            d *= G * self[j].mass * self[i].mass / (abs(d) ** 3)
+        return d
 
 
 
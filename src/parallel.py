@@ -0,0 +1,176 @@
+"""
+Contains the worker process pool used to split direct force evaluations across CPU cores.
+The positions, velocities and masses are copied into shared memory blocks that every worker maps, so a step only sends each worker the range of rows it computes, never the arrays themselves.
+"""
+
+import multiprocessing as mp
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+ARRAYS = (('pos', (3,), np.float64), ('vel', (3,), np.float64), ('mass', (), np.float64),
+          ('acc', (3,), np.float64), ('jerk', (3,), np.float64), ('targets', (), np.int64))
+
+
+class WorkerPool:
+    """A pool of worker processes evaluating blocks of rows of the direct force sum over shared arrays.
+    Every worker writes its own block of rows and each row is summed in the same order as in a single process, so the reduction is deterministic and independent of the number of workers."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.capacity = 0
+        self.blocks = []
+        self.arrays = dict()
+
+        context = mp.get_context('spawn')       # forking a process with running threads is unsafe
+        self.processes = []
+        self.connections = []
+        for _ in range(workers):
+            connection, child = context.Pipe()
+            process = context.Process(target=workerLoop, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            self.processes.append(process)
+            self.connections.append(connection)
+        self.finalizer = weakref.finalize(self, shutdown, self.processes, self.connections, self.blocks)
+
+
+    def reserve(self, N):
+        # Makes the shared arrays hold at least N bodies, growing them by doubling and remapping them in the workers.
+        if N <= self.capacity:
+            return
+        capacity = max(N, 2 * self.capacity)
+        blocks, arrays = createArrays(capacity)
+        self.send([('attach', [block.name for block in blocks], capacity)] * self.workers)
+
+        self.arrays = arrays
+        releaseBlocks(self.blocks)
+        self.blocks[:] = blocks
+        self.capacity = capacity
+
+
+    def send(self, messages):
+        # Sends one message to each worker and waits for all of them to finish.
+        for connection, message in zip(self.connections, messages):
+            connection.send(message)
+        try:
+            errors = [connection.recv() for connection in self.connections]
+        except (EOFError, OSError):
+            raise RuntimeError("A force worker process exited. Programs using worker processes must start them under 'if __name__ == \"__main__\":'.")
+        for error in errors:
+            if error != None:
+                raise error
+
+
+    def split(self, M, N, maxpairs, softening=0.0):
+        # Balanced blocks of rows: every row costs the same N pair interactions.
+        bounds = [M * k // self.workers for k in range(self.workers + 1)]
+        return [(bounds[k], bounds[k + 1], N, maxpairs, softening) for k in range(self.workers)]
+
+
+    def accelerations(self, pos, mass, out, maxpairs, softening=0.0):
+        N = len(pos)
+        self.reserve(N)
+        self.arrays['pos'][:N] = pos
+        self.arrays['mass'][:N] = mass
+        self.send([('acc',) + block for block in self.split(N, N, maxpairs, softening)])
+        out[:] = self.arrays['acc'][:N]
+        return out
+
+
+    def accelerationsAndJerks(self, pos, vel, mass, targets, out, jerk, maxpairs, softening=0.0):
+        N, M = len(pos), len(targets)
+        self.reserve(N)
+        self.arrays['pos'][:N] = pos
+        self.arrays['vel'][:N] = vel
+        self.arrays['mass'][:N] = mass
+        self.arrays['targets'][:M] = targets
+        self.send([('jerk',) + block for block in self.split(M, N, maxpairs, softening)])
+        out[:] = self.arrays['acc'][:M]
+        jerk[:] = self.arrays['jerk'][:M]
+        return out, jerk
+
+
+    def close(self):
+        self.arrays = dict()
+        self.finalizer()
+
+
+
+def createArrays(capacity, names=None):
+    # Returns (shared memory blocks, dict of arrays over them), creating new blocks or attaching to existing ones by name.
+    blocks, arrays = [], dict()
+    for i, (field, shape, dtype) in enumerate(ARRAYS):
+        size = capacity * int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if names == None:
+            block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        else:
+            block = shared_memory.SharedMemory(name=names[i])
+        blocks.append(block)
+        arrays[field] = np.ndarray((capacity,) + shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+def releaseBlocks(blocks, unlink=True):
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:         # arrays still view it (at interpreter exit), the mapping goes with the process
+            pass
+        if unlink:
+            block.unlink()
+
+
+def shutdown(processes, connections, blocks):
+    for connection in connections:
+        try:
+            connection.send(None)
+        except OSError:
+            pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    for connection in connections:
+        connection.close()
+    releaseBlocks(blocks)
+    blocks.clear()
+
+
+def workerLoop(connection):
+    # Runs in each worker process: computes the blocks of rows it is sent until it receives None.
+    from . import gravity
+
+    blocks, arrays = [], dict()
+    while True:
+        message = connection.recv()
+        if message == None:
+            break
+        try:
+            if message[0] == 'attach':
+                arrays = dict()
+                releaseBlocks(blocks, unlink=False)
+                blocks, arrays = createArrays(message[2], message[1])
+            else:
+                computeRows(gravity, arrays, *message)
+            connection.send(None)
+        except Exception as e:
+            connection.send(e)
+
+    arrays = dict()
+    releaseBlocks(blocks, unlink=False)
+
+
+def computeRows(gravity, arrays, kind, start, stop, N, maxpairs, softening=0.0):
+    # Computes rows [start, stop) in tiles of at most maxpairs pair separations.
+    pos, vel, mass = arrays['pos'][:N], arrays['vel'][:N], arrays['mass'][:N]
+    rows = max(1, min(stop - start, maxpairs // N))
+    for a in range(start, stop, rows):
+        b = min(a + rows, stop)
+        if kind == 'acc':
+            arrays['acc'][a:b] = gravity.tileAccelerations(pos[a:b], pos, mass, np.arange(a, b), softening=softening)
+        else:
+            targets = arrays['targets'][a:b]
+            arrays['acc'][a:b], arrays['jerk'][a:b] = gravity.tileAccelerationsAndJerks(pos[targets], vel[targets], pos, vel, mass, targets, softening)
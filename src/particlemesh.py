@@ -0,0 +1,198 @@
+"""
+Contains the particle-mesh (PM) and particle-particle/particle-mesh (P3M) force engines.
+Masses are deposited on a 3D grid with cloud-in-cell (CIC) weights, Poisson's equation is solved by FFT convolution with the Green's function, and the accelerations are interpolated back with the same weights.
+"""
+
+import math
+
+import numpy as np
+
+from . import data_parse as dp
+from .barneshut import raggedRange
+
+
+G = dp.getConstantFromSymbol('G')
+
+CORNERS = [(dx, dy, dz) for dx in (0, 1) for dy in (0, 1) for dz in (0, 1)]
+
+
+class ParticleMeshEngine:
+    """Particle-mesh gravity on an ngrid^3 grid stretched over the bodies' bounding box.
+    The grid is zero-padded by "padding" before the FFT: padding = 2 gives exact isolated (non-periodic) boundaries and padding = 1 gives periodic ones.
+    With shortrange=True (P3M) the mesh only carries the long-range part of a Gaussian force split of width splitscale cells, and every pair closer than cutoff split widths is summed directly."""
+
+    name = 'particle-mesh'
+
+    def __init__(self, ngrid=64, padding=2, shortrange=False, splitscale=1.25, cutoff=4.5):
+        self.ngrid = ngrid
+        self.padding = padding
+        self.shortrange = shortrange
+        self.splitscale = splitscale
+        self.cutoff = cutoff
+
+        self.kernel = None          # FFT of the force kernel for a unit cell size, it scales as 1 / h^2
+        self.kernelkey = None       # (ngrid, padding, shortrange, splitscale) the kernel was computed for
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['kernel'] = state['kernelkey'] = None         # recomputed on first use, the same
+        return state
+
+
+    def accelerations(self, pos, mass, out=None):
+        N = len(pos)
+        if out is None:
+            out = np.empty((N, 3))
+        if N == 0:
+            return out
+        lo = pos.min(axis=0)
+        h = (pos.max(axis=0) - lo).max() / (self.ngrid - 1) * (1 + 1e-12)      # cell size
+        if N == 1 or h == 0:
+            out[:] = 0          # a single body, or bodies all at one point, whose pull on each other has no direction
+            return out
+        u = (pos - lo) / h
+        cell = np.minimum(np.floor(u).astype(np.int64), self.ngrid - 2)
+        frac = u - cell
+
+        field = self.meshAccelerations(self.deposit(cell, frac, mass)) / h ** 2
+        out[:] = self.interpolate(field, cell, frac)
+
+        if self.shortrange:
+            self.addShortRange(out, pos, mass, self.splitscale * h)
+        return out
+
+
+    def deposit(self, cell, frac, mass):
+        # CIC mass assignment. Returns the (ngrid, ngrid, ngrid) grid of cell masses.
+        n = self.ngrid
+        rho = np.zeros(n ** 3)
+        for corner in CORNERS:
+            index, weight = self.cornerWeights(cell, frac, corner)
+            rho += np.bincount(index, weights=weight * mass, minlength=n ** 3)
+        return rho.reshape(n, n, n)
+
+
+    def interpolate(self, field, cell, frac):
+        # CIC interpolation of the (3, ngrid, ngrid, ngrid) acceleration field at the particles.
+        flat = field.reshape(3, -1)
+        acc = np.zeros((len(cell), 3))
+        for corner in CORNERS:
+            index, weight = self.cornerWeights(cell, frac, corner)
+            acc += flat[:, index].T * weight[:, np.newaxis]
+        return acc
+
+
+    def cornerWeights(self, cell, frac, corner):
+        n = self.ngrid
+        c = cell + corner
+        index = (c[:, 0] * n + c[:, 1]) * n + c[:, 2]
+        weight = np.prod(np.where(corner, frac, 1 - frac), axis=1)
+        return index, weight
+
+
+    def meshAccelerations(self, rho):
+        # Convolves the mass grid with the force kernel (for a unit cell size) on the zero-padded grid.
+        n = self.ngrid
+        m = self.paddedSize()
+        key = (self.ngrid, self.padding, self.shortrange, self.splitscale)
+        if self.kernel is None or self.kernelkey != key:
+            self.kernel, self.kernelkey = self.kernelTransform(), key
+        rhok = np.fft.rfftn(rho, s=(m, m, m), axes=(0, 1, 2))
+        return np.stack([np.fft.irfftn(rhok * k, s=(m, m, m), axes=(0, 1, 2))[:n, :n, :n] for k in self.kernel])
+
+
+    def paddedSize(self):
+        return max(self.ngrid, int(round(self.padding * self.ngrid)))
+
+
+    def kernelTransform(self):
+        # FFT of the acceleration due to a unit mass, G * (x' - x) / |x' - x|^3, on the wrapped padded grid in units of cells.
+        m = self.paddedSize()
+        s = np.fft.fftfreq(m, 1 / m)            # wrapped cell offsets 0, 1, ..., -1
+        sx, sy, sz = np.meshgrid(s, s, s, indexing='ij')
+        r = np.sqrt(sx ** 2 + sy ** 2 + sz ** 2)
+        r[0, 0, 0] = 1
+
+        w = -G / r ** 3
+        if self.shortrange:
+            w *= 1 - shortRangeFactor(r, self.splitscale)
+        w[0, 0, 0] = 0
+        return [np.fft.rfftn(w * sx), np.fft.rfftn(w * sy), np.fft.rfftn(w * sz)]
+
+
+    def addShortRange(self, acc, pos, mass, rs):
+        # P3M correction: the short-range part of the force split for every pair closer than cutoff * rs.
+        for i, j in pairsWithin(pos, self.cutoff * rs):
+            d = pos[j] - pos[i]
+            r = np.sqrt(np.einsum('ij,ij->i', d, d))
+            if not r.all():
+                apart = r > 0           # bodies at the same point pull each other in no direction
+                i, j, d, r = i[apart], j[apart], d[apart], r[apart]
+            w = G * shortRangeFactor(r, rs) / r ** 3
+            for k in range(3):
+                acc[:, k] += np.bincount(i, weights=w * mass[j] * d[:, k], minlength=len(acc))
+                acc[:, k] -= np.bincount(j, weights=w * mass[i] * d[:, k], minlength=len(acc))
+
+
+
+class P3MEngine(ParticleMeshEngine):
+    """Particle-mesh engine with the short-range direct correction (P3M)."""
+
+    name = 'p3m'
+
+    def __init__(self, ngrid=64, padding=2, splitscale=1.25, cutoff=4.5):
+        ParticleMeshEngine.__init__(self, ngrid, padding, True, splitscale, cutoff)
+
+
+
+def shortRangeFactor(r, rs):
+    # Fraction of the Newtonian force that belongs to the short-range part of a Gaussian split of width rs.
+    x = r / (2 * rs)
+    return erfc(x) + 2 * x / math.sqrt(math.pi) * np.exp(-x ** 2)
+
+
+def erfc(x):
+    # Complementary error function for x >= 0 (Abramowitz and Stegun 7.1.26, absolute error below 1.5e-7).
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return poly * np.exp(-x ** 2)
+
+
+def pairsWithin(pos, radius, maxpairs=2**21):
+    # Yields index arrays (i, j) of the unordered pairs of positions closer than radius, found with a cell list of cell size radius.
+    # The pairs come in chunks of at most about maxpairs candidates (or one body's candidates, if that is more) to bound memory.
+    cell = np.floor((pos - pos.min(axis=0)) / radius).astype(np.int64) + 1
+    dims = cell.max(axis=0) + 2                 # a margin of empty cells on each side
+    keys = (cell[:, 0] * dims[1] + cell[:, 1]) * dims[2] + cell[:, 2]
+    order = np.argsort(keys, kind='stable')
+    sortedkeys = keys[order]
+
+    # Own cell and the 13 neighbouring cells "after" it, so that every pair of cells is visited once.
+    offsets = [(0, 0, 0)] + [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) if (dx, dy, dz) > (0, 0, 0)]
+    first = np.empty((len(offsets), len(pos)), dtype=np.int64)
+    counts = np.empty((len(offsets), len(pos)), dtype=np.int64)
+    for k, (dx, dy, dz) in enumerate(offsets):
+        neighbours = sortedkeys + (dx * dims[1] + dy) * dims[2] + dz
+        first[k] = np.searchsorted(sortedkeys, neighbours, side='left')
+        counts[k] = np.searchsorted(sortedkeys, neighbours, side='right') - first[k]
+
+    cumulative = np.cumsum(counts.sum(axis=0))
+    bounds = np.unique(np.searchsorted(cumulative, np.arange(maxpairs, cumulative[-1], maxpairs), side='right'))
+    for start, stop in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(pos)]])):
+        if start == stop:
+            continue
+        pairs = []
+        for k in range(len(offsets)):
+            c = counts[k, start:stop]
+            i = np.repeat(np.arange(start, stop), c)
+            j = raggedRange(first[k, start:stop], c)
+            if k == 0:
+                keep = i < j
+                i, j = i[keep], j[keep]
+            pairs.append((i, j))
+
+        i, j = [order[np.concatenate(x)] for x in zip(*pairs)]
+        d = pos[j] - pos[i]
+        close = np.einsum('ij,ij->i', d, d) < radius ** 2
+        yield i[close], j[close]
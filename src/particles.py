@@ -0,0 +1,109 @@
+"""
+Contains the massless test particles of an array-backed NBody, and the generators of asteroid belts and planetary rings.
+Test particles feel the gravity of the bodies but exert none, so they are kept in arrays of their own and a step costs O(N bodies x N particles) on top of the bodies' own forces.
+"""
+
+import numpy as np
+
+from . import data_parse as dp
+
+
+G = dp.getConstantFromSymbol('G')
+
+
+class TestParticles:
+    """Positions (N, 3), velocities (N, 3) and accelerations (N, 3) of massless test particles, in SI units.
+    Particles are added in bulk; they are drawn as a point cloud rather than as bodies."""
+
+    def __init__(self, pos=None, vel=None):
+        self.pos = np.zeros((0, 3)) if pos is None else np.array(pos, dtype=np.float64).reshape(-1, 3)
+        self.vel = np.zeros_like(self.pos) if vel is None else np.array(vel, dtype=np.float64).reshape(-1, 3)
+        if self.vel.shape != self.pos.shape:
+            raise ValueError("Test particles need as many velocities as positions (got %d and %d)." % (len(self.vel), len(self.pos)))
+        self.acc = np.zeros_like(self.pos)
+        self.N = len(self.pos)
+
+
+    def __len__(self):
+        return self.N
+
+
+    def add(self, particles):
+        # Appends the particles of another TestParticles.
+        self.pos = np.concatenate([self.pos, particles.pos])
+        self.vel = np.concatenate([self.vel, particles.vel])
+        self.acc = np.concatenate([self.acc, particles.acc])
+        self.N = len(self.pos)
+        return self
+
+
+    def copy(self):
+        newParticles = TestParticles(self.pos, self.vel)
+        newParticles.acc[:] = self.acc
+        return newParticles
+
+
+
+def eccentricAnomaly(mean, e, tolerance=1e-14, maxiterations=50):
+    # Solves Kepler's equation E - e sin E = M for elliptic orbits (e < 1) by Newton's method, for arrays of mean anomalies and eccentricities.
+    mean = np.remainder(mean, 2 * np.pi)
+    E = np.where(e < 0.8, mean, np.pi)
+    for _ in range(maxiterations):
+        delta = (E - e * np.sin(E) - mean) / (1 - e * np.cos(E))
+        E = E - delta
+        if (np.abs(delta) <= tolerance).all():
+            break
+    return E
+
+
+def trueAnomaly(mean, e):
+    E = eccentricAnomaly(mean, e)
+    return 2 * np.arctan2(np.sqrt(1 + e) * np.sin(E / 2), np.sqrt(1 - e) * np.cos(E / 2))
+
+
+def fromElements(a, e, i, ascendingnode, periapsis, anomaly, mu):
+    # Positions and velocities (N, 3) relative to a central mass mu = G M of orbits with the given elements, the inverse of diagnostics.orbitalElements
+    # (semimajor axis a in m, negative for unbound orbits, eccentricity e, inclination i, longitude of the ascending node, argument of periapsis and true anomaly in rad).
+    a, e, i, ascendingnode, periapsis, anomaly = np.broadcast_arrays(*[np.asarray(x, dtype=np.float64) for x in (a, e, i, ascendingnode, periapsis, anomaly)])
+    p = a * (1 - e * e)                         # semi-latus rectum
+    r = p / (1 + e * np.cos(anomaly))
+    speed = np.sqrt(mu / p)
+
+    # Perifocal coordinates, then rotated by the argument of periapsis, the inclination and the node.
+    x, y = r * np.cos(anomaly), r * np.sin(anomaly)
+    vx, vy = -speed * np.sin(anomaly), speed * (e + np.cos(anomaly))
+    cosO, sinO, cosw, sinw, cosi, sini = np.cos(ascendingnode), np.sin(ascendingnode), np.cos(periapsis), np.sin(periapsis), np.cos(i), np.sin(i)
+    P = np.stack([cosO * cosw - sinO * sinw * cosi, sinO * cosw + cosO * sinw * cosi, sinw * sini], axis=-1)
+    Q = np.stack([-cosO * sinw - sinO * cosw * cosi, -sinO * sinw + cosO * cosw * cosi, cosw * sini], axis=-1)
+    return x[..., np.newaxis] * P + y[..., np.newaxis] * Q, vx[..., np.newaxis] * P + vy[..., np.newaxis] * Q
+
+
+def orbiting(central, pos, vel):
+    # TestParticles at positions and velocities relative to a central Body.
+    center, velocity = central.pos, central.vel
+    return TestParticles(pos + (center.x, center.y, center.z), vel + (velocity.x, velocity.y, velocity.z))
+
+
+def belt(central, count, a, e=(0.0, 0.0), i=(0.0, 0.0), seed=None):
+    # "count" particles on orbits about a central Body (e.g. an asteroid belt about the Sun), with semimajor axes, eccentricities and inclinations
+    # drawn uniformly from the (low, high) ranges a (in m), e (below 1) and i (in rad), and uniformly distributed node, periapsis and mean anomaly angles.
+    rng = np.random.default_rng(seed)
+    if e[1] >= 1:
+        raise ValueError("Belt orbits must be bound (e < 1).")
+    a, e, i = rng.uniform(*a, count), rng.uniform(*e, count), rng.uniform(*i, count)
+    ascendingnode, periapsis, mean = rng.uniform(0, 2 * np.pi, (3, count))
+    pos, vel = fromElements(a, e, i, ascendingnode, periapsis, trueAnomaly(mean, e), G * central.mass)
+    return orbiting(central, pos, vel)
+
+
+def ring(central, count, inner, outer, thickness=0.0, tilt=0.0, seed=None):
+    # "count" particles on circular orbits about a central Body (e.g. a planetary ring), spread uniformly over the area between the radii inner and outer (in m),
+    # with inclinations up to half the "thickness" (in m) over the radius. The ring plane is tilted by "tilt" (in rad) about the x axis.
+    rng = np.random.default_rng(seed)
+    a = np.sqrt(rng.uniform(inner * inner, outer * outer, count))
+    i = rng.uniform(0, 1, count) * thickness / (2 * a)
+    ascendingnode, anomaly = rng.uniform(0, 2 * np.pi, (2, count))
+    pos, vel = fromElements(a, 0.0, i, ascendingnode, 0.0, anomaly, G * central.mass)
+    c, s = np.cos(tilt), np.sin(tilt)
+    rotation = np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+    return orbiting(central, pos @ rotation.T, vel @ rotation.T)
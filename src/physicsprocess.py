@@ -0,0 +1,286 @@
+"""
+Contains the physics child process of the interactive simulation.
+The NBody is stepped by a Scheduler in a process of its own, so that physics and rendering do not contend for one interpreter lock.
+Every state is published to a ring of frames in shared memory, which the renderer copies the latest two of, and control messages (pause, speed, dt, diagnostics) arrive over a pipe.
+"""
+
+import multiprocessing as mp
+import time
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .scheduler import Scheduler
+from .snapshot import Frame, particleCount
+
+
+STATS = ('steps', 'dropped', 'accumulator', 'last', 'speed', 'deltatime', 'paused', 'energyerror', 'maxenergyerror')
+
+
+class SharedRing:
+    """A ring of "slots" frames of up to "capacity" bodies and "particlecapacity" test particles in one shared memory block, written by one process and read by another.
+    Every slot has a sequence number, set to -1 while it is written and to the serial of its publish once complete (a seqlock),
+    so the reader retries instead of using a slot that was overwritten while it was copied."""
+
+    def __init__(self, slots, capacity, name=None, particlecapacity=0):
+        self.slots, self.capacity, self.particlecapacity = slots, capacity, particlecapacity
+        layout = [('latest', (1,), np.int64), ('stats', (len(STATS),), np.float64), ('seq', (slots,), np.int64), ('N', (slots,), np.int64),
+                  ('time', (slots,), np.float64), ('pos', (slots, capacity, 3), np.float64), ('radius', (slots, capacity), np.float64),
+                  ('angle', (slots, capacity), np.float64), ('ids', (slots, capacity), np.int64), ('M', (slots,), np.int64),
+                  ('particles', (slots, particlecapacity, 3), np.float64)]
+        size = sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for _, shape, dtype in layout)
+        self.block = shared_memory.SharedMemory(name=name, create=name == None, size=size if name == None else 0)
+        self.name = self.block.name
+
+        self.arrays, offset = dict(), 0
+        for field, shape, dtype in layout:
+            self.arrays[field] = np.ndarray(shape, dtype=dtype, buffer=self.block.buf, offset=offset)
+            offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if name == None:
+            self.arrays['seq'][:] = -1
+            self.arrays['latest'][0] = 0
+
+
+    def publish(self, nBody, ids):
+        # Writer side: copies the positions, radii and angles of the bodies and the test particle positions into the next slot, with the index of every body in "ids" (body -> original index).
+        a = self.arrays
+        N = nBody.N
+        M = particleCount(nBody)
+        if N > self.capacity:
+            raise ValueError("The shared frames hold at most %d bodies (now %d)." % (self.capacity, N))
+        if M > self.particlecapacity:
+            raise ValueError("The shared frames hold at most %d test particles (now %d)." % (self.particlecapacity, M))
+        serial = int(a['latest'][0]) + 1
+        k = serial % self.slots
+        a['seq'][k] = -1
+        a['N'][k] = N
+        a['time'][k] = nBody.time
+        if nBody.state != None:
+            a['pos'][k, :N] = nBody.state.pos
+            a['radius'][k, :N] = nBody.state.radius
+            a['angle'][k, :N] = nBody.state.angle
+        else:
+            for i, body in enumerate(nBody.bodies):
+                pos = body.pos
+                a['pos'][k, i] = pos.x, pos.y, pos.z
+                a['radius'][k, i] = body.radius
+                a['angle'][k, i] = body.angle
+        a['ids'][k, :N] = [ids[body] for body in nBody.bodies]
+        a['M'][k] = M
+        if M > 0:
+            a['particles'][k, :M] = nBody.particles.pos
+        a['seq'][k] = serial
+        a['latest'][0] = serial
+
+
+    def read(self, serial, frame):
+        # Reader side: copies the frame of a publish into a Frame (reallocated if its size differs) and returns it, or None if it is no longer (or not yet) in its slot.
+        a = self.arrays
+        k = serial % self.slots
+        if a['seq'][k] != serial:
+            return None
+        N, M = int(a['N'][k]), int(a['M'][k])
+        if frame == None or frame.N != N or len(frame.particles) != M:
+            frame = Frame(N, M=M)
+        np.copyto(frame.pos, a['pos'][k, :N])
+        np.copyto(frame.radius, a['radius'][k, :N])
+        np.copyto(frame.angle, a['angle'][k, :N])
+        np.copyto(frame.particles, a['particles'][k, :M])
+        ids = a['ids'][k, :N].copy()
+        frame.time = float(a['time'][k])
+        if a['seq'][k] != serial:
+            return None
+        frame.serial = serial
+        frame.ids = ids
+        return frame
+
+
+    def setStats(self, **values):
+        for field, value in values.items():
+            self.arrays['stats'][STATS.index(field)] = value
+
+
+    def stats(self):
+        return dict(zip(STATS, self.arrays['stats'].tolist()))
+
+
+    def close(self, unlink=False):
+        self.arrays = dict()
+        self.block.close()
+        if unlink:
+            self.block.unlink()
+
+
+
+class PhysicsProcess:
+    """Steps an NBody in a child process and hands its states to the renderer. It stands in for both the Scheduler and the snapshot buffer of the in-thread mode:
+    setPaused, setSpeed, setDeltatime, stop and alpha control and follow the child's scheduler, and latestTwo returns the latest two published states as Frames.
+    The NBody is copied to the child when it starts; the bodies of the returned frames are the parent's Body objects of the bodies still in the child."""
+
+    def __init__(self, nBody, deltatime, speed=1.0, paused=False, slots=8):
+        self.bodies = list(nBody.bodies)
+        self.ring = SharedRing(slots, max(1, nBody.N), particlecapacity=particleCount(nBody))
+        self.frames = [None, None, None]        # local copies: previous, latest and a spare
+        self.framebodies = (None, [])           # (ids, bodies) of the latest frame
+
+        context = mp.get_context('spawn')       # forking a process with running threads is unsafe
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=physicsLoop, args=(child, nBody, self.ring.name, slots, self.ring.capacity, self.ring.particlecapacity, deltatime, speed, paused), daemon=True)
+        self.process.start()
+        child.close()
+        self.finalizer = weakref.finalize(self, shutdown, self.process, self.connection, self.ring)
+
+
+    def send(self, *message):
+        try:
+            self.connection.send(message)
+        except OSError:             # the child exited
+            pass
+
+
+    def setPaused(self, paused):
+        self.send('paused', paused)
+
+
+    def setSpeed(self, speed):
+        self.send('speed', speed)
+
+
+    def setDeltatime(self, deltatime):
+        self.send('deltatime', deltatime)
+
+
+    def setDiagnostics(self, every):
+        # Samples the energy every "every" steps in the child (None to stop), for energyErrors.
+        self.send('diagnostics', every)
+
+
+    def stop(self):
+        self.finalizer()
+
+
+    def stats(self):
+        # The child scheduler's state: steps taken, simulated time dropped, accumulator, ..., and the latest and largest relative energy errors (NaN without diagnostics).
+        return self.ring.stats()
+
+
+    @property
+    def steps(self):
+        return int(self.ring.arrays['stats'][0])
+
+
+    @property
+    def dropped(self):
+        # Simulated time the child's scheduler skipped because the physics could not keep up, as Scheduler.dropped.
+        return self.ring.stats()['dropped']
+
+
+    def energyErrors(self):
+        stats = self.stats()
+        return None if np.isnan(stats['energyerror']) else (stats['energyerror'], stats['maxenergyerror'])
+
+
+    def alpha(self, now=None):
+        # How far the child is between its latest two steps, as Scheduler.alpha.
+        stats = self.stats()
+        if stats['deltatime'] <= 0:
+            return 1.0
+        now = time.monotonic() if now == None else now
+        due = stats['accumulator'] if stats['paused'] else stats['accumulator'] + (now - stats['last']) * stats['speed']
+        return min(max(due / stats['deltatime'], 0.0), 1.0)
+
+
+    def latestTwo(self):
+        # The latest two published states (previous, latest) as local Frames that stay untouched until the next call (previous is None until two were published).
+        serial = int(self.ring.arrays['latest'][0])
+        if serial == 0:
+            return None, Frame(0)
+        previous, latest, spare = self.frames
+        if latest == None or latest.serial != serial:
+            for _ in range(3):                  # a slot overwritten while it was copied is retried with the newest publish
+                frame = self.ring.read(serial, spare)
+                if frame == None:
+                    serial = int(self.ring.arrays['latest'][0])
+                    continue
+                if latest != None and latest.serial == serial - 1:
+                    previous, latest, spare = latest, frame, previous
+                else:
+                    previous, latest, spare = self.ring.read(serial - 1, previous) if serial > 1 else None, frame, latest
+                for frame in (previous, latest):
+                    if frame != None:
+                        frame.bodies = self.bodiesOf(frame.ids)
+                break
+            self.frames = [previous, latest, spare]
+        return previous, latest
+
+
+    def latest(self):
+        return self.latestTwo()[1]
+
+
+    def bodiesOf(self, ids):
+        # The parent's bodies of the given original indices, rebuilt only when the child's bodies change.
+        cached, bodies = self.framebodies
+        if cached is None or not np.array_equal(cached, ids):
+            self.framebodies = (ids, [self.bodies[k] for k in ids.tolist()])
+        return self.framebodies[1]
+
+
+def shutdown(process, connection, ring):
+    try:
+        connection.send(None)
+    except OSError:
+        pass
+    process.join(timeout=5)
+    if process.is_alive():
+        process.terminate()
+    connection.close()
+    ring.close(unlink=True)
+
+
+def physicsLoop(connection, nBody, name, slots, capacity, particlecapacity, deltatime, speed, paused):
+    # Runs in the child process: steps the NBody whenever the scheduler has steps due, publishing every state, and sleeps on the control pipe in between.
+    ring = SharedRing(slots, capacity, name, particlecapacity)
+    scheduler = Scheduler(deltatime, speed, paused=paused, clock=time.monotonic)
+    ids = {body: k for k, body in enumerate(nBody.bodies)}
+    diagnostics = None
+
+    def publishStats():
+        errors = diagnostics.energyErrors() if diagnostics != None and len(diagnostics.energies) > 1 else None
+        ring.setStats(steps=scheduler.steps, dropped=scheduler.dropped, accumulator=scheduler.accumulator, last=scheduler.last, speed=scheduler.speed,
+                      deltatime=scheduler.deltatime, paused=scheduler.paused, energyerror=np.nan if errors is None else errors[-1],
+                      maxenergyerror=np.nan if errors is None else errors.max())
+
+    ring.publish(nBody, ids)
+    publishStats()
+    try:
+        while True:
+            if connection.poll(scheduler.delay()):
+                message = connection.recv()
+                if message == None:
+                    break
+                kind, value = message
+                if kind == 'paused':
+                    scheduler.setPaused(value)
+                elif kind == 'speed':
+                    scheduler.setSpeed(value)
+                elif kind == 'deltatime':
+                    scheduler.setDeltatime(value)
+                elif kind == 'diagnostics':
+                    from .diagnostics import Diagnostics
+                    diagnostics = Diagnostics(nBody, every=value, maxsamples=1000) if value != None else None
+                publishStats()
+                continue
+
+            steps = scheduler.advance()
+            for _ in range(steps):
+                nBody.update(scheduler.deltatime)
+                if diagnostics != None:
+                    diagnostics(nBody)
+                ring.publish(nBody, ids)
+            publishStats()
+    except EOFError:            # the parent exited
+        pass
+    finally:
+        ring.close()
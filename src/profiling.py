@@ -0,0 +1,134 @@
+"""
+Contains the performance instrumentation.
+A Profiler keeps named phase timers and event counters, with rolling windows of their latest samples for rates and percentiles.
+Code is only instrumented while a Profiler is attached (e.g. NBody.setProfiler), so a disabled profiler costs one None check per phase.
+"""
+
+import collections
+import time
+
+
+clock = time.perf_counter
+
+
+class Profiler:
+    """Phase timers and event counters of one thread. Phases are timed as laps: the time since the previous lap (or start) is added to the named phase.
+    Time added with nested=True (a phase timed inside the current lap, e.g. force evaluations within an integrator step) is excluded from the lap it falls in."""
+
+    def __init__(self, window=256):
+        self.window = window        # latest samples kept per phase and event
+        self.reset()
+
+
+    def reset(self):
+        self.totals = dict()        # phase -> total seconds
+        self.calls = dict()         # phase -> number of samples
+        self.samples = dict()       # phase -> latest durations (in s)
+        self.counters = dict()      # event -> count
+        self.events = dict()        # event -> latest event times
+        self.last = clock()
+        self.nested = 0.0
+
+
+    def start(self):
+        self.last = clock()
+        self.nested = 0.0
+
+
+    def lap(self, name):
+        now = clock()
+        self.add(name, now - self.last - self.nested)
+        self.last = now
+        self.nested = 0.0
+
+
+    def add(self, name, seconds, nested=False):
+        if name not in self.totals:
+            self.totals[name], self.calls[name] = 0.0, 0
+            self.samples[name] = collections.deque(maxlen=self.window)
+        self.totals[name] += seconds
+        self.calls[name] += 1
+        self.samples[name].append(seconds)
+        if nested:
+            self.nested += seconds
+
+
+    def count(self, name):
+        if name not in self.counters:
+            self.counters[name] = 0
+            self.events[name] = collections.deque(maxlen=self.window)
+        self.counters[name] += 1
+        self.events[name].append(clock())
+
+
+    def rate(self, name):
+        # Events per second over the latest window (0 before two events).
+        times = list(self.events.get(name, ()))
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+
+    def intervals(self, name):
+        # Seconds between the latest consecutive events (e.g. frame times).
+        times = list(self.events.get(name, ()))
+        return [b - a for a, b in zip(times, times[1:])]
+
+
+    def phase(self, name):
+        # Statistics of a phase: total seconds and calls since the reset, and the mean and percentiles of its latest samples.
+        samples = list(self.samples.get(name, ()))
+        stats = dict(total=self.totals.get(name, 0.0), calls=self.calls.get(name, 0), mean=sum(samples) / len(samples) if samples else 0.0)
+        stats.update(percentiles(samples))
+        return stats
+
+
+    def report(self):
+        # Every phase (with its share of the total time of all phases), counter and rolling event rate.
+        phases = {name: self.phase(name) for name in list(self.totals)}
+        total = sum(stats['total'] for stats in phases.values())
+        for stats in phases.values():
+            stats['share'] = stats['total'] / total if total > 0 else 0.0
+        events = list(self.counters)
+        return dict(phases=phases, counters={name: self.counters[name] for name in events},
+                    rates={name: self.rate(name) for name in events}, intervals={name: percentiles(self.intervals(name)) for name in events})
+
+
+
+class RateMeter:
+    """The rate of a count kept by another thread or process (e.g. the physics steps taken), from samples of it over the latest "window" seconds."""
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.samples = collections.deque()
+
+
+    def sample(self, count, now=None):
+        now = clock() if now == None else now
+        self.samples.append((now, count))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= self.window:
+            self.samples.popleft()
+
+
+    def rate(self):
+        # Count increase per second over the kept samples (0 before two samples).
+        if len(self.samples) < 2 or self.samples[-1][0] == self.samples[0][0]:
+            return 0.0
+        (t0, c0), (t1, c1) = self.samples[0], self.samples[-1]
+        return (c1 - c0) / (t1 - t0)
+
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    # Nearest-rank percentiles of a list of samples, as {'p50': ..., ...} (0 without samples).
+    ordered = sorted(samples)
+    if not ordered:
+        return {'p%d' % p: 0.0 for p in points}
+    return {'p%d' % p: ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))] for p in points}
+
+
+def formatPhases(report, order=None):
+    # "forces 80% 1.23 ms, integration ..." from the phases of a report, largest share first unless an order is given.
+    phases = report['phases']
+    names = [name for name in order if name in phases] if order != None else sorted(phases, key=lambda name: -phases[name]['total'])
+    return ", ".join("%s %.0f%% %.3g ms" % (name, 100 * phases[name]['share'], 1e3 * phases[name]['mean']) for name in names)
@@ -0,0 +1,243 @@
+"""
+Contains the body renderer.
+Every body is drawn from a few shared sphere meshes of increasing detail, held in vertex buffers, picked by the body's projected size on screen. Bodies outside the view frustum are skipped, and bodies smaller than a pixel are drawn as points in a single batched call, as are the test particles.
+The culling and detail selection are vectorized NumPy functions of the eye-space positions; OpenGL is only imported when drawing.
+"""
+
+import ctypes
+
+import numpy as np
+
+
+LEVELS = (8, 16, 32, 64)            # sphere mesh segments (longitudes), from coarse to fine
+THRESHOLDS = (1, 6, 24, 96)         # projected radius (in pixels) from which each level is used; smaller bodies are points
+
+
+def sphereMesh(segments):
+    # Returns (vertices, indices) of a unit UV sphere around the z axis: interleaved float32 rows of position, normal and texture coordinates, and uint32 triangle indices (counterclockwise from outside).
+    # The texture coordinates follow gluSphere: s is 0 at +y, 0.25 at +x, and t goes from 0 at z = -1 to 1 at z = 1.
+    stacks = max(2, segments // 2)
+    s, t = np.meshgrid(np.linspace(0, 1, segments + 1), np.linspace(0, 1, stacks + 1))
+    theta, phi = 2 * np.pi * s, np.pi * t
+    position = np.stack([np.sin(theta) * np.sin(phi), np.cos(theta) * np.sin(phi), -np.cos(phi)], axis=-1)
+
+    vertices = np.concatenate([position, position, np.stack([s, t], axis=-1)], axis=-1).reshape(-1, 8).astype(np.float32)
+
+    row = segments + 1
+    i, j = np.meshgrid(np.arange(stacks), np.arange(segments), indexing='ij')
+    a = (i * row + j).ravel()
+    b, c, d = a + 1, a + row, a + row + 1
+    indices = np.stack([a, c, b, b, c, d], axis=-1).reshape(-1).astype(np.uint32)
+    return vertices, indices
+
+
+def frustumMask(eye, radius, fovy, aspect, znear, zfar):
+    # Returns which spheres (eye-space centers (N, 3), radii (N,)) intersect the view frustum of a perspective projection looking down -z.
+    ty = np.tan(np.radians(fovy) / 2)
+    tx = ty * aspect
+    x, y, z = eye[:, 0], eye[:, 1], eye[:, 2]
+    visible = (-z + radius > znear) & (-z - radius < zfar)
+    for coordinate, tangent in ((x, tx), (y, ty)):
+        norm = np.sqrt(1 + tangent * tangent)
+        visible &= (coordinate + tangent * z) / norm < radius
+        visible &= (-coordinate + tangent * z) / norm < radius
+    return visible
+
+
+def projectedRadius(eye, radius, fovy, height):
+    # Returns the approximate on-screen radius (in pixels) of spheres seen from the origin, for a viewport "height" pixels high. Spheres around the eye are infinitely large.
+    distance = np.linalg.norm(eye, axis=1)
+    focal = height / 2 / np.tan(np.radians(fovy) / 2)
+    with np.errstate(divide='ignore'):
+        return np.where(distance > radius, focal * radius / np.maximum(distance, 1e-300), np.inf)
+
+
+def detailLevels(pixels, thresholds=THRESHOLDS):
+    # Returns the mesh level of every body from its projected radius, -1 for bodies drawn as points.
+    return np.searchsorted(thresholds, pixels, side='right') - 1
+
+
+def cameraView(pos, radius, star, center, unitscale, bodyscale, focusscale, zoomout):
+    # Returns (eye-space positions, drawn radii) of bodies at pos (N, 3) with radii (N,), in m: the camera looks at body "center" from "zoomout" m away along +z,
+    # with every unitscale m one GL unit, and bodies drawn bodyscale times larger (focusscale more for the stars flagged in "star").
+    eye = eyePositions(pos, pos[center], unitscale, zoomout)
+    drawn = bodyscale * radius / unitscale
+    drawn[star] *= focusscale       ## --TEMP--
+    return eye, drawn
+
+
+def eyePositions(pos, target, unitscale, zoomout):
+    # Eye-space positions of points at pos (N, 3), in m, for a camera looking at the point "target" from "zoomout" m away along +z (as in cameraView).
+    eye = (pos - target) / unitscale
+    eye[:, 2] -= zoomout / unitscale
+    return eye
+
+
+def setupScene():
+    # The GL state of every view: black background, depth test, back-face culling and the single light.
+    from OpenGL import GL
+
+    GL.glClearColor(0.0, 0.0, 0.0, 1.0)
+    GL.glClearDepth(1.0)
+
+    GL.glShadeModel(GL.GL_SMOOTH)
+    GL.glEnable(GL.GL_CULL_FACE)
+    GL.glEnable(GL.GL_DEPTH_TEST)
+
+    GL.glEnable(GL.GL_LIGHTING)
+    GL.glLightfv(GL.GL_LIGHT0, GL.GL_POSITION, [10., 4., 10., 1.])
+    GL.glLightfv(GL.GL_LIGHT0, GL.GL_DIFFUSE, [0.8, 1.0, 0.8, 1.0])
+    GL.glLightf(GL.GL_LIGHT0, GL.GL_CONSTANT_ATTENUATION, 0.1)
+    GL.glLightf(GL.GL_LIGHT0, GL.GL_LINEAR_ATTENUATION, 0.05)
+    GL.glEnable(GL.GL_LIGHT0)
+
+
+
+class SphereRenderer:
+    """Draws bodies as textured spheres from shared level-of-detail meshes, with frustum culling and point rendering of sub-pixel bodies.
+    create() needs a current GL context. The projection parameters must match the GL projection (see setProjection)."""
+
+    def __init__(self, levels=LEVELS, thresholds=THRESHOLDS, pointsize=2.0, particlesize=1.0, particlecolor=(0.6, 0.55, 0.5)):
+        self.levels = levels
+        self.thresholds = thresholds
+        self.pointsize = pointsize
+        self.particlesize = particlesize        # point size and color of the test particles
+        self.particlecolor = particlecolor
+        self.meshes = []            # (vertex buffer, index buffer, index count) per level
+        self.fovy, self.aspect, self.znear, self.zfar, self.height = 45.0, 1.0, 0.01, 100000.0, 900
+        self.stats = dict(visible=0, culled=0, points=0, spheres=[0] * len(levels), particles=0)
+
+
+    def setProjection(self, fovy, aspect, znear, zfar, height):
+        self.fovy, self.aspect, self.znear, self.zfar, self.height = fovy, aspect, znear, zfar, height
+
+
+    def create(self):
+        # Uploads the sphere meshes to vertex buffers.
+        from OpenGL import GL
+
+        for segments in self.levels:
+            vertices, indices = sphereMesh(segments)
+            buffers = GL.glGenBuffers(2)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffers[0])
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL.GL_STATIC_DRAW)
+            GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, buffers[1])
+            GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL.GL_STATIC_DRAW)
+            self.meshes.append((buffers[0], buffers[1], len(indices)))
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
+
+
+    def classify(self, eye, radius):
+        # Returns (indices of the visible bodies, their mesh levels, -1 for points).
+        visible = np.flatnonzero(frustumMask(eye, radius, self.fovy, self.aspect, self.znear, self.zfar))
+        levels = detailLevels(projectedRadius(eye[visible], radius[visible], self.fovy, self.height), self.thresholds)
+        self.stats['visible'], self.stats['culled'] = len(visible), len(eye) - len(visible)
+        self.stats['points'] = int(np.count_nonzero(levels < 0))
+        self.stats['spheres'] = np.bincount(levels[levels >= 0], minlength=len(self.levels)).tolist()
+        return visible, levels
+
+
+    def draw(self, eye, radius, angle, obliquity, textures):
+        # Draws the bodies with the current modelview matrix as the eye space. eye (N, 3) are the centers and radius (N,) the drawn radii, in eye-space units;
+        # angle and obliquity (N,) are in degrees, and textures is a list of textures.Texture handles (their ids are bound, their colors tint the points).
+        from OpenGL import GL
+
+        visible, levels = self.classify(eye, radius)
+
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glEnableClientState(GL.GL_NORMAL_ARRAY)
+        GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
+        for level, (vertexbuffer, indexbuffer, count) in enumerate(self.meshes):
+            bodies = visible[levels == level]
+            if len(bodies) == 0:
+                continue
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, vertexbuffer)
+            GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, indexbuffer)
+            GL.glVertexPointer(3, GL.GL_FLOAT, 32, ctypes.c_void_p(0))
+            GL.glNormalPointer(GL.GL_FLOAT, 32, ctypes.c_void_p(12))
+            GL.glTexCoordPointer(2, GL.GL_FLOAT, 32, ctypes.c_void_p(24))
+
+            for i in bodies.tolist():
+                GL.glPushMatrix()
+                GL.glTranslatef(*eye[i])
+                GL.glScalef(radius[i], radius[i], radius[i])
+                GL.glRotatef(obliquity[i], -0.25, -1.0, 0.0)
+                GL.glRotatef(angle[i], 0.0, 0.0, 1.0)
+                GL.glBindTexture(GL.GL_TEXTURE_2D, textures[i].id)
+                GL.glDrawElements(GL.GL_TRIANGLES, count, GL.GL_UNSIGNED_INT, ctypes.c_void_p(0))
+                GL.glPopMatrix()
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
+        GL.glDisableClientState(GL.GL_NORMAL_ARRAY)
+        GL.glDisableClientState(GL.GL_TEXTURE_COORD_ARRAY)
+        GL.glDisable(GL.GL_TEXTURE_2D)
+
+        points = visible[levels < 0]
+        if len(points):
+            self.drawPoints(eye[points], np.array([textures[i].color for i in points.tolist()], dtype=np.float32))
+        GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+
+
+    def drawParticles(self, eye):
+        # Draws test particles (eye-space positions (M, 3)) as a point cloud of one color, in a single call, skipping those outside the view frustum.
+        from OpenGL import GL
+
+        visible = frustumMask(eye, np.zeros(len(eye)), self.fovy, self.aspect, self.znear, self.zfar)
+        self.stats['particles'] = int(np.count_nonzero(visible))
+        if self.stats['particles'] == 0:
+            return
+        colors = np.empty((self.stats['particles'], 3), dtype=np.float32)
+        colors[:] = self.particlecolor
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        self.drawPoints(eye[visible], colors, self.particlesize)
+        GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+
+
+    def drawPoints(self, eye, colors, size=None):
+        # Draws every sub-pixel body (or particle) as one smooth point, unlit, in a single call.
+        from OpenGL import GL
+
+        GL.glPushAttrib(GL.GL_ENABLE_BIT | GL.GL_POINT_BIT)
+        GL.glDisable(GL.GL_LIGHTING)
+        GL.glEnable(GL.GL_POINT_SMOOTH)
+        GL.glPointSize(self.pointsize if size == None else size)
+        GL.glEnableClientState(GL.GL_COLOR_ARRAY)
+        GL.glVertexPointer(3, GL.GL_FLOAT, 0, np.ascontiguousarray(eye, dtype=np.float32))
+        GL.glColorPointer(3, GL.GL_FLOAT, 0, colors)
+        GL.glDrawArrays(GL.GL_POINTS, 0, len(eye))
+        GL.glDisableClientState(GL.GL_COLOR_ARRAY)
+        GL.glPopAttrib()
+
+
+
+class OffscreenContext:
+    """A software-rendered (OSMesa) OpenGL context drawing into memory, e.g. with Mesa's llvmpipe, for tests and offscreen rendering.
+    PYOPENGL_PLATFORM must be set to 'osmesa' before OpenGL is first imported in the process."""
+
+    def __init__(self, width, height):
+        from OpenGL import GL, arrays, osmesa
+
+        self.width, self.height = width, height
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not self.context:
+            raise RuntimeError("Could not create an OSMesa context.")
+        self.buffer = arrays.GLubyteArray.zeros((height, width, 4))
+        if not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL.GL_UNSIGNED_BYTE, width, height):
+            raise RuntimeError("Could not make the OSMesa context current.")
+
+
+    def pixels(self):
+        # Returns the rendered image as a (height, width, 3) uint8 array, top row first.
+        from OpenGL import GL
+
+        GL.glFinish()
+        return np.array(self.buffer, dtype=np.uint8).reshape(self.height, self.width, 4)[::-1, :, :3].copy()
+
+
+    def close(self):
+        from OpenGL import osmesa
+
+        osmesa.OSMesaDestroyContext(self.context)
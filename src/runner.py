@@ -0,0 +1,77 @@
+"""
+Contains the headless simulation runner.
+It steps an NBody with a fixed dt, without any rendering or wall-clock timing, and reports its throughput. Nothing here imports OpenGL.
+"""
+
+import math
+import time
+
+import xml.etree.ElementTree as ET
+
+from . import nbody as nb
+from .vector import Vector
+
+
+def run(nBody, deltatime, steps=None, until=None, callback=None):
+    # Steps nBody by deltatime for "steps" steps, or until its simulated time reaches "until" (the last step may overshoot it by less than deltatime).
+    # callback(nBody, step) is called after every step. Returns the run statistics (see runStats).
+    if steps == None:
+        if until == None:
+            raise ValueError("Either a number of steps or an end time must be given.")
+        steps = max(0, math.ceil((until - nBody.time) / deltatime - 1e-9))
+
+    starttime = nBody.time
+    start = time.perf_counter()
+    for step in range(steps):
+        nBody.update(deltatime)
+        if callback != None:
+            callback(nBody, step)
+    wall = time.perf_counter() - start
+
+    return runStats(nBody, steps, nBody.time - starttime, wall)
+
+
+def runStats(nBody, steps, simulated, wall):
+    stats = dict()
+    stats['bodies'] = nBody.N
+    stats['particles'] = 0 if nBody.particles == None else nBody.particles.N
+    stats['steps'] = steps
+    stats['time'] = simulated             # simulated time (in s)
+    stats['wall'] = wall                  # wall-clock time (in s)
+    stats['stepspersec'] = steps / wall if wall > 0 else math.inf
+    stats['bodystepspersec'] = nBody.N * stats['stepspersec']
+    return stats
+
+
+def formatStats(stats):
+    particles = " and %d test particles" % stats['particles'] if stats['particles'] else ""
+    return "%d bodies%s, %d steps (%.6g s simulated) in %.3f s: %.1f steps/s, %.4g bodies x steps/s" % (stats['bodies'], particles, stats['steps'], stats['time'], stats['wall'], stats['stepspersec'], stats['bodystepspersec'])
+
+
+
+def loadScene(filepath, nBody=None):
+    # Adds the bodies of an XML scene file to an NBody (a new one by default) and returns it.
+    # Each <body> is either a prefab from the astronomical data (prefab="Earth") or fully described (name, type, <mass>, <radius>).
+    # Optional <pos>, <vel> (three numbers, SI units), <angle> and <angular_velocity> (deg, deg/s) set its initial conditions.
+    if nBody == None:
+        nBody = nb.NBody()
+
+    for element in ET.parse(filepath).getroot().findall('body'):
+        if element.get('prefab') != None:
+            body = nb.prefabBody(element.get('prefab'))
+            if element.get('name') != None:
+                body.name = element.get('name')
+        else:
+            body = nb.Body(element.get('name'), float(element.find('mass').text), float(element.find('radius').text), body_type=element.get('type'))
+
+        conditions = dict()
+        for tag in ['pos', 'vel']:
+            if element.find(tag) != None:
+                conditions[tag] = Vector(*[float(x) for x in element.find(tag).text.split()])
+        for tag in ['angle', 'angular_velocity']:
+            if element.find(tag) != None:
+                conditions[tag] = float(element.find(tag).text)
+
+        nBody.addBody(body(**conditions))
+
+    return nBody
@@ -0,0 +1,106 @@
+"""
+Contains the fixed-timestep physics scheduler of the interactive simulation.
+Wall-clock time, scaled by the simulation speed, accumulates into a budget of simulated time that is spent in steps of a fixed dt,
+so that results do not depend on the CPU load or the frame rate. The physics thread sleeps until a step is due and blocks while paused.
+"""
+
+import threading
+import time
+
+
+class Scheduler:
+    """Accumulator for fixed physics steps of "deltatime" simulated seconds at "speed" simulated seconds per wall-clock second.
+    Every wake-up takes all the steps that are due, but at most "maxsubsteps": under load the backlog beyond that is dropped (and counted in self.dropped),
+    so the simulation slows down instead of falling further and further behind."""
+
+    def __init__(self, deltatime, speed=1.0, maxsubsteps=8, paused=False, clock=time.perf_counter):
+        self.deltatime = deltatime
+        self.speed = speed
+        self.maxsubsteps = maxsubsteps
+        self.clock = clock
+
+        self.accumulator = 0.0          # simulated time due but not stepped yet (in s)
+        self.last = clock()             # wall-clock time of the last advance
+        self.paused = paused
+        self.stopped = False
+        self.steps = 0                  # steps handed out
+        self.dropped = 0.0              # simulated time skipped to cap the catch-up work (in s)
+        self.condition = threading.Condition()
+
+
+    def accumulate(self, now=None):
+        # Adds the wall-clock time since the last call (none while paused) to the accumulator.
+        now = self.clock() if now == None else now
+        if not self.paused:
+            self.accumulator += (now - self.last) * self.speed
+        self.last = now
+
+
+    def advance(self, now=None):
+        # Accumulates and returns the number of steps due now, taking them from the accumulator. None are due while paused.
+        self.accumulate(now)
+        if self.paused:
+            return 0
+        cap = self.maxsubsteps * self.deltatime
+        if self.accumulator > cap:
+            self.dropped += self.accumulator - cap
+            self.accumulator = cap
+        steps = int(self.accumulator // self.deltatime)
+        self.accumulator -= steps * self.deltatime
+        self.steps += steps
+        return steps
+
+
+    def delay(self, now=None):
+        # Wall-clock seconds until the next step is due (0 if one is due now), or None while paused.
+        if self.paused:
+            return None
+        now = self.clock() if now == None else now
+        return max(0.0, (self.deltatime - self.accumulator) / self.speed - (now - self.last))
+
+
+    def wait(self):
+        # Physics side: sleeps until at least one step is due (blocking while paused), and returns the number of steps to take. Returns 0 once stopped.
+        with self.condition:
+            while not self.stopped:
+                steps = self.advance()
+                if steps > 0:
+                    return steps
+                self.condition.wait(self.delay())
+            return 0
+
+
+    def alpha(self, now=None):
+        # Render side: how far the simulation is between the latest two steps, in [0, 1], including the wall-clock time since the last advance.
+        now = self.clock() if now == None else now
+        due = self.accumulator if self.paused else self.accumulator + (now - self.last) * self.speed
+        return min(max(due / self.deltatime, 0.0), 1.0)
+
+
+    def setPaused(self, paused):
+        with self.condition:
+            self.accumulate()
+            self.paused = paused
+            self.condition.notify_all()
+
+
+    def setSpeed(self, speed):
+        with self.condition:
+            self.accumulate()                   # the time so far counts at the old speed
+            self.speed = speed
+            self.condition.notify_all()
+
+
+    def setDeltatime(self, deltatime):
+        # The time accumulated so far is rescaled to the same fraction of the new step, so that a smaller step does not turn it into extra steps.
+        with self.condition:
+            self.accumulate()
+            self.accumulator *= deltatime / self.deltatime
+            self.deltatime = deltatime
+            self.condition.notify_all()
+
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
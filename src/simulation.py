@@ -5,23 +5,27 @@ It deals with the graphics and timing of the simulation.
 
 import os
 import sys
-import time
 import math
 import threading
 
+import numpy as np
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
-from PIL import Image
 
 from . import nbody as nb
 from . import data_parse as dp
+from . import profiling
+from . import textures
+from .renderer import SphereRenderer, cameraView, eyePositions, setupScene
+from .scheduler import Scheduler
+from .snapshot import InterpolationBuffer, interpolate, interpolateParticles
 from .vector import Vector
 
 
 class AstrophysicsSimulation():
     """Main astrophysics simulation class"""
-    def __init__(self, size, sim_speed=None, title=None):
+    def __init__(self, size, sim_speed=None, title=None, engine=None, integrator=None, deltatime=None, process=False):
         # Defaults
         if sim_speed == None:
             sim_speed = 1
@@ -34,14 +38,31 @@ class AstrophysicsSimulation():
 
         self.unitscale = 400000000      # unit of scale (in m) every 1 unit
         self.unittime = sim_speed       # unit of sim time (in sec) every 1 sec (actual, dynamically changes)
-        self.lastTime = 0
-        self.dt = 0
-
-        self.NBody = nb.NBody()
-        self.displaylists = []
+        self.dt = sim_speed / 60 if deltatime == None else deltatime      # fixed physics step (in sim sec), 60 steps every 1 sec by default
+        self.scheduler = Scheduler(self.dt, self.unittime, paused=True)     # hands the physics thread the steps due
+        self.process = process          # Flag for physics to run in a child process (a PhysicsProcess replaces the scheduler and snapshots once started)
+        self.steprate = profiling.RateMeter()   # achieved physics steps/s
+
+        self.NBody = nb.NBody(engine=engine, integrator=integrator)       # engine and integrator names switch to array-backed physics
+        self.snapshots = InterpolationBuffer()      # latest two physics states handed to the renderer
+        self.textures = None            # TextureManager, once the GL context exists
+        self.bodytextures = dict()      # body -> texture
+        self.renderer = SphereRenderer()    # level-of-detail sphere meshes, culling and point rendering
+        self.bodystatics = None         # (bodies, obliquity, is star, texture) of the bodies of the latest frames
+        self.drawpos = np.zeros((0, 3))     # positions and angles interpolated between the latest two states
+        self.drawangle = np.zeros(0)
+        self.drawparticles = np.zeros((0, 3))       # test particle positions, likewise
+
+        self.profiler = None            # Profiler of the render thread, only while stats are enabled (the physics phases are in self.NBody.profiler)
+        self.statsoverlay = False       # Flag for the stats to be drawn over the view
+        self.statsinterval = None       # seconds between stats log lines (None for no log)
+        self.statslogged = 0
+        self.diagnostics = None         # Diagnostics sampled by the physics thread (or the PhysicsProcess sampling them), only while enabled
+        self.diagnosticsevery = None    # steps between diagnostics samples requested by the view (None for none), applied by the physics thread between steps
 
         self.znear = 0.01
         self.zfar = 100000.0
+        self.fovy = 45.0
 
         self.done = False               # Flag for program to end
         self.donesetup = False          # Flag for physics to start
@@ -51,6 +72,7 @@ class AstrophysicsSimulation():
         self.focusscale = 1.0           # To make stars smaller --TEMP--?
 
         self.centeredBodyIndex = 0        # default center of view
+        self.centeredradius = 0.0       # radius of the viewed body in the latest frame
 
         self.camerapos = Vector(0.0, 0.0, 0.0)
         self.cameralook = Vector(0.0, 0.0, 0.0)
@@ -81,36 +103,29 @@ class AstrophysicsSimulation():
         glutReshapeFunc(self.reshape_callback)
         
         # Lighting +
-        glClearColor(0.0, 0.0, 0.0, 1.0)
-        glClearDepth(1.0)
-        
-        glShadeModel(GL_SMOOTH)
-        glEnable(GL_CULL_FACE)
-        glEnable(GL_DEPTH_TEST)
-
-        glEnable(GL_LIGHTING)
-        lightZeroPosition = [10., 4., 10., 1.]
-        lightZeroColor = [0.8, 1.0, 0.8, 1.0]
-        glLightfv(GL_LIGHT0, GL_POSITION, lightZeroPosition)
-        glLightfv(GL_LIGHT0, GL_DIFFUSE, lightZeroColor)
-        glLightf(GL_LIGHT0, GL_CONSTANT_ATTENUATION, 0.1)
-        glLightf(GL_LIGHT0, GL_LINEAR_ATTENUATION, 0.05)
-        glEnable(GL_LIGHT0)
+        setupScene()
 
         # Load skybox
         #self.load_skybox()
 
-        # Load body textures
+        # Load body textures (decoded in the background, drawn with a fallback texture until ready)
+        self.textures = textures.TextureManager()
+        self.renderer.create()
         for body in self.NBody:
             self.addBodyTexture(body.name.lower() + '.jpg')        # Texture map convention
 
         self.reshape_callback(self.width, self.height)          # Initialize perspective
+        self.snapshots.publish(self.NBody)                      # Initial state for the first frames
 
 
     def addBody(self, body):
         self.NBody.addBody(body)
 
 
+    def addParticles(self, particles):
+        self.NBody.addParticles(particles)
+
+
     def addPrefabBody(self, name):
         self.addBody(nb.prefabBody(name))
 
@@ -120,26 +135,10 @@ class AstrophysicsSimulation():
             self.addPrefabBody(name)
 
 
-    def addBodyTexture(self, texture_filename, i=None):        
-        if i == None:
-            self.displaylists.append(glGenLists(1))
-            glNewList(self.displaylists[-1], GL_COMPILE)
-        else:
-            self.displaylists[i] = glGenLists(1)
-            glNewList(self.displaylists[i], GL_COMPILE)
-
-        tex = load_texture(os.path.join('resources', 'maps', texture_filename))
-        
-        qobj = gluNewQuadric()
-        gluQuadricTexture(qobj, GL_TRUE)
-        
-        glEnable(GL_TEXTURE_2D)
-        glBindTexture(GL_TEXTURE_2D, tex)
-        glBegin(GL_TRIANGLES)
-        gluSphere(qobj, 1, 50, 50)
-        gluDeleteQuadric(qobj)
-        glDisable(GL_TEXTURE_2D)
-        glEndList()
+    def addBodyTexture(self, texture_filename, i=None):
+        # Sets the texture of body i (by default the first body without one).
+        body = self.NBody[len(self.bodytextures) if i == None else i]
+        self.bodytextures[body] = self.textures.texture(os.path.join(textures.MAPS, texture_filename))
 
 
     # def load_skybox(self):
@@ -166,6 +165,11 @@ class AstrophysicsSimulation():
 
 
     def draw(self):
+        profiler = self.profiler
+        if profiler != None:
+            profiler.count('frames')
+            profiler.start()
+
         # Reset The View
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glLoadIdentity()
@@ -176,60 +180,191 @@ class AstrophysicsSimulation():
         # glRotatef(-self.x, 0.0, 0.0, 1.0)
         
         # Set title
+        self.steprate.sample(self.scheduler.steps)
         time, timeunit = getTimeUnit(self.dt)
-        glutSetWindowTitle(self.title + bytes(": dt = " + str(time), 'utf-8') + timeunit)
-        
-
-        # Make copy of Nbody class
-        nBody = self.NBody.__copy__()
-
-        #CAMERA
-        if nBody.N > 0:
-            glTranslatef(-nBody[self.centeredBodyIndex].pos.x/self.unitscale, -nBody[self.centeredBodyIndex].pos.y/self.unitscale, -(nBody[self.centeredBodyIndex].pos.z + self.zoomout)/self.unitscale)
-            glPushMatrix()
-            glRotatef(0, 1.0, 0.0, 0.0)
-
-
-        # Draw all display lists
-        for i, dl in enumerate(self.displaylists):
-            # Get position
-            x, y, z = nBody[i].pos.x/self.unitscale, nBody[i].pos.y/self.unitscale, nBody[i].pos.z/self.unitscale
-            
-            # Get scaling
-            scale = self.bodyscale * nBody[i].radius / self.unitscale
-            if nBody[i].body_type == 'star':     ## --TEMP--
-                scale *= self.focusscale
-
-            glPushMatrix()
-           
-            # Update position and scale
-            glTranslatef(x, y, z)
-            glScalef(scale, scale, scale)
-
-            # Update rotation
-            glRotatef(nBody[i].obliquity,-0.25,-1.0,0.0)
-            glRotatef(nBody[i].angle, 0.0, 0.0, 1.0)
-            
-            # Display body
-            glCallList(dl)
-            
-            glPopMatrix()
+        title = self.title + bytes(": dt = " + str(time), 'utf-8') + timeunit
+        title += bytes(" | %.1f steps/s" % self.steprate.rate() if profiler == None else " | " + self.statsSummary(), 'utf-8')
+        errors = self.energyErrors()
+        if errors != None:
+            title += bytes(" | dE/E = %.2e (max %.2e)" % errors, 'utf-8')
+        glutSetWindowTitle(title)
+        if profiler != None:
+            profiler.lap('title')
+
+        # Upload the textures decoded since the last frame
+        self.textures.poll()
+        if profiler != None:
+            profiler.lap('textures')
+
+        # Latest two published states (not copied, and not written by physics while drawn), interpolated to the time since the last step
+        previous, frame = self.snapshots.latestTwo()
+        N = frame.N
+        if len(self.drawangle) != N:
+            self.drawpos, self.drawangle = np.zeros((N, 3)), np.zeros(N)
+        if len(self.drawparticles) != len(frame.particles):
+            self.drawparticles = np.zeros(frame.particles.shape)
+        alpha = self.scheduler.alpha()
+        pos, angle = interpolate(previous, frame, alpha, self.drawpos, self.drawangle)
+        particles = interpolateParticles(previous, frame, alpha, self.drawparticles)
+
+        # Camera: eye-space positions, centered on the viewed body and moved back by the zoom, and scaling
+        if N > 0:
+            c = self.centeredBodyIndex if self.centeredBodyIndex < N else 0
+            self.centeredradius = frame.radius[c]
+            obliquity, star, bodytextures = self.bodyStatics(frame.bodies)
+            eye, radius = cameraView(pos, frame.radius, star, c, self.unitscale, self.bodyscale, self.focusscale, self.zoomout)
+            if profiler != None:
+                profiler.lap('snapshot')
+
+            # Draw all bodies (culled, with a detail level for their size on screen), then the test particles as a point cloud
+            self.renderer.draw(eye, radius, angle, obliquity, bodytextures)
+            if len(particles):
+                self.renderer.drawParticles(eyePositions(particles, pos[c], self.unitscale, self.zoomout))
+
+        # Stats
+        if profiler != None:
+            if self.statsoverlay:
+                drawText(self.statsLines(), 10, glutGet(GLUT_WINDOW_HEIGHT) - 20)
+            if self.statsinterval != None and profiling.clock() - self.statslogged >= self.statsinterval:
+                self.statslogged = profiling.clock()
+                print(self.statsSummary(phases=True))
 
         # Clean up
-        glPopMatrix()
         glFlush()
+        if profiler != None:
+            profiler.lap('gl')
 
         glutSwapBuffers()
+        if profiler != None:
+            profiler.lap('swap')
+
+
+    def enableStats(self, overlay=False, loginterval=None):
+        # Times the physics and render phases and shows the rolling stats in the window title, over the view if overlay, and in a log line every loginterval seconds.
+        # In process mode only the render phases are timed.
+        if not self.process:
+            self.NBody.setProfiler()
+        self.profiler = profiling.Profiler()
+        self.statsoverlay = overlay
+        self.statsinterval = loginterval
+        self.statslogged = profiling.clock()
+
+
+    def enableDiagnostics(self, every=100):
+        # Samples the energy and momenta every "every" physics steps, and shows the relative energy error in the window title.
+        # The physics thread (or process) starts sampling before its next step, so that the first sample sees a whole state.
+        self.diagnosticsevery = every
+        if self.process:
+            self.scheduler.setDiagnostics(every)
+            self.diagnostics = self.scheduler
+
+
+    def disableDiagnostics(self):
+        self.diagnosticsevery = None
+        if self.process:
+            self.scheduler.setDiagnostics(None)
+            self.diagnostics = None
+
+
+    def updateDiagnostics(self):
+        # Physics thread: starts or stops sampling as the view last requested, and returns the Diagnostics to sample (or None).
+        diagnostics, every = self.diagnostics, self.diagnosticsevery
+        if every != (None if diagnostics == None else diagnostics.every):
+            if diagnostics != None:
+                diagnostics.watchPotentials(self.NBody, False)
+            if every == None:
+                diagnostics = None
+            else:
+                from .diagnostics import Diagnostics
+                diagnostics = Diagnostics(self.NBody, every=every, maxsamples=1000)
+            self.diagnostics = diagnostics
+        return diagnostics
+
+
+    def energyErrors(self):
+        # The latest and largest relative energy errors of the diagnostics, or None without them (or before their second sample).
+        diagnostics = self.diagnostics
+        if diagnostics == None or self.diagnosticsevery == None:         # also once disabled, before the physics thread drops them
+            return None
+        if self.process:
+            return diagnostics.energyErrors()
+        if len(diagnostics.energies) < 2:
+            return None
+        errors = diagnostics.energyErrors()
+        return errors[-1], errors.max()
+
+
+    def disableStats(self):
+        self.NBody.setProfiler(None)
+        self.profiler = None
+
+
+    def stats(self):
+        # The physics and render profiler reports (see profiling.Profiler.report), or None if stats are disabled. The physics report is None in process mode.
+        physics = self.physicsProfiler()
+        if self.profiler == None or (physics == None and not self.process):
+            return None
+        return {'physics': None if physics == None else physics.report(), 'render': self.profiler.report()}
+
+
+    def physicsProfiler(self):
+        # The profiler of the physics phases, None while stats are disabled and in process mode (the parent's NBody is never stepped there).
+        return None if self.process else self.NBody.profiler
+
+
+    def statsSummary(self, phases=False):
+        # "N steps/s, frame p50/p90/p99 ms", with the share and mean time of every phase if phases.
+        physics, render = self.physicsProfiler(), self.profiler
+        frames = profiling.percentiles(render.intervals('frames'))
+        summary = "%.1f steps/s, %.1f fps, frame %.1f/%.1f/%.1f ms" % (self.steprate.rate(), render.rate('frames'), 1e3 * frames['p50'], 1e3 * frames['p90'], 1e3 * frames['p99'])
+        if self.scheduler.dropped > 0:
+            summary += ", %.3g s skipped" % self.scheduler.dropped          # simulated time the physics could not keep up with
+        if phases:
+            if physics != None:
+                summary += " | physics: %s" % profiling.formatPhases(physics.report())
+            summary += " | render: %s" % profiling.formatPhases(render.report())
+        return summary
+
+
+    def statsLines(self):
+        # The overlay text: the summary, then one line per phase.
+        lines = [self.statsSummary()]
+        for name, profiler in (('physics', self.physicsProfiler()), ('render', self.profiler)):
+            if profiler == None:
+                continue
+            phases = profiler.report()['phases']
+            for phase in sorted(phases, key=lambda phase: -phases[phase]['total']):
+                lines.append("%s %-11s %5.1f%% %9.3f ms  p99 %9.3f ms" % (name, phase, 100 * phases[phase]['share'], 1e3 * phases[phase]['mean'], 1e3 * phases[phase]['p99']))
+        return lines
+
+
+    def bodyStatics(self, bodies):
+        # The obliquities, star flags and textures of the bodies of a frame, gathered again only when the bodies change (e.g. after a merge).
+        # Bodies added since the setup get the texture of their name.
+        if self.bodystatics == None or self.bodystatics[0] != bodies:
+            for body in bodies:
+                if body not in self.bodytextures:
+                    self.bodytextures[body] = self.textures.texture(os.path.join(textures.MAPS, body.name.lower() + '.jpg'))
+            self.bodystatics = (list(bodies), np.array([body.obliquity for body in bodies], dtype=float),
+                                np.array([body.body_type == 'star' for body in bodies], dtype=bool), [self.bodytextures[body] for body in bodies])
+        return self.bodystatics[1:]
 
 
     def physics_thread(self):
-        self.lastTime = time.clock()         # for physics deltatime calulation (in seconds)
+        # Takes the fixed steps the scheduler hands out, publishing every state, and sleeps in between (blocking while paused).
+        scheduler = self.scheduler
         while not self.done:
-            t = time.clock()
-            if not self.static:
-                self.dt = (t - self.lastTime) * self.unittime
-                self.NBody.update(self.dt)
-            self.lastTime = t
+            for _ in range(scheduler.wait()):
+                diagnostics = self.updateDiagnostics()
+                self.NBody.update(scheduler.deltatime)
+                if diagnostics != None:
+                    diagnostics(self.NBody)
+                profiler = self.NBody.profiler
+                if profiler != None:
+                    profiler.start()
+                self.snapshots.publish(self.NBody)
+                if profiler != None:
+                    profiler.lap('publish')
         glutLeaveMainLoop()
 
 
@@ -244,17 +379,31 @@ class AstrophysicsSimulation():
 
     def main(self):
         self.setup()                                            # Initialize openGL
-        
-        phys = threading.Thread(target=self.physics_thread)     # Create physics thread
-        #prephys = threading.Thread(target=self.prephysics_thread)
-        
-        phys.start()            # Start physics thread
-        #prephys.start()
-        
-        glutMainLoop()          # Start graphics loop on main thread
+        start = profiling.clock()
+
+        if self.process:
+            # Physics in a child process, publishing to shared memory and controlled over a pipe (it stands in for the scheduler and the snapshots)
+            from .physicsprocess import PhysicsProcess
+            self.scheduler = self.snapshots = PhysicsProcess(self.NBody, self.dt, self.unittime, paused=self.static)
+            glutMainLoop()
+            steps = self.scheduler.steps
+            self.scheduler.stop()
+        else:
+            phys = threading.Thread(target=self.physics_thread)     # Create physics thread
+            #prephys = threading.Thread(target=self.prephysics_thread)
+
+            phys.start()            # Start physics thread
+            #prephys.start()
+
+            glutMainLoop()          # Start graphics loop on main thread
 
-        #prephys.join()
-        phys.join()             # Clean up physics thread when done
+            #prephys.join()
+            phys.join()             # Clean up physics thread when done
+            steps = self.scheduler.steps
+        self.textures.close()
+
+        elapsed = profiling.clock() - start
+        print("%d physics steps in %.1f s (%.1f steps/s, %s)" % (steps, elapsed, steps / elapsed if elapsed > 0 else 0, "child process" if self.process else "physics thread"))
 
 
     def mouse_callback(self, *args):
@@ -262,7 +411,7 @@ class AstrophysicsSimulation():
 
         if args[0] == 4 and args[1] == 0:
             self.zoomout *= zoomspeed
-        elif (args[0] == 3 and args[1] == 0) and self.zoomout > (2 * self.znear + self.NBody[self.centeredBodyIndex].radius/self.unitscale):
+        elif (args[0] == 3 and args[1] == 0) and self.zoomout > (2 * self.znear + self.centeredradius/self.unitscale):
             self.zoomout /= zoomspeed
 
 
@@ -271,29 +420,53 @@ class AstrophysicsSimulation():
         
         if args[0] == b'\x1b':
             self.done = True
+            self.scheduler.stop()
+            if self.process:
+                glutLeaveMainLoop()             # no physics thread to leave it
         
         elif args[0] == b' ':
             self.static = not self.static
+            self.scheduler.setPaused(self.static)
         
         elif args[0] == b'+':
             self.centeredBodyIndex += 1
-            if (self.centeredBodyIndex >= self.NBody.N):
+            if (self.centeredBodyIndex >= len(self.drawangle)):        # bodies of the latest frame
                 self.centeredBodyIndex = 0
         elif args[0] == b'-':
             self.centeredBodyIndex -= 1
             if (self.centeredBodyIndex < 0):
-                self.centeredBodyIndex = self.NBody.N - 1
+                self.centeredBodyIndex = len(self.drawangle) - 1
         
         elif args[0] == b't':
             self.unittime *= speedspeed
+            self.scheduler.setSpeed(self.unittime)
         elif args[0] == b'g':
             self.unittime /= speedspeed
+            self.scheduler.setSpeed(self.unittime)
+        elif args[0] == b'y':
+            self.dt *= speedspeed
+            self.scheduler.setDeltatime(self.dt)
+        elif args[0] == b'h':
+            self.dt /= speedspeed
+            self.scheduler.setDeltatime(self.dt)
 
         elif args[0] == b'u':
             self.bodyscale *= scalespeed
         elif args[0] == b'j':
             self.bodyscale /= scalespeed
 
+        elif args[0] == b'p':
+            if self.profiler == None:
+                self.enableStats(overlay=True)
+            else:
+                self.disableStats()
+
+        elif args[0] == b'e':
+            if self.diagnosticsevery == None:
+                self.enableDiagnostics()
+            else:
+                self.disableDiagnostics()
+
         elif args[0] == b'o':
             self.focusscale *= scalespeed
         elif args[0] == b'l':
@@ -308,26 +481,26 @@ class AstrophysicsSimulation():
         glMatrixMode(GL_PROJECTION)
         glLoadIdentity()
         glOrtho(0, self.width, 0, self.height, self.zfar, self.zfar)
-        gluPerspective(45.0, float(width) / float(height), self.znear, self.zfar)
+        gluPerspective(self.fovy, float(width) / float(height), self.znear, self.zfar)
+        self.renderer.setProjection(self.fovy, float(width) / float(height), self.znear, self.zfar, height)
 
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
 
 
 
-def load_texture(filename):
-    img = Image.open(filename).rotate(180).transpose(Image.FLIP_LEFT_RIGHT)
-    img_data = img.tobytes()
-    textID = glGenTextures(1)
-    glBindTexture(GL_TEXTURE_2D, textID)
-    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
-    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
-    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
-    glTexEnvf(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_DECAL)
-    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, img.size[0], img.size[1], 0, GL_RGB, GL_UNSIGNED_BYTE, img_data)
-    return textID
+def drawText(lines, x, y):
+    # Draws lines of text from window position (x, y) downwards, unlit and over everything.
+    glPushAttrib(GL_ENABLE_BIT | GL_CURRENT_BIT)
+    glDisable(GL_LIGHTING)
+    glDisable(GL_TEXTURE_2D)
+    glDisable(GL_DEPTH_TEST)
+    glColor3f(0.8, 1.0, 0.8)
+    for k, line in enumerate(lines):
+        glWindowPos2i(x, y - 15 * k)
+        for character in line:
+            glutBitmapCharacter(GLUT_BITMAP_9_BY_15, ord(character))
+    glPopAttrib()
 
 
 def getTimeUnit(time):
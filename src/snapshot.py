@@ -0,0 +1,154 @@
+"""
+Contains the triple-buffered snapshot handoff between the physics and render threads.
+The physics thread publishes into preallocated frames and the renderer reads the latest completed one, without copying the NBody or allocating per frame.
+An InterpolationBuffer also keeps the frame before it, so that the renderer can draw the bodies between the latest two physics steps.
+"""
+
+import threading
+
+import numpy as np
+
+
+class Frame:
+    """A preallocated snapshot of what the renderer needs from an NBody: body positions (N, 3), radii (N,) and angles (N,), in SI units and degrees,
+    the list of bodies of its rows (e.g. for their textures), taken when the frame is allocated for a new body count, and the positions of its M test particles (M, 3)."""
+
+    def __init__(self, N, bodies=(), M=0):
+        self.N = N
+        self.bodies = list(bodies)
+        self.pos = np.zeros((N, 3))
+        self.radius = np.zeros(N)
+        self.angle = np.zeros(N)
+        self.particles = np.zeros((M, 3))
+        self.time = 0
+        self.serial = 0         # number of the publish that filled this frame
+
+
+    def fill(self, nBody):
+        if nBody.state != None:
+            np.copyto(self.pos, nBody.state.pos)
+            np.copyto(self.radius, nBody.state.radius)
+            np.copyto(self.angle, nBody.state.angle)
+        else:
+            for i, body in enumerate(nBody.bodies):
+                pos = body.pos
+                self.pos[i, 0], self.pos[i, 1], self.pos[i, 2] = pos.x, pos.y, pos.z
+                self.radius[i] = body.radius
+                self.angle[i] = body.angle
+        if nBody.particles != None:
+            np.copyto(self.particles, nBody.particles.pos)
+        self.time = nBody.time
+
+
+    def fits(self, nBody):
+        # Whether the frame has the size of the state of nBody.
+        return self.N == nBody.N and len(self.particles) == particleCount(nBody)
+
+
+
+def particleCount(nBody):
+    return 0 if nBody.particles == None else nBody.particles.N
+
+
+
+class TripleBuffer:
+    """Three frames rotating between the writer (back), the latest completed frame (middle) and the reader (front).
+    Only the frame indices are swapped under the lock, so neither side waits for the other to copy, and a frame is never written while it is being read."""
+
+    def __init__(self, N=0):
+        self.frames = [Frame(N) for _ in range(3)]
+        self.back, self.middle, self.front = 0, 1, 2
+        self.fresh = False
+        self.published = 0
+        self.lock = threading.Lock()
+
+
+    def publish(self, nBody):
+        # Physics side: copies the current state into the back frame and makes it the latest one.
+        frame = self.frames[self.back]
+        if not frame.fits(nBody):               # only reallocates when bodies or test particles are added or removed
+            frame = self.frames[self.back] = Frame(nBody.N, nBody.bodies, particleCount(nBody))
+        frame.fill(nBody)
+        self.published += 1
+        frame.serial = self.published
+
+        with self.lock:
+            self.back, self.middle = self.middle, self.back
+            self.fresh = True
+
+
+    def latest(self):
+        # Render side: returns the most recently published frame. It stays untouched until the next call.
+        with self.lock:
+            if self.fresh:
+                self.front, self.middle = self.middle, self.front
+                self.fresh = False
+        return self.frames[self.front]
+
+
+
+class InterpolationBuffer(TripleBuffer):
+    """Frames rotating like a TripleBuffer, with the latest two published frames handed to the renderer together.
+    Five frames are enough for the writer to always find one that is neither published nor being read."""
+
+    def __init__(self, N=0):
+        self.frames = [Frame(N) for _ in range(5)]
+        self.back = 0
+        self.middle = []            # published frames, oldest first (at most two)
+        self.front = []             # frames being read
+        self.published = 0
+        self.lock = threading.Lock()
+
+
+    def publish(self, nBody):
+        frame = self.frames[self.back]
+        if not frame.fits(nBody):
+            frame = self.frames[self.back] = Frame(nBody.N, nBody.bodies, particleCount(nBody))
+        frame.fill(nBody)
+        self.published += 1
+        frame.serial = self.published
+
+        with self.lock:
+            self.middle = self.middle[-1:] + [self.back]
+            self.back = next(k for k in range(len(self.frames)) if k not in self.middle and k not in self.front)
+
+
+    def latest(self):
+        # Render side: returns the most recently published frame.
+        return self.latestTwo()[1]
+
+
+    def latestTwo(self):
+        # Render side: returns the two most recently published frames (previous, latest), previous being None until two were published (and latest an empty frame until one was).
+        # They stay untouched until the next call.
+        with self.lock:
+            self.front = list(self.middle)
+        if not self.front:
+            return None, Frame(0)
+        previous = self.frames[self.front[0]] if len(self.front) == 2 else None
+        return previous, self.frames[self.front[-1]]
+
+
+
+def interpolate(previous, latest, fraction, pos=None, angle=None):
+    # Positions and angles "fraction" of the way from the previous frame to the latest one (the latest ones if there is no previous frame with the same bodies).
+    # Angles take the short way round. The results are written to the "pos" and "angle" arrays if given.
+    if previous == None or previous.N != latest.N or previous.bodies != latest.bodies:
+        return latest.pos, latest.angle
+    pos = np.subtract(latest.pos, previous.pos, out=pos)
+    pos *= fraction
+    pos += previous.pos
+    turn = np.remainder(latest.angle - previous.angle + 180, 360) - 180
+    angle = np.multiply(turn, fraction, out=angle)
+    angle += previous.angle
+    return pos, angle
+
+
+def interpolateParticles(previous, latest, fraction, out=None):
+    # Test particle positions "fraction" of the way from the previous frame to the latest one (the latest ones if the previous frame has other particles), written to "out" if given.
+    if previous == None or len(previous.particles) != len(latest.particles):
+        return latest.particles
+    out = np.subtract(latest.particles, previous.particles, out=out)
+    out *= fraction
+    out += previous.particles
+    return out
@@ -0,0 +1,77 @@
+"""
+Contains the StateArrays class.
+It stores the state of every body of an array-backed NBody in contiguous NumPy arrays.
+"""
+
+from .lazy import lazyImport
+
+np = lazyImport('numpy')
+
+
+class StateArrays:
+    """A structure-of-arrays container for body state. Vector fields are (N, 3) float64 arrays and scalar fields are (N,) float64 arrays, all in SI units."""
+
+    VECTORS = ('pos', 'vel', 'acc')
+    SCALARS = ('mass', 'radius', 'angle', 'angular_velocity')
+    FIELDS = VECTORS + SCALARS
+
+    def __init__(self, capacity=16):
+        self.N = 0
+        self.capacity = 0
+        self.buffers = dict()
+        self.reserve(max(capacity, 1))
+
+
+    def __len__(self):
+        return self.N
+
+
+    def reserve(self, capacity):
+        # Grows the underlying buffers so that they can hold at least "capacity" bodies. Existing data is kept.
+        if capacity <= self.capacity:
+            return
+        for field in self.FIELDS:
+            shape = (capacity, 3) if field in self.VECTORS else (capacity,)
+            buffer = np.zeros(shape, dtype=np.float64)
+            if field in self.buffers:
+                buffer[:self.N] = self.buffers[field][:self.N]
+            self.buffers[field] = buffer
+        self.capacity = capacity
+        self.refreshViews()
+
+
+    def refreshViews(self):
+        # The public field attributes are contiguous views of the first N rows of each buffer. They must be refreshed whenever N or the buffers change.
+        for field in self.FIELDS:
+            setattr(self, field, self.buffers[field][:self.N])
+
+
+    def append(self, **values):
+        # Appends a body and returns its index. Missing fields default to 0.
+        if self.N == self.capacity:
+            self.reserve(2 * self.capacity)
+        i = self.N
+        for field in self.FIELDS:
+            self.buffers[field][i] = values.get(field, 0)
+        self.N += 1
+        self.refreshViews()
+        return i
+
+
+    def remove(self, i):
+        # Removes the body at index i, shifting every later body down by one.
+        for field in self.FIELDS:
+            buffer = self.buffers[field]
+            buffer[i:self.N - 1] = buffer[i + 1:self.N]
+            buffer[self.N - 1] = 0
+        self.N -= 1
+        self.refreshViews()
+
+
+    def copy(self):
+        newState = StateArrays(self.N)
+        for field in self.FIELDS:
+            newState.buffers[field][:self.N] = self.buffers[field][:self.N]
+        newState.N = self.N
+        newState.refreshViews()
+        return newState
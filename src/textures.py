@@ -0,0 +1,185 @@
+"""
+Contains the texture pipeline of the renderer.
+Sphere maps are decoded, oriented and downsampled by a thread pool, and kept in an on-disk cache of raw NumPy arrays keyed by the image's content hash and the target size, which later runs memory-map instead of decoding.
+Until a map is uploaded (or when a body has none) it is drawn with one shared fallback texture. OpenGL and PIL are only imported when a texture is uploaded or decoded.
+"""
+
+import concurrent.futures
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from . import data_parse as dp
+
+
+MAPS = os.path.join(dp.RESOURCES, 'maps')
+FALLBACK = np.full((2, 2, 3), 160, dtype=np.uint8)         # plain grey
+
+
+def defaultCacheDirectory():
+    # The textures directory next to the catalog cache.
+    return os.path.join(os.path.dirname(dp.defaultCachePath()), 'textures')
+
+
+
+class TextureCache:
+    """Decoded sphere maps, as (height, width, 3) uint8 arrays with their rows ordered bottom to top as OpenGL expects, at most "maxsize" pixels on their longest side.
+    load() reads an image through the disk cache; request() does the same in one of "workers" background threads and returns a Future."""
+
+    def __init__(self, directory=None, maxsize=2048, workers=4):
+        self.directory = defaultCacheDirectory() if directory == None else directory
+        self.maxsize = maxsize
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='texture')
+        self.decoded = 0            # cache misses so far
+
+
+    def cachePath(self, filepath):
+        with open(filepath, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        return os.path.join(self.directory, '%s-%d.npy' % (digest, self.maxsize))
+
+
+    def load(self, filepath):
+        # Returns the texture data of an image file, or None if there is no such file.
+        if not os.path.isfile(filepath):
+            return None
+        cachepath = self.cachePath(filepath)
+        if os.path.isfile(cachepath):
+            try:
+                return np.load(cachepath, mmap_mode='r')
+            except (OSError, ValueError):
+                pass                # damaged entry, decoded again below
+
+        data = decodeTexture(filepath, self.maxsize)
+        self.decoded += 1
+        self.store(cachepath, data)
+        return data
+
+
+    def store(self, cachepath, data):
+        # Writes a cache entry atomically; a cache that cannot be written is simply skipped.
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temppath = tempfile.mkstemp(prefix='.texture-', suffix='.tmp', dir=self.directory)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, data)
+            os.replace(temppath, cachepath)
+        except OSError:
+            if os.path.exists(temppath):
+                os.remove(temppath)
+
+
+    def request(self, filepath):
+        return self.executor.submit(self.load, filepath)
+
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+
+class Texture:
+    """A GL texture handle. Its id is the shared fallback texture until its image has been uploaded."""
+
+    def __init__(self, filepath, id):
+        self.filepath = filepath
+        self.id = id
+        self.ready = False
+        self.color = FALLBACK.mean(axis=(0, 1)) / 255       # mean RGB of the image in [0, 1], for bodies drawn as points
+        self.error = None           # the exception if the image could not be decoded
+
+
+
+class TextureManager:
+    """The GL textures of the sphere maps, one per image file however many bodies use it.
+    Images are decoded by the TextureCache threads; poll() uploads the finished ones and must be called from the thread that owns the GL context (e.g. once per frame)."""
+
+    def __init__(self, cache=None):
+        self.cache = TextureCache() if cache == None else cache
+        self.fallback = None
+        self.textures = dict()      # image file path -> Texture
+        self.pending = []           # (Texture, Future) of the images being decoded
+
+
+    def texture(self, filepath):
+        # Returns the texture of an image file, starting to decode it if it is new.
+        if filepath in self.textures:
+            return self.textures[filepath]
+        if self.fallback == None:
+            self.fallback = uploadTexture(FALLBACK, mipmaps=False)
+
+        texture = self.textures[filepath] = Texture(filepath, self.fallback)
+        self.pending.append((texture, self.cache.request(filepath)))
+        return texture
+
+
+    def poll(self):
+        # Uploads the images decoded since the last call. Returns the number of textures that became ready.
+        if not self.pending:
+            return 0
+        uploaded, pending = 0, []
+        for texture, future in self.pending:
+            if not future.done():
+                pending.append((texture, future))
+                continue
+            try:
+                data = future.result()
+            except Exception as e:
+                texture.error, data = e, None       # an unreadable image keeps the fallback
+            if data is not None:
+                texture.id = uploadTexture(data)
+                texture.color = np.asarray(data).reshape(-1, 3).mean(axis=0) / 255
+                texture.ready = True
+                uploaded += 1
+        self.pending = pending
+        return uploaded
+
+
+    def wait(self):
+        # Blocks until every requested image is decoded, then uploads them all.
+        concurrent.futures.wait([future for _, future in self.pending])
+        return self.poll()
+
+
+    def close(self):
+        self.cache.close()
+
+
+
+def decodeTexture(filepath, maxsize):
+    # Decodes an image to RGB, downsampled to at most maxsize pixels on its longest side, with its rows bottom to top.
+    from PIL import Image
+
+    with Image.open(filepath) as image:
+        image = image.convert('RGB')
+        scale = maxsize / max(image.size)
+        if scale < 1:
+            image = image.resize((max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale))), Image.LANCZOS)
+        return np.ascontiguousarray(np.asarray(image)[::-1])        # same orientation as rotate(180) then a left-right flip
+
+
+def uploadTexture(data, mipmaps=True):
+    # Creates a GL texture from (height, width, 3) uint8 data and returns its id. With mipmaps, minified textures are filtered trilinearly instead of aliasing.
+    from OpenGL import GL, GLU
+
+    data = np.ascontiguousarray(data, dtype=np.uint8)
+    height, width = data.shape[:2]
+    textID = GL.glGenTextures(1)
+    GL.glBindTexture(GL.GL_TEXTURE_2D, textID)
+    GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+    GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_REPEAT)
+    GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_REPEAT)
+    GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
+    GL.glTexEnvf(GL.GL_TEXTURE_ENV, GL.GL_TEXTURE_ENV_MODE, GL.GL_DECAL)
+    if mipmaps:
+        GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR_MIPMAP_LINEAR)
+        GLU.gluBuild2DMipmaps(GL.GL_TEXTURE_2D, GL.GL_RGB, width, height, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, data)
+    else:
+        GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGB, width, height, 0, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, data)
+    return textID
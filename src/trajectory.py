@@ -0,0 +1,222 @@
+"""
+Contains the trajectory writer and reader.
+A trajectory file is a text header describing the bodies followed by fixed-size binary frames (time, positions, velocities and angles), so it can be memory-mapped and indexed by frame.
+A sidecar ".idx" file holds the contiguous array of frame times, which is binary searched to find any simulated time without reading the frames.
+"""
+
+import os
+import queue
+import threading
+
+import numpy as np
+
+
+MAGIC = b'NBTRAJ01'
+HEADERALIGN = 64
+BODYFIELDS = ('name', 'body_type', 'mass', 'radius', 'obliquity')
+
+
+def frameDtype(N):
+    # The dtype of a single frame for N bodies.
+    return np.dtype([('time', '<f8'), ('pos', '<f8', (N, 3)), ('vel', '<f8', (N, 3)), ('angle', '<f8', (N,))])
+
+
+def indexPath(filepath):
+    return filepath + '.idx'
+
+
+def stateOf(nBody):
+    # Returns (pos, vel, angle) arrays of an NBody, gathering them from the bodies if it is not array-backed.
+    if nBody.state != None:
+        return nBody.state.pos, nBody.state.vel, nBody.state.angle
+    return (np.array([[b.pos.x, b.pos.y, b.pos.z] for b in nBody.bodies]).reshape(-1, 3),
+            np.array([[b.vel.x, b.vel.y, b.vel.z] for b in nBody.bodies]).reshape(-1, 3),
+            np.array([b.angle for b in nBody.bodies], dtype=float))
+
+
+
+class TrajectoryWriter:
+    """Streams NBody frames to a trajectory file every "every" calls.
+    Frames are copied into one of a few preallocated chunk buffers of "chunkframes" frames; full chunks are written by a background thread while the others fill up, so memory use stays constant however long the run is."""
+
+    def __init__(self, filepath, nBody, every=1, chunkframes=256, buffers=3):
+        self.filepath = filepath
+        self.N = nBody.N
+        self.every = every
+        self.calls = 0
+        self.frames = 0
+
+        self.file = open(filepath, 'wb')
+        self.index = open(indexPath(filepath), 'wb')
+        self.file.write(makeHeader(nBody))
+
+        self.free = queue.Queue()
+        for _ in range(buffers):
+            self.free.put(np.empty(chunkframes, dtype=frameDtype(self.N)))
+        self.full = queue.Queue()
+        self.buffer = self.free.get()
+        self.count = 0
+
+        self.error = None
+        self.thread = threading.Thread(target=self.writeLoop, daemon=True)
+        self.thread.start()
+
+
+    def __call__(self, nBody, step=None):
+        # Runner callback: records every "every"-th call, so that frames recorded after the initial conditions are "every" steps apart.
+        self.calls += 1
+        if self.calls % self.every == 0:
+            self.record(nBody)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def record(self, nBody):
+        # Copies the current state of nBody into the next frame.
+        if self.error != None:
+            raise self.error
+        if nBody.N != self.N:
+            raise ValueError("Trajectories need a fixed number of bodies (%d, now %d)." % (self.N, nBody.N))
+
+        pos, vel, angle = stateOf(nBody)
+        frame = self.buffer[self.count]
+        frame['time'] = nBody.time
+        frame['pos'] = pos
+        frame['vel'] = vel
+        frame['angle'] = angle
+        self.count += 1
+        self.frames += 1
+
+        if self.count == len(self.buffer):
+            self.submit()
+
+
+    def submit(self):
+        # Hands the current chunk to the writer thread and takes a free buffer (waiting for one if the disk is behind).
+        self.full.put((self.buffer, self.count))
+        self.buffer = self.free.get()
+        self.count = 0
+
+
+    def writeLoop(self):
+        while True:
+            item = self.full.get()
+            if item == None:
+                self.full.task_done()
+                return
+            buffer, count = item
+            try:
+                self.file.write(buffer[:count].tobytes())
+                self.index.write(np.ascontiguousarray(buffer['time'][:count]).tobytes())
+                self.file.flush()
+                self.index.flush()
+            except Exception as e:
+                self.error = e
+            self.free.put(buffer)
+            self.full.task_done()
+
+
+    def flush(self):
+        # Writes the partial chunk and waits until everything recorded so far is on disk.
+        if self.count:
+            self.submit()
+        self.full.join()
+
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.count:
+            self.submit()
+        self.full.put(None)
+        self.thread.join()
+        self.file.close()
+        self.index.close()
+        if self.error != None:
+            raise self.error
+
+
+
+class Trajectory:
+    """Read-only, memory-mapped view of a trajectory file. Frames are only read from disk when accessed."""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, 'rb') as f:
+            self.bodies, self.headersize = parseHeader(f)
+        self.N = len(self.bodies)
+        self.dtype = frameDtype(self.N)
+
+        nframes = (os.path.getsize(filepath) - self.headersize) // self.dtype.itemsize
+        if nframes > 0:
+            self.frames = np.memmap(filepath, dtype=self.dtype, mode='r', offset=self.headersize, shape=(nframes,))
+        else:
+            self.frames = np.zeros(0, dtype=self.dtype)
+
+        if os.path.isfile(indexPath(filepath)) and os.path.getsize(indexPath(filepath)) >= 8 * nframes > 0:
+            self.times = np.memmap(indexPath(filepath), dtype='<f8', mode='r', shape=(nframes,))
+        else:
+            self.times = np.ascontiguousarray(self.frames['time'])        # rebuild the index from the frames
+
+
+    def __len__(self):
+        return len(self.frames)
+
+
+    def __getitem__(self, i):
+        return self.frames[i]
+
+
+    def frameIndex(self, time):
+        # Returns the index of the last frame at or before the simulated time (the first frame for earlier times).
+        return max(0, int(np.searchsorted(self.times, time, side='right')) - 1)
+
+
+    def frameAt(self, time):
+        return self.frames[self.frameIndex(time)]
+
+
+    def positionsAt(self, time):
+        # Positions at any simulated time, linearly interpolated between the two frames around it.
+        i = self.frameIndex(time)
+        if i + 1 >= len(self) or time <= self.times[i]:
+            return np.array(self.frames[i]['pos'])
+        t0, t1 = self.times[i], self.times[i + 1]
+        w = (time - t0) / (t1 - t0)
+        return (1 - w) * self.frames[i]['pos'] + w * self.frames[i + 1]['pos']
+
+
+
+def makeHeader(nBody):
+    # MAGIC, the header size in 15 digits and a newline, then one tab-separated line per body, zero-padded to a multiple of HEADERALIGN bytes.
+    lines = [str(nBody.N), '\t'.join(BODYFIELDS)]
+    for body in nBody.bodies:
+        lines.append('\t'.join(str(getattr(body, field)) for field in BODYFIELDS))
+    text = ('\n'.join(lines) + '\n').encode('utf-8')
+    size = -(-(len(text) + 24) // HEADERALIGN) * HEADERALIGN
+    return MAGIC + str(size).encode().rjust(15) + b'\n' + text.ljust(size - 24, b'\0')
+
+
+def parseHeader(f):
+    # Returns (list of body description dicts, header size in bytes).
+    prefix = f.read(24)
+    if prefix[:8] != MAGIC:
+        raise ValueError("Not a trajectory file.")
+    size = int(prefix[8:])
+    lines = f.read(size - 24).rstrip(b'\0').decode('utf-8').split('\n')
+    N, fields = int(lines[0]), lines[1].split('\t')
+    bodies = []
+    for line in lines[2:2 + N]:
+        body = dict(zip(fields, line.split('\t')))
+        for field in ('mass', 'radius', 'obliquity'):
+            body[field] = float(body[field])
+        if body['body_type'] == 'None':
+            body['body_type'] = None
+        bodies.append(body)
+    return bodies, size
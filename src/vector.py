@@ -1,17 +1,35 @@
 """
-Contains the vector class.
+Contains the vector classes.
+Vector is a single 3D/2D vector with in-place operators, for per-body arithmetic that does not allocate. VectorArray holds a batch of vectors in an (N, 3) NumPy array with the same operations.
 """
 
 import math
+import numbers
+
+from .lazy import lazyImport
+
+np = lazyImport('numpy')        # only VectorArray needs it
+
+
+SCALARS = (int, float)
+
+
+def isScalar(value):
+    # Fast path for the built-in types, then any other real number (e.g. NumPy scalars).
+    return isinstance(value, SCALARS) or isinstance(value, numbers.Real)
 
 
 class Vector():
-    """A simple 3D/2D vector class. It contains operations such as vector addition, scalar multiplication, dot and cross products, norm, etc."""
-    
-    def __init__(self, x, y, z=None):
-        if z == None:
+    """A simple 3D/2D vector class. It contains operations such as vector addition, scalar multiplication, dot and cross products, norm, etc.
+    The in-place operators (+=, -=, *=, /=) and axpy modify the vector itself instead of creating a new one."""
+
+    __slots__ = ('x', 'y', 'z')
+    __array_ufunc__ = None          # NumPy scalars defer to __rmul__ instead of treating vectors as sequences
+
+    def __init__(self, x, y, z=0):
+        if z is None:
             z = 0
-        
+
         self.x, self.y, self.z = x, y, z
 
     def __getitem__(self, key):
@@ -23,11 +41,16 @@ class Vector():
             return self.z
         else:
             raise IndexError("Index must be 0, 1 or 2.")
-    
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+        yield self.z
+
     def __eq__(self, other):
-        if type(other) == type(Vector(0, 0)):
+        if isinstance(other, Vector):
             return self.x == other.x and self.y == other.y and self.z == other.z
-        elif other == None:
+        elif other is None:
             return False         # If this method is being called, it exists (and thus is not None).
         else:
             raise TypeError("Scalars cannot be equal to vectors!")
@@ -36,7 +59,7 @@ class Vector():
         return not self.__eq__(other)
 
     def __add__(self, other):
-        if type(other) == type(Vector(0, 0)):
+        if isinstance(other, Vector):
             return Vector(self.x + other.x, self.y + other.y, self.z + other.z)
         else:
             raise TypeError("Scalars cannot be added to vectors!")
@@ -44,17 +67,35 @@ class Vector():
     def __radd__(self, other):
         return self.__add__(other)
 
+    def __iadd__(self, other):
+        if isinstance(other, Vector):
+            self.x += other.x
+            self.y += other.y
+            self.z += other.z
+            return self
+        else:
+            raise TypeError("Scalars cannot be added to vectors!")
+
     def __sub__(self, other):
-        if type(other) == type(Vector(0, 0)):
+        if isinstance(other, Vector):
             return Vector(self.x - other.x, self.y - other.y, self.z - other.z)
         else:
             raise TypeError("Scalars cannot be subtracted with vectors!")
-    
+
     def __rsub__(self, other):
         return -self.__sub__(other)
 
+    def __isub__(self, other):
+        if isinstance(other, Vector):
+            self.x -= other.x
+            self.y -= other.y
+            self.z -= other.z
+            return self
+        else:
+            raise TypeError("Scalars cannot be subtracted with vectors!")
+
     def __mul__(self, other):
-        if type(other) == type(0) or type(other) == type(0.0):
+        if isinstance(other, SCALARS) or isinstance(other, numbers.Real):
             return Vector(self.x * other, self.y * other, self.z * other)
         else:
             raise TypeError("Only scalars can be multiplied with vectors! Use .dot() or .cross() to perform dot or cross products of vectors.")
@@ -62,26 +103,44 @@ class Vector():
     def __rmul__(self, other):
         return self.__mul__(other)
 
+    def __imul__(self, other):
+        if isinstance(other, SCALARS) or isinstance(other, numbers.Real):
+            self.x *= other
+            self.y *= other
+            self.z *= other
+            return self
+        else:
+            raise TypeError("Only scalars can be multiplied with vectors! Use .dot() or .cross() to perform dot or cross products of vectors.")
+
     def __truediv__(self, other):
-        if type(other) == type(0) or type(other) == type(0.0):
+        if isinstance(other, SCALARS) or isinstance(other, numbers.Real):
             return Vector(self.x / other, self.y / other, self.z / other)
         else:
             raise TypeError("Only scalars can be divided with vectors!")
 
+    def __itruediv__(self, other):
+        if isinstance(other, SCALARS) or isinstance(other, numbers.Real):
+            self.x /= other
+            self.y /= other
+            self.z /= other
+            return self
+        else:
+            raise TypeError("Only scalars can be divided with vectors!")
+
     def __floordiv__(self, other):
-        if type(other) == type(0) or type(other) == type(0.0):
+        if isinstance(other, SCALARS) or isinstance(other, numbers.Real):
             return Vector(self.x // other, self.y // other, self.z // other)
         else:
             raise TypeError("Only scalars can be divided with vectors!")
 
     def __div__(self, other):       # Python2 support
-        if type(other) == type(0) or type(other) == type(0.0):
+        if isinstance(other, SCALARS) or isinstance(other, numbers.Real):
             return Vector(float(self.x) / other, float(self.y) / other, float(self.z) / other)
         else:
             raise TypeError("Only scalars can be divided with vectors!")
 
     def __neg__(self):
-        return self.__mul__(-1)
+        return Vector(-self.x, -self.y, -self.z)
 
     def __abs__(self):
         return self.norm()
@@ -92,20 +151,186 @@ class Vector():
         return str((self.x, self.y, self.z))
 
 
+    def copy(self):
+        return Vector(self.x, self.y, self.z)
+
+    def axpy(self, a, other):
+        # Fused in-place self += a * other, without creating the intermediate vector. Returns self.
+        if isinstance(other, Vector):
+            self.x += a * other.x
+            self.y += a * other.y
+            self.z += a * other.z
+            return self
+        else:
+            raise TypeError("axpy must be done with a scalar and a vector!")
+
     def norm(self):
-        return math.sqrt(self.x ** 2 + self.y ** 2 + self.z ** 2)
+        return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
 
     def dot(self, other):
         # Computes dot product.
-        if type(other) == type(Vector(0, 0)):
+        if isinstance(other, Vector):
             return self.x * other.x + self.y * other.y + self.z * other.z
         else:
             raise TypeError("Dot products must be done with vectors!")
 
     def cross(self, other):
         # Computes cross product.
-        if type(other) == type(Vector(0, 0)):
+        if isinstance(other, Vector):
             return Vector(self.y*other.z - self.z*other.y, self.z*other.x - self.x*other.z, self.x*other.y - self.y*other.x)
         else:
             raise TypeError("Cross products must be done with vectors!")
 
+
+
+class VectorArray():
+    """A batch of N vectors stored as an (N, 3) float64 NumPy array, with the operations of Vector applied row by row.
+    Indexing with an integer returns a Vector copy of that row; slices and index arrays return VectorArrays viewing or copying the rows, like NumPy."""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data=()):
+        if isinstance(data, VectorArray):
+            data = data.data
+        elif len(data) and isinstance(data[0], Vector):
+            data = [(v.x, v.y, v.z) for v in data]
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim == 2 and data.shape[1] == 2:
+            data = np.column_stack([data, np.zeros(len(data))])
+        self.data = data.reshape(-1, 3)
+
+    @classmethod
+    def zeros(cls, N):
+        return cls(np.zeros((N, 3)))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        if isinstance(key, numbers.Integral):
+            return Vector(*self.data[key].tolist())
+        return VectorArray(self.data[key])
+
+    def __setitem__(self, key, value):
+        if isinstance(value, Vector):
+            value = (value.x, value.y, value.z)
+        elif isinstance(value, VectorArray):
+            value = value.data
+        self.data[key] = value
+
+    def __iter__(self):
+        for row in self.data.tolist():
+            yield Vector(*row)
+
+    def __eq__(self, other):
+        if isinstance(other, (Vector, VectorArray)):
+            return bool(np.array_equal(self.data, np.broadcast_to(self.operand(other), self.data.shape)))
+        elif other is None:
+            return False
+        else:
+            raise TypeError("Scalars cannot be equal to vectors!")
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return 'VectorArray(%s)' % repr(self.data.tolist())
+
+
+    def operand(self, other):
+        # Returns the array to combine with: the rows of another VectorArray, or a single Vector broadcast to every row.
+        if isinstance(other, VectorArray):
+            return other.data
+        return np.array((other.x, other.y, other.z))
+
+    def scalars(self, other):
+        # Returns a scalar, or an (N,) array of per-row scalars as an (N, 1) column.
+        if isScalar(other):
+            return other
+        other = np.asarray(other, dtype=np.float64)
+        if other.shape != (len(self.data),):
+            raise TypeError("Only scalars (or one scalar per vector) can be multiplied with vectors! Use .dot() or .cross() to perform dot or cross products of vectors.")
+        return other[:, np.newaxis]
+
+    def __add__(self, other):
+        if isinstance(other, (Vector, VectorArray)):
+            return VectorArray(self.data + self.operand(other))
+        raise TypeError("Scalars cannot be added to vectors!")
+
+    def __radd__(self, other):
+        return self.__add__(other)
+
+    def __iadd__(self, other):
+        if isinstance(other, (Vector, VectorArray)):
+            self.data += self.operand(other)
+            return self
+        raise TypeError("Scalars cannot be added to vectors!")
+
+    def __sub__(self, other):
+        if isinstance(other, (Vector, VectorArray)):
+            return VectorArray(self.data - self.operand(other))
+        raise TypeError("Scalars cannot be subtracted with vectors!")
+
+    def __rsub__(self, other):
+        return -self.__sub__(other)
+
+    def __isub__(self, other):
+        if isinstance(other, (Vector, VectorArray)):
+            self.data -= self.operand(other)
+            return self
+        raise TypeError("Scalars cannot be subtracted with vectors!")
+
+    def __mul__(self, other):
+        if isinstance(other, (Vector, VectorArray)):
+            raise TypeError("Only scalars can be multiplied with vectors! Use .dot() or .cross() to perform dot or cross products of vectors.")
+        return VectorArray(self.data * self.scalars(other))
+
+    def __rmul__(self, other):
+        return self.__mul__(other)
+
+    def __imul__(self, other):
+        if isinstance(other, (Vector, VectorArray)):
+            raise TypeError("Only scalars can be multiplied with vectors! Use .dot() or .cross() to perform dot or cross products of vectors.")
+        self.data *= self.scalars(other)
+        return self
+
+    def __truediv__(self, other):
+        if isinstance(other, (Vector, VectorArray)):
+            raise TypeError("Only scalars can be divided with vectors!")
+        return VectorArray(self.data / self.scalars(other))
+
+    def __itruediv__(self, other):
+        if isinstance(other, (Vector, VectorArray)):
+            raise TypeError("Only scalars can be divided with vectors!")
+        self.data /= self.scalars(other)
+        return self
+
+    def __neg__(self):
+        return VectorArray(-self.data)
+
+
+    def copy(self):
+        return VectorArray(self.data.copy())
+
+    def axpy(self, a, other):
+        # Fused in-place self += a * other, with a scalar or per-row scalars. Returns self.
+        if not isinstance(other, (Vector, VectorArray)):
+            raise TypeError("axpy must be done with a scalar and a vector!")
+        self.data += self.scalars(a) * self.operand(other)
+        return self
+
+    def norm(self):
+        # Row norms, (N,).
+        return np.sqrt(np.einsum('ij,ij->i', self.data, self.data))
+
+    def dot(self, other):
+        # Row-wise dot products with a Vector or another VectorArray, (N,).
+        if isinstance(other, (Vector, VectorArray)):
+            return np.einsum('ij,ij->i', self.data, np.broadcast_to(self.operand(other), self.data.shape))
+        raise TypeError("Dot products must be done with vectors!")
+
+    def cross(self, other):
+        # Row-wise cross products with a Vector or another VectorArray.
+        if isinstance(other, (Vector, VectorArray)):
+            return VectorArray(np.cross(self.data, self.operand(other)))
+        raise TypeError("Cross products must be done with vectors!")
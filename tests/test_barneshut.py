@@ -0,0 +1,75 @@
+"""
+Tests for the barneshut file.
+Every test compares the tree accelerations against direct summation.
+"""
+
+import unittest
+
+import numpy as np
+
+from src.barneshut import BarnesHutEngine
+from src.gravity import DirectEngine
+from src.nbody import NBody
+
+
+def randomCluster(N, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(N, 3)) * 1e11, rng.uniform(1e20, 1e24, N)
+
+
+def relativeErrors(acc, ref):
+    return np.linalg.norm(acc - ref, axis=1) / np.linalg.norm(ref, axis=1)
+
+
+
+class TestBarnesHutAccuracy(unittest.TestCase):
+
+    def test_small_system_is_exact(self):
+        pos, mass = randomCluster(10)
+        err = relativeErrors(BarnesHutEngine().accelerations(pos, mass), DirectEngine().accelerations(pos, mass))
+        self.assertLess(err.max(), 1e-12, msg="Systems that fit in a single leaf must be summed directly.")
+
+    def test_default_theta_tolerance(self):
+        pos, mass = randomCluster(1500)
+        err = relativeErrors(BarnesHutEngine().accelerations(pos, mass), DirectEngine().accelerations(pos, mass))
+        self.assertLess(np.median(err), 0.005, msg="Median error at theta = 0.5 is outside the stated tolerance.")
+        self.assertLess(np.percentile(err, 99), 0.02, msg="99th percentile error at theta = 0.5 is outside the stated tolerance.")
+
+    def test_smaller_theta_is_more_accurate(self):
+        pos, mass = randomCluster(1500)
+        ref = DirectEngine().accelerations(pos, mass)
+        coarse = relativeErrors(BarnesHutEngine(theta=0.8).accelerations(pos, mass), ref)
+        fine = relativeErrors(BarnesHutEngine(theta=0.3).accelerations(pos, mass), ref)
+        self.assertLess(np.percentile(fine, 99), 0.005)
+        self.assertLess(np.median(fine), np.median(coarse))
+
+    def test_dense_clump(self):
+        pos, mass = randomCluster(200)
+        pos[100:] = pos[0] + 1e3 * np.arange(1, 101)[:, np.newaxis]       # a dense clump deeper than a leaf
+        err = relativeErrors(BarnesHutEngine().accelerations(pos, mass), DirectEngine().accelerations(pos, mass))
+        self.assertLess(np.percentile(err, 99), 0.02)
+
+    def test_refit_between_rebuilds(self):
+        pos, mass = randomCluster(1000)
+        engine = BarnesHutEngine(rebuildinterval=10)
+        engine.accelerations(pos, mass)
+        tree = engine.tree
+        pos = pos + np.random.default_rng(1).normal(size=pos.shape) * 1e9
+        err = relativeErrors(engine.accelerations(pos, mass), DirectEngine().accelerations(pos, mass))
+        self.assertIs(engine.tree, tree, msg="The tree must be refitted, not rebuilt, between rebuilds.")
+        self.assertLess(np.percentile(err, 99), 0.02)
+
+
+
+class TestBarnesHutNBody(unittest.TestCase):
+
+    def test_selectable_per_nbody(self):
+        nBody = NBody(engine='barnes-hut')
+        self.assertIsInstance(nBody.engine, BarnesHutEngine)
+        nBody.setEngine('barnes-hut', theta=0.7)
+        self.assertEqual(nBody.engine.theta, 0.7)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
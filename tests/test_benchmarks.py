@@ -0,0 +1,52 @@
+"""
+Tests that the benchmark suite runs and round-trips its JSON results (the timings themselves are not checked).
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import suite
+
+
+
+class TestSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_random_system(self):
+        for arrays in [False, True]:
+            nBody = suite.randomSystem(20, arrays)
+            self.assertEqual(nBody.N, 20)
+            self.assertEqual(nBody.state != None, arrays)
+
+    def test_smoke_results(self):
+        filepath = os.path.join(self.directory, 'results.json')
+        document = suite.main(['--smoke', '--groups', 'data', 'scene', '--output', filepath])
+        with open(filepath) as f:
+            stored = json.load(f)
+        self.assertEqual(stored, json.loads(json.dumps(document)))
+        self.assertTrue(stored['environment']['smoke'])
+        self.assertEqual([entry['name'] for entry in stored['results']], ['getData', 'scene asteroid_belt', 'scene earth_and_moon', 'scene solar_system', 'scene trappist_1'])
+        for entry in stored['results']:
+            self.assertGreater(entry['seconds'], 0)
+            self.assertLessEqual(entry['min'], entry['seconds'])
+
+        lines = suite.compare(document, stored)
+        self.assertEqual(len(lines), 5)
+        self.assertIn('1.00x vs baseline', lines[0])
+
+    def test_update_sizes(self):
+        results = suite.benchUpdate(0.001, (2, 9), (2,))
+        self.assertEqual([(entry['mode'], entry['N']) for entry in results], [('list', 2), ('arrays', 2), ('arrays', 9)])
+
+
+
+if __name__ == "__main__":
+    unittest.main()
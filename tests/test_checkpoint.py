@@ -0,0 +1,137 @@
+"""
+Tests for the checkpoint file.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import headless
+from src import runner
+from src.checkpoint import Checkpointer, loadCheckpoint, saveCheckpoint
+
+
+def positions(nBody):
+    return [(body.pos.x, body.pos.y, body.pos.z, body.vel.x, body.vel.y, body.vel.z, body.angle) for body in nBody]
+
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, 'run.npz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertResumesExactly(self, engine=None, integrator=None, scene='solar_system', deltatime=3600, softening=0.0, **engineoptions):
+        uninterrupted = headless.loadSystem(scene, engine, integrator)
+        interrupted = headless.loadSystem(scene, engine, integrator)
+        if engineoptions:
+            uninterrupted.setEngine(engine, **engineoptions)
+            interrupted.setEngine(engine, **engineoptions)
+        if softening:
+            uninterrupted.setSoftening(softening)
+            interrupted.setSoftening(softening)
+
+        runner.run(uninterrupted, deltatime, steps=40)
+        runner.run(interrupted, deltatime, steps=17)
+        saveCheckpoint(interrupted, self.filepath)
+        resumed = loadCheckpoint(self.filepath)
+        self.assertEqual(resumed.softening, softening)
+        runner.run(resumed, deltatime, steps=23)
+
+        self.assertEqual(resumed.time, uninterrupted.time)
+        self.assertEqual(positions(resumed), positions(uninterrupted), msg="A resumed run must match an uninterrupted one bit for bit.")
+        if uninterrupted.particles != None:
+            np.testing.assert_array_equal(resumed.particles.pos, uninterrupted.particles.pos)
+            np.testing.assert_array_equal(resumed.particles.vel, uninterrupted.particles.vel)
+
+    def test_list_mode(self):
+        self.assertResumesExactly()
+
+    def test_integrators(self):
+        for integrator in ['euler', 'leapfrog', 'yoshida4', 'rk4', 'hermite', 'block']:
+            self.assertResumesExactly(integrator=integrator, scene='earth_and_moon', deltatime=86400)
+
+    def test_test_particles(self):
+        for integrator in ['leapfrog', 'wh']:
+            self.assertResumesExactly(integrator=integrator, scene='asteroid_belt', deltatime=86400)
+
+    def test_softening(self):
+        self.assertResumesExactly(softening=5e9)
+        for integrator in ['leapfrog', 'wh']:
+            self.assertResumesExactly(integrator=integrator, scene='asteroid_belt', deltatime=86400, softening=5e9)
+
+    def test_collisions(self):
+        nBody = headless.loadSystem('earth_and_moon', integrator='leapfrog')
+        nBody.setCollisions('log', encounter=1e9, large=4)
+        saveCheckpoint(nBody, self.filepath)
+        restored = loadCheckpoint(self.filepath)
+        self.assertEqual((restored.collisions.policy, restored.collisions.encounter, restored.collisions.large), ('log', 1e9, 4))
+        nBody.setCollisions(None)
+        saveCheckpoint(nBody, self.filepath)
+        self.assertIsNone(loadCheckpoint(self.filepath).collisions)
+
+    def test_refitting_tree_engine(self):
+        self.assertResumesExactly(engine='barnes-hut', integrator='leapfrog', rebuildinterval=5)
+
+    def test_mesh_engine(self):
+        self.assertResumesExactly(engine='p3m', integrator='leapfrog', ngrid=16)
+
+    def test_compact(self):
+        # The engine and integrator caches that are rebuilt identically (the mesh kernel, the tree's node data, the copies of the state) are not stored
+        for engine, options in (('p3m', dict(ngrid=32)), ('barnes-hut', dict(rebuildinterval=5)), ('direct', dict())):
+            nBody = headless.loadSystem('solar_system', engine, 'leapfrog')
+            nBody.setEngine(engine, **options)
+            runner.run(nBody, 3600, steps=7)
+            saveCheckpoint(nBody, self.filepath)
+            with np.load(self.filepath) as data:
+                self.assertLess(len(data['solver']), 2000, msg=engine)
+                self.assertEqual(data['caches'].tolist(), ['cached'])
+
+    def test_all_body_fields(self):
+        nBody = headless.loadSystem('trappist_1', integrator='leapfrog')
+        runner.run(nBody, 3600, steps=3)
+        saveCheckpoint(nBody, self.filepath)
+        restored = loadCheckpoint(self.filepath)
+        for a, b in zip(nBody, restored):
+            for field in ['name', 'body_type', 'mass', 'radius', 'obliquity', 'pos', 'vel', 'acc', 'angle', 'angular_velocity']:
+                self.assertEqual(getattr(a, field), getattr(b, field), msg="%s was not restored." % field)
+        self.assertEqual(type(restored.integrator), type(nBody.integrator))
+
+    def test_atomic_write_leaves_no_temporary_files(self):
+        nBody = headless.loadSystem('earth_and_moon')
+        saveCheckpoint(nBody, self.filepath)
+        saveCheckpoint(nBody, self.filepath)
+        self.assertEqual(os.listdir(self.directory), ['run.npz'])
+
+    def test_periodic_checkpoints(self):
+        nBody = headless.loadSystem('earth_and_moon', integrator='leapfrog')
+        with Checkpointer(self.filepath, every=10) as checkpointer:
+            runner.run(nBody, 60, steps=35, callback=checkpointer)
+        self.assertGreaterEqual(checkpointer.written, 1)
+        self.assertEqual(loadCheckpoint(self.filepath).time, 60 * 30)
+
+    def test_cli_resume(self):
+        headless.main(['earth_and_moon', '--integrator', 'leapfrog', '--dt', '60', '--steps', '30', '--checkpoint', self.filepath, '--checkpoint-every', '7'])
+        self.assertEqual(loadCheckpoint(self.filepath).time, 1800, msg="The final state must be checkpointed.")
+        finalpath = os.path.join(self.directory, 'final.npz')
+        headless.main(['--resume', self.filepath, '--dt', '60', '--until', '3600', '--checkpoint', finalpath])
+        uninterrupted = headless.loadSystem('earth_and_moon', integrator='leapfrog')
+        runner.run(uninterrupted, 60, steps=60)
+        self.assertEqual(positions(loadCheckpoint(finalpath)), positions(uninterrupted))
+
+        # The engine and integrator options switch the resumed run
+        headless.main(['--resume', self.filepath, '--dt', '60', '--steps', '1', '--integrator', 'yoshida4', '--engine', 'barnes-hut', '--checkpoint', finalpath])
+        resumed = loadCheckpoint(finalpath)
+        self.assertEqual((resumed.integrator.name, resumed.engine.name), ('yoshida4', 'barnes-hut'))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+"""
+Tests for the close-encounter and collision detection, merging and softening.
+"""
+
+import unittest
+
+import numpy as np
+
+from src import collisions
+from src import diagnostics
+from src import gravity
+from src.nbody import NBody, Body
+from src.vector import Vector
+
+
+def bruteForcePairs(pos, radius, encounter=0.0):
+    d = np.linalg.norm(pos[:, np.newaxis] - pos[np.newaxis], axis=2)
+    close = np.triu((d < radius[:, np.newaxis] + radius[np.newaxis]) | (d < encounter), 1)
+    return set(zip(*[x.tolist() for x in np.nonzero(close)]))
+
+
+def collidingPair(arrays):
+    # Two bodies flying into each other, and a far away third one.
+    nBody = NBody(arrays=arrays)
+    nBody.addBody(Body('a', 5e20, 2e5)(Vector(-1e6, 0, 0), Vector(3e3, 100, 0)))
+    nBody.addBody(Body('b', 1e20, 1e5)(Vector(1e6, 0, 0), Vector(-3e3, 0, 50)))
+    nBody.addBody(Body('c', 1e20, 1e5)(Vector(0, 1e9, 0), Vector(0, 0, 0)))
+    return nBody
+
+
+
+class TestPairs(unittest.TestCase):
+
+    def test_radix_argsort(self):
+        keys = np.random.default_rng(0).integers(0, 2 ** 20, 5000)
+        np.testing.assert_array_equal(collisions.radixArgsort(keys, 20), np.argsort(keys, kind='stable'))
+
+    def test_candidates_once(self):
+        # Every pair of bodies in the same or adjacent cells exactly once, despite hash collisions
+        pos = np.random.default_rng(1).uniform(-5, 5, (400, 3))
+        pairs = np.concatenate([np.stack([np.minimum(i, j), np.maximum(i, j)], axis=1) for i, j in collisions.SpatialHash(1.0).build(pos).candidates()])
+        self.assertEqual(len(pairs), len(np.unique(pairs, axis=0)))
+        cells = np.floor(pos).astype(int)
+        adjacent = np.abs(cells[:, np.newaxis] - cells[np.newaxis]).max(axis=2) <= 1
+        self.assertEqual(len(pairs), np.triu(adjacent, 1).sum())
+
+    def test_close_pairs(self):
+        rng = np.random.default_rng(2)
+        pos = rng.uniform(0, 1e9, (600, 3))
+        radius = 10 ** rng.uniform(6, 7.3, 600)
+        radius[:3] = 2e8            # a few large bodies, checked against everyone
+        for encounter, large in ((0.0, 16), (5e7, 16), (0.0, 0), (5e7, 1000)):
+            i, j, distance = collisions.closePairs(pos, radius, encounter, large)
+            self.assertTrue((i < j).all())
+            self.assertEqual(set(zip(i.tolist(), j.tolist())), bruteForcePairs(pos, radius, encounter))
+            np.testing.assert_allclose(distance, np.linalg.norm(pos[j] - pos[i], axis=1))
+
+    def test_point_bodies(self):
+        i, j, distance = collisions.closePairs(np.zeros((3, 3)), np.zeros(3), large=0)
+        self.assertEqual(len(i), 0)
+
+
+
+class TestCollisions(unittest.TestCase):
+
+    def test_merge(self):
+        # Mass, momentum and volume are conserved, and the absorbed body is removed, in both modes
+        for arrays in (False, True):
+            nBody = collidingPair(arrays)
+            nBody.setCollisions('merge')
+            pos, vel, mass = [x.copy() for x in diagnostics.stateArrays(nBody)]
+            while nBody.N == 3:
+                nBody.update(10)
+            self.assertEqual([body.name for body in nBody.bodies], ['a', 'c'])
+            a = nBody[0]
+            self.assertAlmostEqual(a.mass, 6e20)
+            self.assertAlmostEqual(a.radius / (2e5 ** 3 + 1e5 ** 3) ** (1 / 3), 1, places=12)
+            _, newvel, newmass = diagnostics.stateArrays(nBody)
+            np.testing.assert_allclose(newmass @ newvel, mass @ vel, rtol=1e-9, atol=1e10)
+            event, = nBody.collisions.events
+            self.assertEqual((event['kind'], event['bodies'], event['survivor']), ('merge', ('a', 'b'), 'a'))
+            if arrays:
+                self.assertEqual(nBody.state.N, 2)
+                self.assertEqual([body.index for body in nBody.bodies], [0, 1])
+
+    def test_log(self):
+        # Touching and encountering pairs are logged once per approach, and nothing is merged
+        logged = []
+        nBody = collidingPair(True)
+        nBody.setCollisions('log', encounter=1.5e6, log=logged.append)
+        for _ in range(60):
+            nBody.update(10)
+        self.assertEqual(nBody.N, 3)
+        self.assertEqual([event['kind'] for event in logged], ['encounter', 'collision'])
+        self.assertEqual(nBody.collisions.counts, dict(collision=1, encounter=1, merge=0))
+        self.assertIn('collision a + b', collisions.formatEvent(logged[1]))
+
+        with self.assertRaises(ValueError):
+            collisions.Collisions('bounce')
+
+    def test_merge_at_normal_dt(self):
+        # A debris cloud collapsing onto itself runs without blowing up, and only loses bodies to merges
+        rng = np.random.default_rng(3)
+        nBody = NBody(integrator='leapfrog')
+        for k, (pos, vel) in enumerate(zip(rng.normal(0, 2e6, (200, 3)).tolist(), rng.normal(0, 10, (200, 3)).tolist())):
+            nBody.addBody(Body('debris%d' % k, 1e18, 5e4)(Vector(*pos), Vector(*vel)))
+        nBody.setCollisions('merge')
+        _, vel, mass = [x.copy() for x in diagnostics.stateArrays(nBody)]
+        for _ in range(100):
+            nBody.update(60)
+        self.assertLess(nBody.N, 200)
+        self.assertEqual(nBody.N + nBody.collisions.counts['merge'], 200)
+        self.assertAlmostEqual(nBody.state.mass.sum() / mass.sum(), 1, places=12)
+        self.assertTrue(np.isfinite(nBody.state.vel).all())
+
+
+
+class TestSoftening(unittest.TestCase):
+
+    def test_plummer(self):
+        pos = np.array([[0.0, 0, 0], [3.0, 4, 0]])
+        mass = np.array([1e10, 2e10])
+        acc = gravity.DirectEngine(softening=1.0).accelerations(pos, mass)
+        np.testing.assert_allclose(acc[0], gravity.G * 2e10 * pos[1] / (25 + 1) ** 1.5)
+
+        engine = gravity.DirectEngine(softening=1.0)
+        vel = np.array([[0.0, 0, 0], [1, 0, 0]])
+        acc2, jerk = engine.accelerationsAndJerks(pos, vel, mass)
+        np.testing.assert_allclose(acc2, acc)
+        h = 1e-4
+        later = engine.accelerations(pos + h * vel, mass)
+        np.testing.assert_allclose(jerk, (later - acc) / h, rtol=1e-3)
+
+    def test_modes_agree(self):
+        # The same softened forces in list mode and with the direct engine, and in copies
+        systems = [collidingPair(False), collidingPair(True)]
+        for nBody in systems:
+            nBody.setSoftening(3e5)
+            nBody.update(1)
+        acc = systems[0][0].acc
+        np.testing.assert_allclose([acc.x, acc.y, acc.z], systems[1].state.acc[0], rtol=1e-12)
+        self.assertEqual(systems[1].__copy__().engine.softening, 3e5)
+
+        with self.assertRaises(ValueError):
+            NBody(engine='barnes-hut').setSoftening(1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
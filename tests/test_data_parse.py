@@ -0,0 +1,100 @@
+"""
+Tests for the astronomical catalog.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from src import data_parse as dp
+
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.constantspath = os.path.join(self.directory, 'constants.xml')
+        self.datapath = os.path.join(self.directory, 'data.xml')
+        shutil.copy(dp.CONSTANTSPATH, self.constantspath)
+        shutil.copy(dp.DATAPATH, self.datapath)
+        self.cachepath = os.path.join(self.directory, 'cache', 'catalog.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def catalog(self):
+        return dp.Catalog(self.constantspath, self.datapath, self.cachepath)
+
+    def test_values(self):
+        catalog = self.catalog()
+        self.assertEqual(catalog.constantFromSymbol('G'), 6.67408 * 10 ** -11)
+        self.assertEqual(catalog.constantFromName('Pi'), 3.1415926535897932)
+        self.assertIsNone(catalog.constantFromSymbol('nothing'))
+        earth = catalog.data('Earth')
+        self.assertEqual(earth['type'], 'planet')
+        self.assertEqual(earth['parent'], 'Sun')
+        self.assertEqual(earth['mass'], 5.97237 * 10 ** 24)
+        self.assertEqual(earth['obliquity'], 2.3439 * 10 ** 1)
+        self.assertIn('Moon', catalog)
+        self.assertRaises(KeyError, catalog.data, 'Vulcan')
+
+    def test_lazy(self):
+        catalog = self.catalog()
+        self.assertFalse(catalog.loaded)
+        self.assertFalse(os.path.exists(self.cachepath))
+        catalog.data('Sun')
+        self.assertTrue(catalog.loaded)
+
+    def test_data_is_a_copy(self):
+        catalog = self.catalog()
+        catalog.data('Earth')['mass'] = 0
+        self.assertEqual(catalog.data('Earth')['mass'], 5.97237 * 10 ** 24)
+
+    def test_cache(self):
+        parsed = self.catalog()
+        parsed.load()
+        self.assertFalse(parsed.fromcache)
+        self.assertTrue(os.path.isfile(self.cachepath))
+
+        cached = self.catalog()
+        self.assertTrue(cached.data('Mars') == parsed.data('Mars'))
+        self.assertTrue(cached.fromcache)
+        self.assertEqual(cached.bodies, parsed.bodies)
+        self.assertEqual(cached.symbols, parsed.symbols)
+
+    def test_cache_touched(self):
+        self.catalog().load()
+        stat = os.stat(self.datapath)
+        os.utime(self.datapath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        catalog = self.catalog()
+        catalog.load()
+        self.assertTrue(catalog.fromcache)
+
+    def test_cache_invalidated(self):
+        self.catalog().load()
+        with open(self.datapath, 'r') as f:
+            text = f.read()
+        with open(self.datapath, 'w') as f:
+            f.write(text.replace('<mass unit="kg" order="24">5.97237</mass>', '<mass unit="kg" order="24">6</mass>'))
+        catalog = self.catalog()
+        self.assertEqual(catalog.data('Earth')['mass'], 6.0 * 10 ** 24)
+        self.assertFalse(catalog.fromcache)
+
+    def test_unwritable_cache(self):
+        catalog = dp.Catalog(self.constantspath, self.datapath, os.path.join(self.datapath, 'catalog.cache'))
+        self.assertEqual(catalog.data('Earth')['type'], 'planet')
+
+    def test_working_directory(self):
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        try:
+            self.assertEqual(dp.Catalog(cachepath=False).data('Sun')['type'], 'star')
+        finally:
+            os.chdir(cwd)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Tests for the conservation diagnostics.
+"""
+
+import math
+import unittest
+
+import numpy as np
+
+import demos
+from src import diagnostics
+from src import gravity
+from src import runner
+from src.ensemble import Ensemble
+from src.nbody import NBody
+
+
+
+class TestConservation(unittest.TestCase):
+
+    def test_energy(self):
+        # Same energy in list and array mode, and as the ensemble's independent computation
+        listed, arrayed = demos.trappist_1_scene(NBody()), demos.trappist_1_scene(NBody(arrays=True))
+        expected = Ensemble([arrayed]).energy()[0]
+        self.assertAlmostEqual(diagnostics.energy(listed) / expected, 1, places=12)
+        self.assertAlmostEqual(diagnostics.energy(arrayed) / expected, 1, places=12)
+
+        pos, _, mass = diagnostics.stateArrays(arrayed)
+        self.assertAlmostEqual(diagnostics.potentialEnergy(pos, mass, maxpairs=16) / diagnostics.potentialEnergy(pos, mass), 1, places=12)
+
+    def test_engine_potentials(self):
+        nBody = demos.solar_system_scene(NBody(integrator='leapfrog'))
+        nBody.engine.potentials = True
+        nBody.update(3600)
+        self.assertIsNotNone(diagnostics.enginePotential(nBody))
+        pos, _, mass = diagnostics.stateArrays(nBody)
+        self.assertAlmostEqual(diagnostics.enginePotential(nBody) / diagnostics.potentialEnergy(pos, mass), 1, places=12)
+
+        nBody.state.pos[0, 0] += 1.0            # no longer the positions of the force pass
+        self.assertIsNone(diagnostics.enginePotential(nBody))
+
+    def test_drift(self):
+        # Leapfrog conserves energy far better than Euler for the same dt, and the reused potentials give the same energies as separate passes
+        reports = dict()
+        for integrator in ['euler', 'leapfrog']:
+            nBody = demos.solar_system_scene(NBody(integrator=integrator))
+            sampler = diagnostics.Diagnostics(nBody, every=7)
+            runner.run(nBody, 86400, steps=70, callback=sampler)
+            reports[integrator] = sampler.report()
+            self.assertEqual(sampler.reused, 10 if integrator == 'leapfrog' else 0)
+            self.assertEqual(len(sampler.times), 11)
+            self.assertAlmostEqual(sampler.energies[-1] / diagnostics.energy(nBody), 1, places=12)
+        self.assertLess(reports['leapfrog']['maxenergyerror'], reports['euler']['maxenergyerror'] / 10)
+        self.assertLess(reports['leapfrog']['momentumerror'], 1e-12)
+        self.assertLess(reports['leapfrog']['angularmomentumerror'], 1e-12)
+
+    def test_softening(self):
+        # The first sample's own pair pass and the later reused engine potentials are softened alike, so the energy error stays as small as without softening
+        errors = []
+        for softening in (0.0, 5e9):
+            nBody = demos.solar_system_scene(NBody(integrator='leapfrog'))
+            nBody.setSoftening(softening)
+            sampler = diagnostics.Diagnostics(nBody, every=7)
+            runner.run(nBody, 86400, steps=70, callback=sampler)
+            self.assertEqual(sampler.reused, 10)
+            pos, vel, mass = diagnostics.stateArrays(nBody)
+            separate = diagnostics.kineticEnergy(vel, mass) + diagnostics.potentialEnergy(pos, mass, softening=softening)
+            self.assertAlmostEqual(sampler.energies[-1] / separate, 1, places=12)
+            errors.append(sampler.report()['maxenergyerror'])
+        self.assertLess(errors[1], 2 * errors[0])
+        self.assertAlmostEqual(diagnostics.enginePotential(nBody) / diagnostics.potentialEnergy(pos, mass, softening=5e9), 1, places=12)
+        self.assertNotAlmostEqual(diagnostics.potentialEnergy(pos, mass, softening=5e9) / diagnostics.potentialEnergy(pos, mass), 1, places=6)
+
+        listed = demos.solar_system_scene(NBody())
+        listed.setSoftening(5e9)
+        pos, vel, mass = diagnostics.stateArrays(listed)
+        self.assertEqual(diagnostics.Diagnostics(listed).energies[0], diagnostics.kineticEnergy(vel, mass) + diagnostics.potentialEnergy(pos, mass, softening=5e9))
+
+    def test_max_samples(self):
+        nBody = demos.earth_and_moon_scene(NBody(arrays=True))
+        sampler = diagnostics.Diagnostics(nBody, maxsamples=5)
+        runner.run(nBody, 3600, steps=20, callback=sampler)
+        self.assertEqual(len(sampler.energies), 5)
+        self.assertEqual(sampler.times[-1], nBody.time)
+        self.assertEqual(sampler.initial[0], 0)
+
+    def test_cheapest(self):
+        rows = diagnostics.sweep(demos.earth_and_moon_scene, 86400 * 10, [3600, 36000], integrators=('euler', 'leapfrog'))
+        self.assertEqual([(row['integrator'], row['deltatime']) for row in rows], [('euler', 3600), ('euler', 36000), ('leapfrog', 3600), ('leapfrog', 36000)])
+        best = diagnostics.cheapest(rows, max(row['maxenergyerror'] for row in rows))
+        self.assertEqual(best['deltatime'], 36000)
+        self.assertIsNone(diagnostics.cheapest(rows, 0))
+
+
+
+class TestOrbitalElements(unittest.TestCase):
+
+    def test_kepler_orbit(self):
+        # A body at periapsis of a known orbit, rotated by the argument of periapsis, inclination and node
+        M, m, a, e = 2e30, 1e20, 1.5e11, 0.3
+        inclination, node, argument = 0.4, 1.1, 2.0
+        mu = gravity.G * (M + m)
+        r = np.array([a * (1 - e), 0, 0])
+        v = np.array([0, math.sqrt(mu * (1 + e) / (a * (1 - e))), 0])
+        rotation = rotationZ(node) @ rotationX(inclination) @ rotationZ(argument)
+        pos = np.array([[1e9, 2e9, 3e9], [1e9, 2e9, 3e9] + rotation @ r])
+        vel = np.array([[10.0, 0, 0], [10.0, 0, 0] + rotation @ v])
+
+        elements = diagnostics.orbitalElements(pos, vel, np.array([M, m]))
+        expected = dict(a=a, e=e, i=inclination, ascendingnode=node, periapsis=argument, anomaly=0, period=2 * math.pi * math.sqrt(a ** 3 / mu))
+        for name, value in expected.items():
+            self.assertTrue(math.isnan(elements[name][0]))
+            difference = elements[name][1] - value
+            if name in ('ascendingnode', 'periapsis', 'anomaly'):
+                difference = (difference + math.pi) % (2 * math.pi) - math.pi        # angles compare modulo 2 pi
+            self.assertAlmostEqual(difference, 0, delta=1e-9 * max(1, abs(value)), msg=name)
+
+    def test_solar_system(self):
+        nBody = demos.solar_system_scene(NBody(arrays=True))
+        elements = diagnostics.orbitalElements(*diagnostics.stateArrays(nBody))
+        earth = nBody.searchIndex('Earth')
+        self.assertAlmostEqual(elements['a'][earth] / 1.496e11, 1, places=2)
+        self.assertLess(elements['e'][earth], 0.05)
+        self.assertAlmostEqual(elements['period'][earth] / 86400 / 365.25, 1, places=2)
+        self.assertTrue(np.all(elements['i'][1:] == 0))
+
+
+
+def rotationX(angle):
+    c, s = math.cos(angle), math.sin(angle)
+    return np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+
+
+def rotationZ(angle):
+    c, s = math.cos(angle), math.sin(angle)
+    return np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Tests for the ensemble mode.
+"""
+
+import unittest
+
+import numpy as np
+
+import demos
+from src import diagnostics
+from src.ensemble import Ensemble, runEnsemble
+from src.nbody import NBody
+
+
+
+class TestEnsemble(unittest.TestCase):
+
+    def test_matches_nbody(self):
+        # Every member is stepped exactly like an array-backed NBody with the same integrator.
+        for integrator in ['euler', 'leapfrog', 'yoshida4']:
+            nBody = demos.solar_system_scene(NBody(integrator=integrator))
+            ensemble = Ensemble([demos.solar_system_scene() for _ in range(3)], integrator=integrator)
+            for _ in range(50):
+                nBody.update(3600)
+                ensemble.step(3600)
+            for m in range(3):
+                self.assertTrue(np.allclose(ensemble.pos[m], nBody.state.pos, rtol=1e-12, atol=0))
+                self.assertTrue(np.allclose(ensemble.vel[m], nBody.state.vel, rtol=1e-12, atol=0))
+            self.assertEqual(ensemble.time, nBody.time)
+
+    def test_softening(self):
+        # Members carry the systems' softening length, and still step like the NBody
+        nBody = demos.solar_system_scene(NBody(integrator='leapfrog'))
+        nBody.setSoftening(5e9)
+        member = demos.solar_system_scene()
+        member.setSoftening(5e9)
+        ensemble = Ensemble([member, member])
+        for _ in range(50):
+            nBody.update(3600)
+            ensemble.step(3600)
+        self.assertTrue(np.allclose(ensemble.pos[1], nBody.state.pos, rtol=1e-12, atol=0))
+        self.assertAlmostEqual(ensemble.energy()[0] / diagnostics.energy(nBody), 1, places=12)
+        self.assertEqual(ensemble.toNBody(0).softening, 5e9)
+        self.assertRaises(ValueError, Ensemble, [member, demos.solar_system_scene()])
+
+    def test_perturbed(self):
+        ensemble = Ensemble.perturbed(demos.trappist_1_scene(), 10, scale=1e-4, seed=0)
+        self.assertEqual(ensemble.pos.shape, (10, 8, 3))
+        reference = Ensemble([demos.trappist_1_scene()])
+        self.assertTrue(np.array_equal(ensemble.pos[0], reference.pos[0]))
+        self.assertFalse(np.array_equal(ensemble.pos[1], ensemble.pos[2]))
+
+    def test_diagnostics(self):
+        ensemble = Ensemble.perturbed(demos.trappist_1_scene(), 6, seed=1)
+        diagnostics = ensemble.run(600, 200)
+        self.assertEqual(diagnostics['energy'].shape, (6,))
+        self.assertEqual(diagnostics['momentum'].shape, (6, 3))
+        self.assertEqual(diagnostics['angularmomentum'].shape, (6, 3))
+        self.assertTrue(np.all(diagnostics['energyerror'] < 1e-4))
+        self.assertTrue(np.all(diagnostics['extent'] > 0))
+
+    def test_member_groups(self):
+        # Evaluating the members in small groups gives the same accelerations.
+        ensemble = Ensemble.perturbed(demos.solar_system_scene(), 5, seed=2)
+        small = Ensemble.perturbed(demos.solar_system_scene(), 5, seed=2, maxpairs=1)
+        self.assertTrue(np.array_equal(ensemble.accelerations(), small.accelerations()))
+        self.assertTrue(np.allclose(ensemble.energy(), small.energy(), rtol=1e-14))
+
+    def test_split_and_concatenate(self):
+        ensemble = Ensemble.perturbed(demos.trappist_1_scene(), 7, seed=3)
+        parts = ensemble.split(3)
+        self.assertEqual([len(part) for part in parts], [3, 2, 2])
+        joined = Ensemble.concatenate(parts)
+        for field in ['pos', 'vel', 'mass', 'initialenergy']:
+            self.assertTrue(np.array_equal(getattr(joined, field), getattr(ensemble, field)))
+
+    def test_process_pool(self):
+        ensemble = Ensemble.perturbed(demos.trappist_1_scene(), 8, seed=4)
+        serial, _ = runEnsemble(ensemble, 600, 20, processes=1)
+        pooled, diagnostics = runEnsemble(ensemble, 600, 20, processes=2)
+        self.assertTrue(np.array_equal(serial.pos, pooled.pos))
+        self.assertEqual(diagnostics['energy'].shape, (8,))
+        self.assertEqual(ensemble.time, 0)
+
+    def test_to_nbody(self):
+        ensemble = Ensemble.perturbed(demos.trappist_1_scene(), 3, seed=5)
+        ensemble.run(600, 5)
+        nBody = ensemble.toNBody(2)
+        self.assertEqual(nBody[4].name, 'Trappist-1e')
+        self.assertEqual(nBody[4].pos.x, ensemble.pos[2, 4, 0])
+        self.assertEqual(nBody.time, ensemble.time)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, Ensemble, [demos.solar_system_scene()], 'rk4')
+        self.assertRaises(ValueError, Ensemble, [demos.solar_system_scene(), demos.trappist_1_scene()])
+
+
+
+if __name__ == "__main__":
+    unittest.main()
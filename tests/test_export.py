@@ -0,0 +1,100 @@
+"""
+Tests for the offscreen frame exporter (the rendering itself only where PyOpenGL and Mesa's OSMesa are available).
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+import headless
+from src import export
+from src import renderer
+
+try:
+    import OpenGL
+except ImportError:
+    OpenGL = None
+
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, 'run.traj')
+        headless.main(['earth_and_moon', '--dt', '3600', '--steps', '48', '--integrator', 'leapfrog', '--trajectory', self.filepath, '--every', '4'])
+        self.trajectory = export.Trajectory(self.filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_frame_times(self):
+        np.testing.assert_array_equal(export.frameTimes(self.trajectory, 36000), 36000 * np.arange(5))
+        np.testing.assert_array_equal(export.frameTimes(self.trajectory, 14400 * 3, start=14400), [14400, 57600, 100800, 144000])
+        np.testing.assert_array_equal(export.frameTimes(self.trajectory, 1e9), [0])
+        with self.assertRaises(ValueError):
+            export.frameTimes(self.trajectory, 0)
+
+    def test_view_settings(self):
+        view = export.viewSettings(self.trajectory)
+        self.assertEqual(view['unitscale'], 400000000)
+        pos = self.trajectory[0]['pos']
+        self.assertAlmostEqual(view['zoomout'], 2.5 * np.linalg.norm(pos[1] - pos[0]))
+        self.assertEqual(export.viewSettings(self.trajectory, dict(zoomout=5.0, bodyscale=3))['zoomout'], 5.0)
+
+        class Sim:
+            unitscale, bodyscale, focusscale, centeredBodyIndex, zoomout, fovy, znear, zfar = 1, 2, 3, 1, 5, 45.0, 0.01, 100.0
+        self.assertEqual(export.viewOf(Sim())['centeredBodyIndex'], 1)
+
+    def test_camera_view(self):
+        # Same camera and scaling as the interactive view
+        pos = self.trajectory[3]['pos']
+        star = np.array([False, False])
+        eye, radius = renderer.cameraView(pos, np.array([2.0, 1.0]), star, 1, 1e8, 2.0, 10.0, 3e8)
+        np.testing.assert_allclose(eye[1], [0, 0, -3])
+        np.testing.assert_allclose(eye[0], (pos[0] - pos[1]) / 1e8 - [0, 0, 3])
+        np.testing.assert_allclose(radius, [4e-8, 2e-8])
+        _, radius = renderer.cameraView(pos, np.array([2.0, 1.0]), ~star, 1, 1e8, 2.0, 10.0, 3e8)
+        np.testing.assert_allclose(radius, [4e-7, 2e-7])
+
+    def test_write_ppm(self):
+        pixels = np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3)
+        export.writeImage(os.path.join(self.directory, 'frame.ppm'), pixels)
+        with open(os.path.join(self.directory, 'frame.ppm'), 'rb') as f:
+            self.assertEqual(f.read(), b'P6\n3 2\n255\n' + pixels.tobytes())
+
+    def test_output_required(self):
+        with self.assertRaises(ValueError):
+            export.exportFrames(self.filepath, 3600)
+        with self.assertRaises(ValueError):
+            export.exportFrames(self.filepath, 3600, pattern='%d.ppm', encoder=['cat'])
+
+    @unittest.skipIf(OpenGL == None, "PyOpenGL is not installed")
+    def test_render_frames(self):
+        # Two processes, each with its own OSMesa context, must render the same frames as one
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        script = ("from src import export\n"
+                  "if __name__ == '__main__':\n"
+                  "    for processes, name in [(1, 'serial'), (2, 'parallel')]:\n"
+                  "        export.exportFrames(%r, 14400, pattern=%r + '/' + name + '/%%03d.ppm', size=(64, 48), processes=processes, slicesize=2)\n"
+                  % (self.filepath, self.directory))
+        result = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True)
+        if result.returncode != 0 and 'osmesa' in result.stderr.lower():
+            self.skipTest("OSMesa is not available")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        for number in range(13):
+            with open(os.path.join(self.directory, 'serial', '%03d.ppm' % number), 'rb') as f:
+                serial = f.read()
+            with open(os.path.join(self.directory, 'parallel', '%03d.ppm' % number), 'rb') as f:
+                self.assertEqual(f.read(), serial)
+            self.assertTrue(serial.startswith(b'P6\n64 48\n255\n'))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
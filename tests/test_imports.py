@@ -0,0 +1,61 @@
+"""
+Tests for the import time of the physics modules.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET = 0.1            # seconds for "import src.nbody" (NumPy alone takes longer than this)
+
+
+def runPython(code, *options):
+    return subprocess.run([sys.executable] + list(options) + ['-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+
+
+def importTime(module):
+    # Cumulative import time of a module (in s), as reported by python -X importtime, at best of 3 runs.
+    times = []
+    for _ in range(3):
+        for line in runPython('import ' + module, '-X', 'importtime').stderr.splitlines():
+            fields = [field.strip() for field in line.split('|')]
+            if len(fields) == 3 and fields[2] == module:
+                times.append(int(fields[1]) * 1e-6)
+    return min(times)
+
+
+LOADED = "import sys; print(' '.join(sorted(m for m in sys.modules if m.startswith(('numpy.', 'OpenGL', 'PIL', 'multiprocessing', 'src.gravity', 'src.integrators')) and type(sys.modules[m]).__name__ != '_LazyModule')))"
+
+
+
+class TestImports(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        runPython('import src.nbody')               # warm up the bytecode and catalog caches
+
+    def test_import_budget(self):
+        self.assertLess(importTime('src.nbody'), BUDGET)
+
+    def test_physics_only_imports(self):
+        loaded = runPython('import src.nbody; ' + LOADED).stdout.split()
+        self.assertEqual(loaded, [])
+
+    def test_demos_without_rendering(self):
+        # Building and stepping a list-mode demo loads neither NumPy nor any rendering library.
+        loaded = runPython('import demos; nBody = demos.solar_system_scene(); nBody.update(3600); ' + LOADED).stdout.split()
+        self.assertEqual(loaded, [])
+
+    def test_array_mode_loads_engines(self):
+        loaded = runPython('import demos; from src.nbody import NBody; demos.solar_system_scene(NBody(arrays=True)).update(3600); ' + LOADED).stdout.split()
+        self.assertIn('src.gravity', loaded)
+        self.assertTrue(any(m.startswith('numpy.') for m in loaded))
+        self.assertFalse(any(m.startswith(('OpenGL', 'PIL', 'multiprocessing')) for m in loaded))
+
+
+
+if __name__ == "__main__":
+    unittest.main()
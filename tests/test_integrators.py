@@ -0,0 +1,167 @@
+"""
+Tests for the integrators file.
+"""
+
+import math
+import unittest
+
+import numpy as np
+
+import demos
+from src.nbody import *
+from src.integrators import INTEGRATORS
+from src.vector import Vector
+
+
+def keplerSystem(integrator, engine='direct'):
+    # A sun and an eccentric planet, with a 1 year orbit.
+    nBody = NBody(engine=engine, integrator=integrator)
+    nBody.addBody(Body("Sun", 2e30, 7e8)(Vector(0, 0), Vector(0, 0)))
+    nBody.addBody(Body("Planet", 6e24, 6.4e6)(Vector(1.5e11, 0), Vector(0, 3.4e4)))
+    return nBody
+
+
+def energy(nBody):
+    state = nBody.state
+    kinetic = 0.5 * (state.mass * (state.vel ** 2).sum(axis=1)).sum()
+    r = np.linalg.norm(state.pos[:, np.newaxis] - state.pos[np.newaxis], axis=2)
+    np.fill_diagonal(r, np.inf)
+    return kinetic - 0.5 * (G * state.mass[:, np.newaxis] * state.mass[np.newaxis] / r).sum()
+
+
+def energyError(integrator, deltatime, duration=3.15e7):
+    nBody = keplerSystem(integrator)
+    e0 = energy(nBody)
+    for _ in range(int(duration / deltatime)):
+        nBody.update(deltatime)
+    return abs(energy(nBody) / e0 - 1), nBody
+
+
+
+class TestIntegrators(unittest.TestCase):
+
+    def test_every_integrator_conserves_energy(self):
+        for name in INTEGRATORS:
+            error, _ = energyError(name, 86400)
+            self.assertLess(error, 1e-2, msg="%s does not conserve energy." % name)
+
+    def test_higher_orders_are_more_accurate(self):
+        euler, _ = energyError('euler', 86400)
+        for name in ['leapfrog', 'yoshida4', 'yoshida6', 'rk4', 'hermite']:
+            error, _ = energyError(name, 86400)
+            self.assertLess(error, euler / 5, msg="%s must be far more accurate than Euler at the same step." % name)
+
+    def test_fourth_order_convergence(self):
+        for name in ['yoshida4', 'rk4', 'hermite']:
+            coarse, _ = energyError(name, 4 * 86400)
+            fine, _ = energyError(name, 2 * 86400)
+            self.assertGreater(coarse / fine, 8, msg="Halving dt must reduce the error of %s by about 16." % name)
+
+    def test_force_evaluations_are_reused(self):
+        expected = {'euler': 1, 'leapfrog': 1, 'yoshida4': 3, 'yoshida6': 7, 'rk4': 4, 'hermite': 1, 'block': 1}
+        for name, perstep in expected.items():
+            nBody = keplerSystem(name)
+            nBody.update(86400)
+            before = nBody.integrator.evaluations
+            for _ in range(10):
+                nBody.update(86400)
+            self.assertEqual(nBody.integrator.evaluations - before, 10 * perstep, msg="Wrong number of force evaluations for %s." % name)
+
+    def test_euler_matches_list_mode(self):
+        listNBody, arrayNBody = keplerSystem(None, engine=None), keplerSystem('euler')
+        for _ in range(10):
+            listNBody.update(86400)
+            arrayNBody.update(86400)
+        self.assertLess(abs(listNBody[1].pos - arrayNBody[1].pos), 1e-3)
+
+    def test_changed_state_is_not_reused(self):
+        for name, system in (('leapfrog', keplerSystem), ('wh', demos.solar_system_scene)):
+            nBody = system(NBody(integrator=name)) if name == 'wh' else system(name)
+            nBody.update(86400)
+            nBody[1](pos=Vector(1e11, 0))
+            before = nBody.integrator.evaluations
+            nBody.update(86400)
+            self.assertEqual(nBody.integrator.evaluations - before, 2, msg="Moving a body must force a new evaluation with %s." % name)
+
+    def test_wisdom_holman_long_steps(self):
+        # With one planet nearly all of the motion is the Kepler drift, so a month-long step stays accurate where leapfrog and yoshida4 fail
+        error, nBody = energyError('wh', 30 * 86400, duration=360 * 86400)
+        self.assertLess(error, 1e-7)
+        self.assertGreater(energyError('yoshida4', 30 * 86400, duration=360 * 86400)[0], 1e-3)
+        reference = energyError('hermite', 3600, duration=360 * 86400)[1]
+        np.testing.assert_allclose(nBody.state.pos, reference.state.pos, atol=1e6)
+
+    def test_wisdom_holman_planets(self):
+        # Far smaller energy errors than leapfrog at the same step, with the total momentum kept
+        errors = dict()
+        for name in ('leapfrog', 'wh'):
+            nBody = demos.solar_system_scene(NBody(integrator=name))
+            momentum = nBody.state.mass @ nBody.state.vel
+            e0 = energy(nBody)
+            for _ in range(200):
+                nBody.update(4 * 86400)
+            errors[name] = abs(energy(nBody) / e0 - 1)
+        self.assertLess(errors['wh'], 1e-7)
+        self.assertLess(errors['wh'], errors['leapfrog'] / 100)
+        self.assertEqual(nBody.integrator.evaluations, 201, msg="One interaction evaluation per step.")
+        scale = nBody.state.mass @ np.linalg.norm(nBody.state.vel, axis=1)
+        np.testing.assert_allclose(nBody.state.mass @ nBody.state.vel, momentum, atol=1e-14 * scale)
+
+    def test_wisdom_holman_central_body(self):
+        # The parent in the astronomical data, else the heaviest body, unless one is given
+        for scene, central in (('solar_system', 'Sun'), ('trappist_1', 'Trappist-1a'), ('earth_and_moon', 'Earth')):
+            nBody = demos.SCENES[scene](NBody(integrator='wh'))
+            self.assertEqual(nBody[nBody.integrator.centralIndex(nBody)].name, central)
+        nBody = keplerSystem('wh')
+        nBody.addBody(Body("Star", 3e30, 7e8)(Vector(-1e13, 0), Vector(0, 0)))
+        self.assertEqual(nBody.integrator.centralIndex(nBody), 2)
+        nBody.setIntegrator(INTEGRATORS['wh'](central=0))
+        self.assertEqual(nBody.integrator.centralIndex(nBody), 0)
+
+    def test_wisdom_holman_removed_bodies(self):
+        nBody = demos.solar_system_scene(NBody(integrator='wh'))
+        nBody.update(86400)
+        nBody.removeBody(nBody[0])
+        nBody.removeBody(nBody[3])
+        nBody.update(86400)
+        self.assertEqual(len(nBody.integrator.coordinates[2]), 6)
+        self.assertTrue(np.isfinite(nBody.state.pos).all())
+
+    def test_block_timesteps_save_evaluations(self):
+        # An inner moon needs far smaller steps than an outer planet.
+        nBody = keplerSystem('block')
+        nBody.addBody(Body("Moon", 7e22, 1.7e6)(Vector(1.504e11, 0), Vector(0, 3.4e4 + 1e3)))
+        nBody.addBody(Body("Giant", 2e27, 7e7)(Vector(-7.8e11, 0), Vector(0, -1.3e4)))
+        e0 = energy(nBody)
+        for _ in range(12):
+            nBody.update(30 * 86400)
+        done, shared, saved = nBody.integrator.savings()
+        self.assertLess(done, shared)
+        self.assertGreater(saved, 0.3, msg="Slow bodies must not be evaluated at the fastest body's step.")
+        self.assertGreater(nBody.integrator.levels[2], nBody.integrator.levels[3], msg="The inner orbit must get the smaller block.")
+        self.assertLess(abs(energy(nBody) / e0 - 1), 1e-6)
+
+    def test_block_timesteps_backwards(self):
+        # A zero step leaves the system untouched, and stepping back by the same dt returns it to where it started
+        nBody = keplerSystem('block')
+        nBody.addBody(Body("Moon", 7e22, 1.7e6)(Vector(1.504e11, 0), Vector(0, 3.4e4 + 1e3)))
+        start = nBody.state.pos.copy()
+        nBody.update(0)
+        np.testing.assert_array_equal(nBody.state.pos, start)
+        for deltatime in (86400, -86400):
+            for _ in range(10):
+                nBody.update(deltatime)
+            self.assertTrue((nBody.integrator.levels > 0).any())
+        np.testing.assert_allclose(nBody.state.pos, start, rtol=0, atol=1e-6 * np.abs(start).max())
+
+    def test_hermite_needs_jerks(self):
+        nBody = keplerSystem('hermite', engine='barnes-hut')
+        self.assertRaises(ValueError, nBody.update, 86400)
+
+    def test_unknown_integrator(self):
+        self.assertRaises(ValueError, NBody, integrator='midpoint')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
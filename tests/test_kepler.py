@@ -0,0 +1,95 @@
+"""
+Tests for the universal-variable Kepler solver.
+"""
+
+import unittest
+
+import numpy as np
+
+from src import kepler
+
+
+def orbitInvariants(pos, vel, mu=1.0):
+    # Specific energy, angular momentum and eccentricity vector of every orbit.
+    r = np.linalg.norm(pos, axis=1)
+    v2 = np.einsum('ij,ij->i', vel, vel)
+    h = np.cross(pos, vel)
+    e = np.cross(vel, h) / mu - pos / r[:, np.newaxis]
+    return v2 / 2 - mu / r, h, e
+
+
+
+class TestStumpff(unittest.TestCase):
+
+    def test_series_and_closed_forms_agree(self):
+        z = np.array([-40, -1.5, -1, -0.5, 0.5, 1, 1.5, 40])
+        C, S = kepler.stumpff(z)
+        s = np.sqrt(np.abs(z))
+        np.testing.assert_allclose(C, np.where(z > 0, (1 - np.cos(s)) / z, (np.cosh(s) - 1) / -z), rtol=1e-13)
+        np.testing.assert_allclose(S, np.where(z > 0, (s - np.sin(s)) / s ** 3, (np.sinh(s) - s) / s ** 3), rtol=1e-12)
+
+        # Near 0, where the closed forms cancel out
+        C, S = kepler.stumpff(np.array([-1e-9, 0, 1e-9]))
+        np.testing.assert_allclose(C, [0.5 + 1e-9 / 24, 0.5, 0.5 - 1e-9 / 24], rtol=1e-15)
+        np.testing.assert_allclose(S, [1 / 6 + 1e-9 / 120, 1 / 6, 1 / 6 - 1e-9 / 120], rtol=1e-15)
+
+        # Both branches meet at |z| = 1
+        for edge in (-1, 1):
+            inside, outside = kepler.stumpff(np.array([edge * (1 - 1e-12)])), kepler.stumpff(np.array([edge * (1 + 1e-12), 5.0]))
+            np.testing.assert_allclose([inside[0][0], inside[1][0]], [outside[0][0], outside[1][0]], rtol=1e-11)
+
+
+
+class TestKeplerDrift(unittest.TestCase):
+
+    def test_circular(self):
+        # A circular orbit turns by n t
+        pos, vel = np.array([[2.0, 0, 0]]), np.array([[0, 2 ** -0.5, 0]])
+        n = 2 ** -1.5
+        for t in (0.01, 1.0, 7.3, 100.0):
+            newpos, newvel = kepler.keplerDrift(pos, vel, 1.0, t)
+            np.testing.assert_allclose(newpos[0], 2 * np.array([np.cos(n * t), np.sin(n * t), 0]), atol=1e-12)
+            np.testing.assert_allclose(newvel[0], 2 ** -0.5 * np.array([-np.sin(n * t), np.cos(n * t), 0]), atol=1e-12)
+
+    def test_periodic(self):
+        # Eccentric orbits return after a whole period, and many periods cost no more than a fraction of one
+        rng = np.random.default_rng(0)
+        pos, vel = rng.normal(size=(50, 3)), rng.normal(size=(50, 3)) * 0.5
+        energy = orbitInvariants(pos, vel)[0]
+        pos, vel = pos[energy < 0], vel[energy < 0]
+        a = -1 / (2 * orbitInvariants(pos, vel)[0])
+        period = 2 * np.pi * a ** 1.5
+        for k in range(len(pos)):
+            newpos, newvel = kepler.keplerDrift(pos[k:k + 1], vel[k:k + 1], 1.0, period[k])
+            np.testing.assert_allclose(newpos, pos[k:k + 1], atol=1e-9 * a[k])
+            later = kepler.keplerDrift(pos[k:k + 1], vel[k:k + 1], 1.0, 10.3 * period[k])[0]
+            np.testing.assert_allclose(later, kepler.keplerDrift(pos[k:k + 1], vel[k:k + 1], 1.0, 0.3 * period[k])[0], atol=1e-8 * a[k])
+
+    def test_every_conic(self):
+        # Bound, nearly parabolic and unbound orbits keep their invariants, over short and long steps, forwards and backwards
+        rng = np.random.default_rng(1)
+        pos = rng.normal(size=(300, 3))
+        vel = rng.normal(size=(300, 3))
+        vel *= (np.sqrt(2 / np.linalg.norm(pos, axis=1)) * rng.uniform(0.2, 2.5, 300) / np.linalg.norm(vel, axis=1))[:, np.newaxis]
+        vel[:10] *= (np.sqrt(2 / np.linalg.norm(pos[:10], axis=1)) / np.linalg.norm(vel[:10], axis=1))[:, np.newaxis]     # parabolic
+        before = orbitInvariants(pos, vel)
+        for dt in (1e-3, 0.1, 5.0, -5.0, 300.0):
+            newpos, newvel = kepler.keplerDrift(pos, vel, 1.0, dt)
+            after = orbitInvariants(newpos, newvel)
+            np.testing.assert_allclose(after[0], before[0], atol=1e-11)
+            np.testing.assert_allclose(after[1], before[1], atol=1e-11)
+            np.testing.assert_allclose(after[2], before[2], atol=1e-9)
+            back = kepler.keplerDrift(newpos, newvel, 1.0, -dt)
+            np.testing.assert_allclose(back[0], pos, atol=1e-9 * max(1, np.abs(newpos).max()))
+
+    def test_several_central_masses(self):
+        pos, vel = np.array([[1.0, 0, 0], [1.0, 0, 0]]), np.array([[0, 1.0, 0], [0, 2.0, 0]])
+        both = kepler.keplerDrift(pos, vel, np.array([1.0, 4.0]), 0.7)
+        for k, mu in enumerate((1.0, 4.0)):
+            one = kepler.keplerDrift(pos[k:k + 1], vel[k:k + 1], mu, 0.7)
+            np.testing.assert_allclose(both[0][k], one[0][0], rtol=1e-14)
+            np.testing.assert_allclose(both[1][k], one[1][0], rtol=1e-14)
+
+
+if __name__ == '__main__':
+    unittest.main()
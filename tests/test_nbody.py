@@ -5,14 +5,94 @@ Tests for the nbody file.
 import unittest
 
 from src.nbody import *
+from src import gravity
 from src.vector import Vector
 
 
+def twoBodySystem(nBody):
+    nBody.addBody(Body("Star", 2e30, 7e8)(Vector(0, 0), Vector(0, 0)))
+    nBody.addBody(Body("Planet", 6e24, 6.4e6, rotational_velocity=465)(Vector(1.5e11, 0), Vector(0, 3e4)))
+    nBody.addBody(Body("Moon", 7e22, 1.7e6)(Vector(1.504e11, 0), Vector(0, 3.1e4)))
+    return nBody
+
+
+
 class TestBody(unittest.TestCase):
 
     def test_Body_Contruction(self):
         self.assertEqual(True, True, "Something's really wrong!")
 
 
+
+class TestArrayNBody(unittest.TestCase):
+
+    def test_array_mode_matches_list_mode(self):
+        listNBody, arrayNBody = twoBodySystem(NBody()), twoBodySystem(NBody(arrays=True))
+        for _ in range(100):
+            listNBody.update(3600)
+            arrayNBody.update(3600)
+        for a, b in zip(listNBody, arrayNBody):
+            self.assertLess(abs(a.pos - b.pos), 1e-9 * abs(a.pos) + 1e-6, msg="Array-backed positions must match the list-based update.")
+            self.assertAlmostEqual(a.angle, b.angle, msg="Array-backed rotation must match the list-based update.")
+
+    def test_bodies_are_views_of_the_arrays(self):
+        nBody = twoBodySystem(NBody(arrays=True))
+        nBody[1](pos=Vector(1, 2, 3))
+        self.assertEqual(list(nBody.state.pos[1]), [1, 2, 3], msg="Setting a body attribute must write to the state arrays.")
+        nBody.state.vel[2] = (4, 5, 6)
+        self.assertEqual(nBody[2].vel, Vector(4, 5, 6), msg="Body attributes must read from the state arrays.")
+
+    def test_switching_to_arrays_keeps_state(self):
+        nBody = twoBodySystem(NBody())
+        positions = [body.pos for body in nBody]
+        nBody.setEngine('direct')
+        self.assertEqual([body.pos for body in nBody], positions, msg="Switching to array-backed mode must keep the body state.")
+
+    def test_remove_body_reindexes(self):
+        nBody = twoBodySystem(NBody(arrays=True))
+        planet = nBody[1]
+        nBody.removeBody(planet)
+        self.assertEqual(nBody.state.N, 2)
+        self.assertEqual(nBody[1].name, "Moon")
+        self.assertEqual(nBody[1].pos, Vector(1.504e11, 0), msg="Bodies after a removed body must still view their own rows.")
+        self.assertEqual(planet.pos, Vector(1.5e11, 0), msg="A removed body must keep its state.")
+
+    def test_tiled_accelerations_match_untiled(self):
+        nBody = twoBodySystem(NBody(arrays=True))
+        untiled = nBody.engine.accelerations(nBody.state.pos, nBody.state.mass)
+        tiled = gravity.DirectEngine(maxpairs=1).accelerations(nBody.state.pos, nBody.state.mass)
+        self.assertTrue((abs(untiled - tiled) <= 1e-12 * abs(untiled)).all(), msg="Tiling must not change the accelerations.")
+
+    def test_copy_keeps_array_mode(self):
+        nBody = twoBodySystem(NBody(arrays=True))
+        copy = nBody.__copy__()
+        self.assertIsNotNone(copy.state)
+        self.assertEqual([body.pos for body in copy], [body.pos for body in nBody])
+
+    def test_copy_is_independent(self):
+        # A copy has its own engine and integrator, with the same options and no force caches, and steps like the original
+        for integrator in (integrators.BlockHermite(eta=0.05, maxlevel=8), integrators.WisdomHolman(central=0), integrators.Leapfrog()):
+            nBody = twoBodySystem(NBody(engine=gravity.DirectEngine(maxpairs=4), integrator=integrator))
+            nBody.setSoftening(1e5)
+            nBody.engine.potentials = True
+            nBody.update(3600)
+            copied = nBody.__copy__()
+            self.assertIsNot(copied.engine, nBody.engine)
+            self.assertIsNot(copied.integrator, nBody.integrator)
+            self.assertEqual((copied.engine.maxpairs, copied.engine.softening, copied.softening), (4, 1e5, 1e5))
+            self.assertIsNone(copied.integrator.cached)
+            for option in ('eta', 'maxlevel', 'central'):
+                self.assertEqual(getattr(copied.integrator, option, None), getattr(integrator, option, None))
+
+            copied.engine.accelerations(copied.state.pos, copied.state.mass)
+            potential = copied.engine.potential.copy()
+            nBody.update(3600)
+            self.assertTrue((copied.engine.potential == potential).all(), msg="Stepping the original must not change the copy's engine.")
+            copied.update(3600)
+            for a, b in zip(copied, nBody):
+                self.assertLess(abs(a.pos - b.pos), 1e-12 * abs(b.pos) + 1e-6)
+
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,72 @@
+"""
+Tests for the parallel direct force evaluation.
+"""
+
+import pickle
+import unittest
+
+import numpy as np
+
+import demos
+from src.gravity import DirectEngine
+from src.nbody import NBody
+
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = DirectEngine(maxpairs=2**16, workers=3)
+        rng = np.random.default_rng(3)
+        cls.pos = rng.normal(size=(700, 3)) * 1e11
+        cls.vel = rng.normal(size=(700, 3)) * 1e3
+        cls.mass = rng.uniform(1e20, 1e25, 700)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.setWorkers(1)
+
+    def test_identical_to_serial(self):
+        serial = DirectEngine(maxpairs=2**16)
+        self.assertTrue(np.array_equal(self.engine.accelerations(self.pos, self.mass), serial.accelerations(self.pos, self.mass)))
+        self.assertIsNotNone(self.engine.pool)
+
+        targets = np.array([699, 3, 250, 4])
+        acc, jerk = self.engine.accelerationsAndJerks(self.pos, self.vel, self.mass, targets=targets)
+        sacc, sjerk = serial.accelerationsAndJerks(self.pos, self.vel, self.mass, targets=targets)
+        self.assertTrue(np.array_equal(acc, sacc) and np.array_equal(jerk, sjerk))
+
+    def test_growing_system(self):
+        pos = np.concatenate([self.pos, self.pos[:500] + 1e9])
+        mass = np.concatenate([self.mass, self.mass[:500]])
+        self.engine.accelerations(self.pos, self.mass)
+        self.assertTrue(np.array_equal(self.engine.accelerations(pos, mass), DirectEngine(maxpairs=2**16).accelerations(pos, mass)))
+
+    def test_pickle(self):
+        self.engine.accelerations(self.pos, self.mass)
+        engine = pickle.loads(pickle.dumps(self.engine))
+        self.assertEqual(engine.workers, 3)
+        self.assertIsNone(engine.pool)
+
+
+
+class TestNBodyWorkers(unittest.TestCase):
+
+    def test_set_workers(self):
+        nBody = demos.solar_system_scene(NBody())
+        nBody.setWorkers(2)
+        self.assertIsNotNone(nBody.state)
+        self.assertEqual(nBody.engine.workers, 2)
+        nBody.setEngine('direct')
+        self.assertEqual(nBody.engine.workers, 2)
+        nBody.setWorkers(1)
+
+    def test_unsupported_engine(self):
+        nBody = NBody(engine='barnes-hut')
+        self.assertRaises(ValueError, nBody.setWorkers, 2)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+Tests for the particlemesh file.
+"""
+
+import unittest
+
+import numpy as np
+
+from src.gravity import DirectEngine
+from src.nbody import NBody
+from src.particlemesh import ParticleMeshEngine, P3MEngine, pairsWithin
+
+
+def randomCluster(N, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(N, 3)) * 1e11, rng.uniform(1e20, 1e24, N)
+
+
+def relativeErrors(acc, ref):
+    return np.linalg.norm(acc - ref, axis=1) / np.linalg.norm(ref, axis=1)
+
+
+
+class TestParticleMesh(unittest.TestCase):
+
+    def test_distant_clusters(self):
+        # The net force between two well-separated clusters does not depend on the mesh resolution inside them.
+        pos, mass = randomCluster(400)
+        pos[200:] += 4e12
+        def netForce(engine):
+            return (mass[:200, np.newaxis] * engine.accelerations(pos, mass)[:200]).sum(axis=0, keepdims=True)
+        err = relativeErrors(netForce(ParticleMeshEngine(ngrid=32)), netForce(DirectEngine()))
+        self.assertLess(err[0], 0.01, msg="Mesh forces must match direct summation on scales much larger than a cell.")
+
+    def test_periodic_padding_differs(self):
+        pos, mass = randomCluster(300)
+        isolated = ParticleMeshEngine(ngrid=16).accelerations(pos, mass)
+        periodic = ParticleMeshEngine(ngrid=16, padding=1).accelerations(pos, mass)
+        self.assertGreater(np.abs(isolated - periodic).max(), 0)
+
+    def test_p3m_tolerance(self):
+        pos, mass = randomCluster(1500)
+        err = relativeErrors(P3MEngine(ngrid=32).accelerations(pos, mass), DirectEngine().accelerations(pos, mass))
+        self.assertLess(np.median(err), 0.02)
+        self.assertLess(np.percentile(err, 99), 0.05)
+
+    def test_p3m_beats_plain_mesh(self):
+        pos, mass = randomCluster(1000)
+        ref = DirectEngine().accelerations(pos, mass)
+        plain = relativeErrors(ParticleMeshEngine(ngrid=32).accelerations(pos, mass), ref)
+        corrected = relativeErrors(P3MEngine(ngrid=32).accelerations(pos, mass), ref)
+        self.assertLess(np.percentile(corrected, 99), np.percentile(plain, 99))
+
+    def test_coincident_bodies(self):
+        for engine in (ParticleMeshEngine(ngrid=16), P3MEngine(ngrid=16)):
+            np.testing.assert_array_equal(engine.accelerations(np.zeros((2, 3)), np.ones(2)), 0)
+            np.testing.assert_array_equal(engine.accelerations(np.ones((5, 3)), np.ones(5)), 0)
+
+        # One duplicated body among distinct ones: finite, and the same as if the pair were a single body of their total mass (up to the mesh's self-force)
+        pos, mass = randomCluster(300)
+        pos[1] = pos[0]
+        merged = np.delete(pos, 1, axis=0), np.concatenate([[mass[0] + mass[1]], mass[2:]])
+        acc = P3MEngine(ngrid=16).accelerations(pos, mass)
+        self.assertTrue(np.isfinite(acc).all())
+        np.testing.assert_allclose(acc[2:], P3MEngine(ngrid=16).accelerations(*merged)[1:], rtol=1e-9, atol=1e-12 * np.abs(acc).max())
+
+    def test_kernel_follows_options(self):
+        # Changing the grid options of an engine in use gives the same forces as a new engine with those options
+        pos, mass = randomCluster(300)
+        engine = ParticleMeshEngine(ngrid=16)
+        engine.accelerations(pos, mass)
+        for option, value in (('ngrid', 24), ('padding', 1), ('shortrange', True), ('splitscale', 2.0)):
+            setattr(engine, option, value)
+            fresh = ParticleMeshEngine(ngrid=engine.ngrid, padding=engine.padding, shortrange=engine.shortrange, splitscale=engine.splitscale)
+            np.testing.assert_array_equal(engine.accelerations(pos, mass), fresh.accelerations(pos, mass), err_msg=option)
+
+    def test_selectable_per_nbody(self):
+        self.assertIsInstance(NBody(engine='particle-mesh').engine, ParticleMeshEngine)
+        self.assertTrue(NBody(engine='p3m').engine.shortrange)
+
+
+
+class TestPairsWithin(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        pos, _ = randomCluster(300)
+        radius = 5e10
+        d = np.linalg.norm(pos[:, np.newaxis] - pos[np.newaxis], axis=2)
+        expected = {(i, j) for i, j in zip(*np.nonzero(d < radius)) if i < j}
+        for maxpairs in [2**21, 50]:
+            found = {(min(i, j), max(i, j)) for chunk in pairsWithin(pos, radius, maxpairs) for i, j in zip(*chunk)}
+            self.assertEqual(found, expected)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
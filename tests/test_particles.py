@@ -0,0 +1,156 @@
+"""
+Tests for the massless test particles and the belt and ring generators.
+"""
+
+import copy
+import unittest
+
+import numpy as np
+
+import demos
+from src import diagnostics
+from src import gravity
+from src import particles
+from src.nbody import NBody, Body
+from src.vector import Vector
+
+
+def withMasslessBodies(nBody, population):
+    # A copy of an NBody with the test particles as bodies of zero mass instead.
+    copied = copy.copy(nBody)
+    for k, (pos, vel) in enumerate(zip(population.pos.tolist(), population.vel.tolist())):
+        copied.addBody(Body('particle%d' % k, 0.0, 1.0)(Vector(*pos), Vector(*vel)))
+    return copied
+
+
+
+class TestElements(unittest.TestCase):
+
+    def test_kepler_equation(self):
+        rng = np.random.default_rng(0)
+        mean, e = rng.uniform(-10, 10, 1000), rng.uniform(0, 0.99, 1000)
+        E = particles.eccentricAnomaly(mean, e)
+        np.testing.assert_allclose(np.remainder(E - e * np.sin(E) - mean + np.pi, 2 * np.pi) - np.pi, 0, atol=1e-12)
+
+    def test_from_elements_inverts_orbital_elements(self):
+        rng = np.random.default_rng(1)
+        count, mass = 200, 2e30
+        a = rng.uniform(1e10, 1e12, count) * np.where(np.arange(count) % 4 == 0, -1, 1)       # some hyperbolic orbits
+        e = np.where(a > 0, rng.uniform(0.01, 0.95, count), rng.uniform(1.1, 3, count))
+        i, node, periapsis = rng.uniform(0.01, 3.1, count), rng.uniform(0, 2 * np.pi, count), rng.uniform(0, 2 * np.pi, count)
+        anomaly = np.where(a > 0, rng.uniform(0, 2 * np.pi, count), rng.uniform(-1, 1, count) * np.arccos(-1 / np.maximum(e, 1)) * 0.9)
+        pos, vel = particles.fromElements(a, e, i, node, periapsis, anomaly, gravity.G * mass)
+
+        # As bodies of zero mass about a central body at the origin
+        elements = diagnostics.orbitalElements(np.concatenate([np.zeros((1, 3)), pos]), np.concatenate([np.zeros((1, 3)), vel]), np.concatenate([[mass], np.zeros(count)]))
+        for name, expected in (('a', a), ('e', e), ('i', i)):
+            np.testing.assert_allclose(elements[name][1:], expected, rtol=1e-9, err_msg=name)
+        for name, expected in (('ascendingnode', node), ('periapsis', periapsis), ('anomaly', anomaly)):
+            np.testing.assert_allclose(np.cos(elements[name][1:] - expected), 1, atol=1e-12, err_msg=name)
+
+
+
+class TestGenerators(unittest.TestCase):
+
+    def test_belt(self):
+        sun = Body('Sun', 2e30, 7e8)(Vector(1e9, 0, 0), Vector(0, 1e3, 0))
+        belt = particles.belt(sun, 5000, a=(3e11, 5e11), e=(0.0, 0.2), i=(0.0, 0.3), seed=2)
+        self.assertEqual((len(belt), belt.pos.shape, belt.vel.shape), (5000, (5000, 3), (5000, 3)))
+
+        elements = diagnostics.orbitalElements(np.concatenate([[[1e9, 0, 0]], belt.pos]), np.concatenate([[[0, 1e3, 0]], belt.vel]), np.concatenate([[2e30], np.zeros(5000)]))
+        for name, low, high in (('a', 3e11, 5e11), ('e', 0.0, 0.2), ('i', 0.0, 0.3)):
+            values = elements[name][1:]
+            self.assertTrue(low - 1e-6 * high <= values.min() and values.max() <= high * (1 + 1e-6), msg=name)
+            self.assertLess(abs(values.mean() - (low + high) / 2), 0.02 * (high - low), msg="%s must be drawn uniformly." % name)
+        self.assertLess(abs(np.cos(elements['anomaly'][1:]).mean() + elements['e'][1:].mean()), 0.02, msg="The particles must be spread uniformly in time along their orbits.")     # <cos v> = -e
+
+        np.testing.assert_array_equal(particles.belt(sun, 10, a=(3e11, 5e11), seed=3).pos, particles.belt(sun, 10, a=(3e11, 5e11), seed=3).pos)
+        with self.assertRaises(ValueError):
+            particles.belt(sun, 10, a=(3e11, 5e11), e=(0.5, 1.0))
+
+    def test_ring(self):
+        saturn = Body('Saturn', 5.68e26, 5.8e7)
+        tilt = np.radians(26.7)
+        ring = particles.ring(saturn, 5000, 7e7, 1.4e8, thickness=1e4, tilt=tilt, seed=4)
+        normal = np.array([0, -np.sin(tilt), np.cos(tilt)])
+        height = ring.pos @ normal
+        radius = np.linalg.norm(ring.pos, axis=1)
+        self.assertTrue((np.abs(height) <= 5e3 * (1 + 1e-9)).all() and np.abs(height).max() > 4e3)
+        self.assertTrue((radius >= 7e7 * (1 - 1e-12)).all() and (radius <= 1.4e8 * (1 + 1e-12)).all())
+        np.testing.assert_allclose(np.linalg.norm(ring.vel, axis=1), np.sqrt(gravity.G * 5.68e26 / radius), rtol=1e-12)       # circular orbits
+        np.testing.assert_allclose(np.einsum('ij,ij->i', ring.pos, ring.vel), 0, atol=1e-3 * 7e7)
+        self.assertLess(abs(np.mean(radius < np.sqrt((7e7 ** 2 + 1.4e8 ** 2) / 2)) - 0.5), 0.03, msg="The ring must be uniform in area.")
+
+
+
+class TestParticleDynamics(unittest.TestCase):
+
+    def test_field_accelerations(self):
+        rng = np.random.default_rng(5)
+        pos, mass, targets = rng.normal(0, 1e9, (7, 3)), rng.uniform(1e20, 1e24, 7), rng.normal(0, 1e9, (300, 3))
+        # The same as the accelerations of bodies of zero mass among the others, in any tiling
+        expected = gravity.DirectEngine().accelerations(np.concatenate([pos, targets]), np.concatenate([mass, np.zeros(300)]))
+        np.testing.assert_allclose(gravity.fieldAccelerations(targets, pos, mass), expected[7:], rtol=1e-12)
+        np.testing.assert_allclose(gravity.fieldAccelerations(targets[:5], pos, mass, maxpairs=20), expected[7:12], rtol=1e-12)        # fewer targets than bodies, in tiles
+        softened = gravity.DirectEngine(softening=3e8).accelerations(np.concatenate([pos, targets]), np.concatenate([mass, np.zeros(300)]))
+        np.testing.assert_allclose(gravity.fieldAccelerations(targets, pos, mass, softening=3e8), softened[7:], rtol=1e-12)
+        np.testing.assert_allclose(gravity.fieldAccelerations(targets[:5], pos, mass, softening=3e8), softened[7:12], rtol=1e-12)
+        np.testing.assert_array_equal(gravity.fieldAccelerations(targets, pos[:0], mass[:0]), 0)
+
+    def test_same_as_massless_bodies(self):
+        # Test particles follow the orbits of bodies of zero mass, and leave the bodies untouched
+        for integrator, rtol in (('euler', 1e-9), ('leapfrog', 1e-9), ('yoshida4', 1e-9), ('wh', 1e-7)):
+            nBody = demos.solar_system_scene(NBody(integrator=integrator))
+            alone = copy.copy(nBody)
+            belt = particles.belt(nBody[0], 50, a=(3e11, 5e11), e=(0.0, 0.2), i=(0.0, 0.3), seed=6)
+            massless = withMasslessBodies(nBody, belt)
+            nBody.addParticles(belt)
+            for _ in range(50):
+                for system in (nBody, alone, massless):
+                    system.update(86400 * 4)
+            np.testing.assert_array_equal(nBody.state.pos, alone.state.pos, err_msg=integrator)
+            np.testing.assert_allclose(nBody.particles.pos, massless.state.pos[9:], rtol=rtol, err_msg=integrator)
+            np.testing.assert_allclose(nBody.particles.vel, massless.state.vel[9:], rtol=rtol, err_msg=integrator)
+
+    def test_forces_are_reused(self):
+        nBody = demos.solar_system_scene(NBody(integrator='leapfrog'))
+        nBody.addParticles(particles.belt(nBody[0], 100, a=(3e11, 5e11), seed=7))
+        nBody.setProfiler()
+        for _ in range(10):
+            nBody.update(86400)
+        self.assertEqual(nBody.integrator.evaluations, 11)
+        self.assertIn('forces', nBody.profiler.report()['phases'])
+
+    def test_planetary_ring(self):
+        # A ring about a planet with a moon stays on circular orbits inside the moon's orbit, with the planet as the central body of the wh integrator
+        nBody = NBody(integrator='wh')
+        nBody.addBody(Body('Planet', 5.68e26, 5.8e7))
+        nBody.addBody(Body('Moon', 1.3e23, 2.6e6)(Vector(1.2e9, 0, 0), Vector(0, 5.6e3, 0)))
+        nBody.addParticles(particles.ring(nBody[0], 1000, 7e7, 1.4e8, thickness=1e4, seed=8))
+        radius = np.linalg.norm(nBody.particles.pos - nBody.state.pos[0], axis=1)
+        for _ in range(200):
+            nBody.update(600)
+        np.testing.assert_allclose(np.linalg.norm(nBody.particles.pos - nBody.state.pos[0], axis=1), radius, rtol=1e-4)
+
+    def test_adding_and_copying(self):
+        nBody = demos.solar_system_scene()
+        sun = nBody[0]
+        nBody.addParticles(particles.belt(sun, 10, a=(3e11, 5e11), seed=9))
+        self.assertIsNotNone(nBody.state)           # switched to array mode
+        nBody.addParticles(particles.ring(sun, 5, 1e9, 2e9, seed=10))
+        self.assertEqual((nBody.particles.N, nBody.N), (15, 9))
+        nBody.update(3600)
+
+        copied = copy.copy(nBody)
+        np.testing.assert_array_equal(copied.particles.pos, nBody.particles.pos)
+        copied.update(3600)
+        self.assertFalse(np.array_equal(copied.particles.pos, nBody.particles.pos))
+
+        for integrator in ('rk4', 'hermite', 'block'):
+            nBody.setIntegrator(integrator)
+            with self.assertRaises(ValueError):
+                nBody.update(3600)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Tests for the physics child process and its shared-memory frames.
+"""
+
+import time
+import unittest
+
+import numpy as np
+
+import demos
+from src.nbody import NBody, Body
+from src.physicsprocess import PhysicsProcess, SharedRing
+from src.vector import Vector
+
+try:
+    import OpenGL
+except ImportError:
+    OpenGL = None
+
+
+def waitFor(condition, timeout=30):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            raise AssertionError("Timed out.")
+        time.sleep(0.01)
+
+
+
+class TestSharedRing(unittest.TestCase):
+
+    def test_publish_and_read(self):
+        nBody = demos.solar_system_scene(NBody(arrays=True))
+        ids = {body: k for k, body in enumerate(nBody.bodies)}
+        writer = SharedRing(4, nBody.N)
+        reader = SharedRing(4, nBody.N, writer.name)
+        try:
+            for _ in range(6):
+                nBody.update(3600)
+                writer.publish(nBody, ids)
+            frame = reader.read(6, None)
+            self.assertEqual((frame.serial, frame.time), (6, nBody.time))
+            self.assertTrue(np.array_equal(frame.pos, nBody.state.pos) and np.array_equal(frame.radius, nBody.state.radius))
+            self.assertEqual(frame.ids.tolist(), list(range(nBody.N)))
+            self.assertIsNone(reader.read(2, frame))           # overwritten by publish 6
+            self.assertIsNone(reader.read(7, frame))           # not published yet
+
+            nBody.removeBody(nBody[3])
+            writer.publish(nBody, ids)
+            self.assertEqual(reader.read(7, frame).ids.tolist(), [0, 1, 2, 4, 5, 6, 7, 8])
+            with self.assertRaises(ValueError):
+                nBody.addBody(Body('a', 1, 1))
+                nBody.addBody(Body('b', 1, 1))
+                writer.publish(nBody, ids)
+        finally:
+            reader.close()
+            writer.close(unlink=True)
+
+    def test_test_particles(self):
+        nBody = demos.asteroid_belt_scene(NBody(integrator='leapfrog'))
+        ids = {body: k for k, body in enumerate(nBody.bodies)}
+        writer = SharedRing(4, nBody.N, particlecapacity=nBody.particles.N)
+        reader = SharedRing(4, nBody.N, writer.name, nBody.particles.N)
+        try:
+            nBody.update(3600)
+            writer.publish(nBody, ids)
+            np.testing.assert_array_equal(reader.read(1, None).particles, nBody.particles.pos)
+            with self.assertRaises(ValueError):
+                nBody.particles.add(nBody.particles.copy())
+                writer.publish(nBody, ids)
+        finally:
+            reader.close()
+            writer.close(unlink=True)
+
+
+
+class TestPhysicsProcess(unittest.TestCase):
+
+    def test_stepping(self):
+        # Paused at first, then fixed steps published in order, the same as stepping in-thread
+        nBody = demos.solar_system_scene(NBody(integrator='leapfrog'))
+        physics = PhysicsProcess(nBody, 3600, speed=3600 * 200, paused=True)
+        try:
+            waitFor(lambda: physics.latest().N == nBody.N)
+            time.sleep(0.2)
+            self.assertEqual(physics.steps, 0)
+            self.assertEqual(physics.latest().time, 0)
+
+            physics.setPaused(False)
+            waitFor(lambda: physics.steps >= 20)
+            physics.setPaused(True)
+            time.sleep(0.2)
+            steps = physics.steps
+            waitFor(lambda: physics.latest().serial == steps + 1)
+            previous, latest = physics.latestTwo()
+            self.assertEqual((latest.time, latest.time - previous.time), (3600 * steps, 3600))
+            self.assertEqual([body.name for body in latest.bodies], [body.name for body in nBody.bodies])
+
+            for _ in range(steps):
+                nBody.update(3600)
+            np.testing.assert_array_equal(latest.pos, nBody.state.pos)
+            self.assertTrue(0 <= physics.alpha() < 1)
+            self.assertEqual(physics.dropped, physics.stats()['dropped'])
+        finally:
+            physics.stop()
+        self.assertEqual(physics.process.exitcode, 0)
+
+    def test_merges_and_diagnostics(self):
+        # Bodies merged in the child leave the parent's body list of the frames; the energy error is sampled in the child
+        nBody = NBody(integrator='leapfrog')
+        nBody.addBody(Body('a', 5e20, 2e5)(Vector(-1e6, 0, 0), Vector(3e3, 0, 0)))
+        nBody.addBody(Body('b', 1e20, 1e5)(Vector(1e6, 0, 0), Vector(-3e3, 0, 0)))
+        nBody.addBody(Body('c', 1e20, 1e5)(Vector(0, 1e9, 0), Vector(0, 0, 0)))
+        nBody.setCollisions('merge')
+        physics = PhysicsProcess(nBody, 10, speed=2000)
+        try:
+            physics.setDiagnostics(1)
+            waitFor(lambda: physics.latest().N == 2)
+            self.assertEqual([body.name for body in physics.latest().bodies], ['a', 'c'])
+            self.assertIs(physics.latest().bodies[0], nBody[0])
+            waitFor(lambda: physics.energyErrors() != None)
+        finally:
+            physics.stop()
+
+    @unittest.skipIf(OpenGL == None, "PyOpenGL is not installed.")
+    def test_stats_summary(self):
+        # The stats of the interactive view follow the child's scheduler, with the render phases only
+        from src.simulation import AstrophysicsSimulation
+        sim = AstrophysicsSimulation((640, 480), process=True)
+        demos.earth_and_moon_scene(sim.NBody)
+        sim.scheduler = PhysicsProcess(sim.NBody, 60, speed=3600)
+        try:
+            sim.enableStats()
+            for _ in range(3):
+                sim.profiler.count('frames')
+                sim.profiler.start()
+                sim.profiler.lap('gl')
+            summary = sim.statsSummary(phases=True)
+            self.assertIn("render: ", summary)
+            self.assertNotIn("physics: ", summary)
+            self.assertFalse(any(line.startswith('physics') for line in sim.statsLines()))
+            self.assertIsNone(sim.stats()['physics'])
+        finally:
+            sim.scheduler.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Tests for the performance instrumentation.
+"""
+
+import time
+import unittest
+
+import numpy as np
+
+import demos
+from src import particles
+from src import profiling
+from src.nbody import NBody
+
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_laps(self):
+        profiler = profiling.Profiler()
+        profiler.start()
+        time.sleep(0.01)
+        profiler.lap('a')
+        profiler.add('inner', 0.004, nested=True)
+        time.sleep(0.01)
+        profiler.lap('b')
+        self.assertEqual(profiler.calls, {'a': 1, 'inner': 1, 'b': 1})
+        self.assertGreaterEqual(profiler.totals['a'], 0.01)
+        self.assertAlmostEqual(profiler.totals['b'], 0.006, delta=0.005)      # the nested time is excluded from its lap
+
+        report = profiler.report()
+        self.assertAlmostEqual(sum(stats['share'] for stats in report['phases'].values()), 1)
+        self.assertEqual(report['phases']['inner']['p50'], 0.004)
+
+    def test_rates(self):
+        profiler = profiling.Profiler(window=4)
+        self.assertEqual(profiler.rate('steps'), 0)
+        for _ in range(10):
+            profiler.count('steps')
+            time.sleep(0.002)
+        self.assertEqual(profiler.counters['steps'], 10)
+        self.assertEqual(len(profiler.intervals('steps')), 3)           # only the latest window
+        self.assertTrue(0 < profiler.rate('steps') < 500)
+
+    def test_rate_meter(self):
+        meter = profiling.RateMeter(window=1.0)
+        self.assertEqual(meter.rate(), 0)
+        for k in range(31):
+            meter.sample(10 * k if k < 20 else 200, now=0.1 * k)           # 100/s, then stalled
+        self.assertEqual(meter.rate(), 0)
+        self.assertLessEqual(len(meter.samples), 12)
+        meter.sample(300, now=3.5)
+        self.assertAlmostEqual(meter.rate(), 100)              # from the sample one window back, at 2.5 s
+
+    def test_percentiles(self):
+        self.assertEqual(profiling.percentiles(list(range(1, 101))), {'p50': 50, 'p90': 90, 'p99': 99})
+        self.assertEqual(profiling.percentiles([3.0]), {'p50': 3.0, 'p90': 3.0, 'p99': 3.0})
+        self.assertEqual(profiling.percentiles([])['p99'], 0)
+
+
+
+class TestNBodyProfiling(unittest.TestCase):
+
+    def test_phases(self):
+        for arrays, integrator, phases in [(False, None, {'reset', 'forces', 'integration', 'rotation'}),
+                                           (True, 'rk4', {'forces', 'integration', 'rotation'}),
+                                           (True, 'hermite', {'forces', 'integration', 'rotation'})]:
+            nBody = demos.solar_system_scene(NBody(arrays=arrays, integrator=integrator))
+            nBody.setProfiler()
+            for _ in range(5):
+                nBody.update(3600)
+            self.assertEqual(set(nBody.profiler.totals), phases)
+            self.assertEqual(nBody.profiler.counters['steps'], 5)
+            self.assertEqual(nBody.profiler.calls['forces'], 5 if not arrays else nBody.integrator.evaluations)
+
+    def test_same_results(self):
+        # Profiling does not change the physics, and a detached profiler records nothing more
+        for arrays in [False, True]:
+            plain, profiled = (demos.solar_system_scene(NBody(arrays=arrays)) for _ in range(2))
+            profiled.setProfiler()
+            for _ in range(5):
+                plain.update(3600)
+                profiled.update(3600)
+            for a, b in zip(plain, profiled):
+                self.assertEqual((a.pos.x, a.pos.y, a.pos.z, a.angle), (b.pos.x, b.pos.y, b.pos.z, b.angle))
+
+            profiler = profiled.profiler
+            profiled.setProfiler(None)
+            profiled.update(3600)
+            self.assertIsNone(profiled.profiler)
+            self.assertEqual(profiler.counters['steps'], 5)
+
+    def test_detached_while_stepping(self):
+        # Another thread may detach the profiler at any point of a step, e.g. right after a check that it is set (here the "checks"-th one)
+        class Detaching(profiling.Profiler):
+            def __ne__(self, other):
+                self.checks -= 1
+                if self.checks == 0:
+                    nBody.setProfiler(None)
+                return True
+        for integrator in ['leapfrog', 'hermite', 'wh']:
+            nBody = demos.solar_system_scene(NBody(integrator=integrator))
+            if nBody.integrator.testparticles:
+                nBody.addParticles(particles.belt(nBody[0], 10, a=(3e11, 5e11), seed=0))
+            for checks in range(1, 8):
+                nBody.integrator.reset()
+                nBody.setProfiler(Detaching())
+                nBody.profiler.checks = checks
+                nBody.update(3600)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
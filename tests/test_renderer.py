@@ -0,0 +1,139 @@
+"""
+Tests for the body renderer: the meshes, culling and detail selection, and (where PyOpenGL and Mesa's OSMesa are available) an offscreen draw.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+import numpy as np
+
+from src import renderer
+
+try:
+    import OpenGL
+except ImportError:
+    OpenGL = None
+
+
+
+class TestSphereMesh(unittest.TestCase):
+
+    def test_mesh(self):
+        for segments in renderer.LEVELS:
+            vertices, indices = renderer.sphereMesh(segments)
+            self.assertEqual(vertices.dtype, np.float32)
+            self.assertEqual(vertices.shape, ((segments // 2 + 1) * (segments + 1), 8))
+            self.assertEqual(len(indices), 6 * segments * (segments // 2))
+            self.assertLess(indices.max(), len(vertices))
+
+            position, normal, texcoord = vertices[:, :3], vertices[:, 3:6], vertices[:, 6:]
+            np.testing.assert_allclose(np.linalg.norm(position, axis=1), 1, rtol=1e-6)
+            np.testing.assert_array_equal(position, normal)
+            self.assertEqual((texcoord.min(), texcoord.max()), (0, 1))
+
+    def test_faces_outward(self):
+        # Counterclockwise seen from outside, as GL_CULL_FACE expects (the degenerate triangles at the poles excepted)
+        vertices, indices = renderer.sphereMesh(16)
+        a, b, c = (vertices[indices[k::3], :3].astype(float) for k in range(3))
+        normal = np.cross(b - a, c - a)
+        area = np.linalg.norm(normal, axis=1)
+        self.assertTrue(np.all(np.einsum('ij,ij->i', normal, a + b + c)[area > 1e-9] > 0))
+
+    def test_texture_coordinates(self):
+        # Same mapping as gluSphere: s = 0 at +y, 0.25 at +x, and t = 0 at z = -1
+        vertices, _ = renderer.sphereMesh(8)
+        for position, s, t in zip(vertices[:, :3], vertices[:, 6], vertices[:, 7]):
+            if t == 0.5 and s in (0, 0.25):
+                np.testing.assert_allclose(position, [0, 1, 0] if s == 0 else [1, 0, 0], atol=1e-6)
+            if t == 0:
+                np.testing.assert_allclose(position, [0, 0, -1], atol=1e-6)
+
+
+
+class TestCulling(unittest.TestCase):
+
+    def test_frustum(self):
+        eye = np.array([[0, 0, -10],       # straight ahead
+                        [0, 0, 10],        # behind
+                        [20, 0, -10],      # far to the right
+                        [4.5, 0, -10],     # just outside the right plane (tan 22.5 * 10 = 4.14) ...
+                        [0, 0, -1e6],      # beyond zfar
+                        [0, 0, -0.001]], dtype=float)     # around the eye
+        radius = np.array([1, 1, 1, 0.1, 1, 0.5])
+        mask = renderer.frustumMask(eye, radius, 45, 1, 0.01, 1000)
+        np.testing.assert_array_equal(mask, [True, False, False, False, False, True])
+        radius[3] = 1                       # ... but reaching into it
+        self.assertTrue(renderer.frustumMask(eye, radius, 45, 1, 0.01, 1000)[3])
+        self.assertFalse(renderer.frustumMask(eye, radius, 45, 0.4, 0.01, 1000)[3])         # narrower view
+
+    def test_projected_radius(self):
+        eye = np.array([[0, 0, -10], [0, 0, -20], [0, 0, -0.5]], dtype=float)
+        pixels = renderer.projectedRadius(eye, np.array([1, 1, 1.0]), 90, 200)
+        np.testing.assert_allclose(pixels[:2], [10, 5])
+        self.assertEqual(pixels[2], np.inf)
+
+    def test_detail_levels(self):
+        levels = renderer.detailLevels(np.array([0.2, 1, 5, 6, 50, 1000, np.inf]))
+        np.testing.assert_array_equal(levels, [-1, 0, 0, 1, 2, 3, 3])
+
+    def test_classify(self):
+        sphere = renderer.SphereRenderer()
+        sphere.setProjection(45, 1, 0.01, 1000, 900)
+        rng = np.random.default_rng(0)
+        eye = rng.uniform(-100, 100, (1000, 3))
+        radius = 10 ** rng.uniform(-4, 0.5, 1000)
+        visible, levels = sphere.classify(eye, radius)
+        np.testing.assert_array_equal(visible, np.flatnonzero(renderer.frustumMask(eye, radius, 45, 1, 0.01, 1000)))
+        self.assertEqual(sphere.stats['visible'] + sphere.stats['culled'], 1000)
+        self.assertEqual(sphere.stats['points'] + sum(sphere.stats['spheres']), len(visible))
+        self.assertTrue(sphere.stats['culled'] > 0 and sphere.stats['points'] > 0)
+
+
+
+OFFSCREEN = '''
+import json
+import numpy as np
+from OpenGL import GL
+from src import renderer
+from src.textures import Texture, uploadTexture
+
+context = renderer.OffscreenContext(64, 64)
+GL.glMatrixMode(GL.GL_PROJECTION)
+GL.glLoadIdentity()
+GL.glFrustum(-0.01, 0.01, -0.01, 0.01, 0.01 / np.tan(np.radians(22.5)), 100)
+GL.glMatrixMode(GL.GL_MODELVIEW)
+GL.glLoadIdentity()
+GL.glEnable(GL.GL_DEPTH_TEST)
+GL.glEnable(GL.GL_CULL_FACE)
+
+sphere = renderer.SphereRenderer()
+sphere.setProjection(45, 1, 0.01 / np.tan(np.radians(22.5)), 100, 64)
+sphere.create()
+white = Texture(None, uploadTexture(np.full((2, 2, 3), 255, dtype=np.uint8), mipmaps=False))
+eye = np.array([[0, 0, -5], [0.5, 0.5, -50], [100, 0, -5]], dtype=float)
+sphere.draw(eye, np.array([1, 0.01, 1]), np.zeros(3), np.zeros(3), [white] * 3)
+sphere.drawParticles(np.array([[0, 0.2, -3], [50, 0, -5]]))
+image = context.pixels()
+print(json.dumps(dict(sphere.stats, center=image[32, 32].tolist(), corner=image[0, 0].tolist())))
+context.close()
+'''
+
+
+@unittest.skipIf(OpenGL == None, "PyOpenGL is not installed")
+class TestOffscreen(unittest.TestCase):
+
+    def test_draw(self):
+        # In a separate process, as the GL platform must be chosen before OpenGL is first imported
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        environment = dict(os.environ, PYOPENGL_PLATFORM='osmesa')
+        result = subprocess.run([sys.executable, '-c', OFFSCREEN], cwd=root, env=environment, capture_output=True, text=True)
+        if result.returncode != 0 and 'osmesa' in result.stderr.lower():
+            self.skipTest("OSMesa is not available")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        drawn = json.loads(result.stdout)
+        self.assertEqual((drawn['spheres'], drawn['points'], drawn['culled'], drawn['particles']), ([0, 1, 0, 0], 1, 1, 1))
+        self.assertGreater(sum(drawn['center']), 0)         # the near sphere covers the center ...
+        self.assertEqual(drawn['corner'], [0, 0, 0])        # ... and not the corners
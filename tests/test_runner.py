@@ -0,0 +1,59 @@
+"""
+Tests for the runner file and the headless entry point.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+import headless
+from src import runner
+from src.nbody import NBody
+
+
+SCENE = os.path.join('resources', 'scenes', 'inner_solar_system.xml')
+
+
+class TestRunner(unittest.TestCase):
+
+    def test_fixed_number_of_steps(self):
+        nBody = headless.loadSystem('earth_and_moon')
+        stats = runner.run(nBody, 60, steps=100)
+        self.assertEqual(stats['steps'], 100)
+        self.assertEqual(nBody.time, 6000)
+        self.assertEqual(stats['bodies'], 2)
+        self.assertAlmostEqual(stats['bodystepspersec'], 2 * stats['stepspersec'])
+
+    def test_until_time(self):
+        nBody = headless.loadSystem('solar_system_sim', integrator='leapfrog')
+        stats = runner.run(nBody, 3600, until=86400 * 1.5)
+        self.assertEqual(stats['steps'], 36)
+        self.assertGreaterEqual(nBody.time, 86400 * 1.5)
+
+    def test_runs_are_reproducible(self):
+        a, b = headless.loadSystem('trappist_1'), headless.loadSystem('trappist_1')
+        runner.run(a, 3600, steps=50)
+        runner.run(b, 3600, steps=50)
+        self.assertEqual([body.pos for body in a], [body.pos for body in b])
+
+    def test_scene_file(self):
+        nBody = runner.loadScene(SCENE)
+        self.assertEqual(nBody.N, 7)
+        self.assertEqual(nBody[6].name, "Apophis")
+        self.assertEqual(nBody[6].body_type, "asteroid")
+        self.assertEqual(nBody[3].pos.x, 1.496e11)
+
+    def test_unknown_scene(self):
+        self.assertRaises(ValueError, headless.loadSystem, 'andromeda')
+
+    def test_cli_does_not_import_opengl(self):
+        code = "import sys, headless; headless.main(['solar_system', '--dt', '3600', '--steps', '5']); assert not any(m.startswith('OpenGL') for m in sys.modules)"
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, msg=result.stderr)
+        self.assertIn("steps/s", result.stdout)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
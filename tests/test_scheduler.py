@@ -0,0 +1,126 @@
+"""
+Tests for the fixed-timestep physics scheduler.
+"""
+
+import threading
+import time
+import unittest
+
+import demos
+from src.scheduler import Scheduler
+
+try:
+    import OpenGL
+except ImportError:
+    OpenGL = None
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_fixed_steps(self):
+        # Wall-clock time times the speed is spent in whole steps; the remainder carries over
+        clock = FakeClock()
+        scheduler = Scheduler(60, speed=3600, clock=clock)
+        clock.now = 0.01            # 36 s simulated: no step yet
+        self.assertEqual(scheduler.advance(), 0)
+        self.assertAlmostEqual(scheduler.alpha(), 0.6)
+        clock.now = 0.05            # 180 s
+        self.assertEqual(scheduler.advance(), 3)
+        clock.now = 0.07
+        self.assertEqual(scheduler.advance(), 1)
+        self.assertEqual(scheduler.steps, 4)
+        self.assertAlmostEqual(scheduler.accumulator, 0.07 * 3600 - 4 * 60)
+
+    def test_catch_up_cap(self):
+        # A stall yields at most maxsubsteps steps; the rest of the backlog is dropped
+        clock = FakeClock()
+        scheduler = Scheduler(1, speed=1, maxsubsteps=5, clock=clock)
+        clock.now = 100.5
+        self.assertEqual(scheduler.advance(), 5)
+        self.assertAlmostEqual(scheduler.dropped, 95.5)
+        self.assertEqual(scheduler.advance(), 0)
+
+    def test_pause_and_speed(self):
+        clock = FakeClock()
+        scheduler = Scheduler(1, speed=1, paused=True, clock=clock)
+        clock.now = 10
+        self.assertEqual(scheduler.advance(), 0)            # no time accumulates while paused
+        scheduler.setPaused(False)
+        clock.now = 12
+        scheduler.setSpeed(10)                              # the 2 s so far count at the old speed
+        clock.now = 12.5
+        self.assertEqual(scheduler.advance(), 7)
+        self.assertEqual(scheduler.alpha(), 0.0)
+
+    def test_change_deltatime(self):
+        # A smaller step keeps the fraction of a step accumulated so far, and hands out no steps while paused
+        clock = FakeClock()
+        scheduler = Scheduler(60, speed=3600, clock=clock)
+        clock.now = 0.015           # 54 s of a 60 s step
+        self.assertEqual(scheduler.advance(), 0)
+        scheduler.setPaused(True)
+        scheduler.setDeltatime(6)
+        self.assertAlmostEqual(scheduler.accumulator, 5.4)
+        clock.now = 1
+        self.assertEqual(scheduler.advance(), 0)
+        self.assertAlmostEqual(scheduler.alpha(), 0.9)
+        scheduler.setPaused(False)
+        clock.now = 1 + 0.7 / 3600
+        self.assertEqual(scheduler.advance(), 1)
+
+    def test_wait(self):
+        # The physics side sleeps until a step is due, blocks while paused and returns 0 once stopped
+        scheduler = Scheduler(0.02, speed=1)
+        start = time.perf_counter()
+        self.assertGreaterEqual(scheduler.wait(), 1)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.015)
+
+        scheduler.setPaused(True)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(scheduler.wait()))
+        thread.start()
+        time.sleep(0.1)
+        self.assertEqual(results, [])
+        scheduler.stop()
+        thread.join(5)
+        self.assertEqual(results, [0])
+
+
+
+@unittest.skipIf(OpenGL == None, "PyOpenGL is not installed.")
+class TestPhysicsThread(unittest.TestCase):
+
+    def test_diagnostics_toggle(self):
+        # Diagnostics toggled by the view start and stop on the physics thread, between steps
+        from src.simulation import AstrophysicsSimulation
+        sim = AstrophysicsSimulation((640, 480), integrator='leapfrog')
+        demos.earth_and_moon_scene(sim.NBody)
+        sim.enableDiagnostics(every=2)
+        self.assertIsNone(sim.diagnostics)
+        diagnostics = sim.updateDiagnostics()
+        self.assertEqual((diagnostics.every, len(diagnostics.energies)), (2, 1))
+        for _ in range(4):
+            self.assertIs(sim.updateDiagnostics(), diagnostics)
+            sim.NBody.update(60)
+            diagnostics(sim.NBody)
+        self.assertIsNotNone(sim.energyErrors())
+
+        sim.disableDiagnostics()
+        self.assertIsNone(sim.energyErrors())
+        self.assertIs(sim.diagnostics, diagnostics)         # until the physics thread's next step
+        self.assertIsNone(sim.updateDiagnostics())
+        self.assertIsNone(sim.diagnostics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+"""
+Tests for the triple-buffered snapshot handoff and the interpolation between the latest two states.
+"""
+
+import threading
+import unittest
+
+import numpy as np
+
+import demos
+from src.nbody import NBody
+from src.snapshot import InterpolationBuffer, TripleBuffer, interpolate, interpolateParticles
+
+
+
+class TestTripleBuffer(unittest.TestCase):
+
+    def test_latest_frame(self):
+        for arrays in [False, True]:
+            nBody = demos.solar_system_scene(NBody(arrays=arrays))
+            buffer = TripleBuffer()
+            for _ in range(3):
+                nBody.update(3600)
+                buffer.publish(nBody)
+            frame = buffer.latest()
+            self.assertEqual(frame.serial, 3)
+            self.assertEqual(frame.time, nBody.time)
+            for i, body in enumerate(nBody):
+                self.assertEqual(tuple(frame.pos[i]), (body.pos.x, body.pos.y, body.pos.z))
+                self.assertEqual(frame.angle[i], body.angle)
+                self.assertEqual(frame.radius[i], body.radius)
+
+    def test_frame_kept_until_next_read(self):
+        nBody = demos.solar_system_scene(NBody(arrays=True))
+        buffer = TripleBuffer()
+        buffer.publish(nBody)
+        frame = buffer.latest()
+        pos = frame.pos.copy()
+        for _ in range(5):
+            nBody.update(3600)
+            buffer.publish(nBody)
+        self.assertTrue(np.array_equal(frame.pos, pos))
+        self.assertIs(buffer.latest(), buffer.latest())
+        self.assertEqual(buffer.latest().serial, 6)
+
+    def test_no_reallocation(self):
+        nBody = demos.solar_system_scene(NBody(arrays=True))
+        buffer = TripleBuffer()
+        for _ in range(3):
+            buffer.publish(nBody)
+            buffer.latest()
+        frames = set(id(frame.pos) for frame in buffer.frames)
+        for _ in range(20):
+            nBody.update(3600)
+            buffer.publish(nBody)
+            buffer.latest()
+        self.assertEqual(set(id(frame.pos) for frame in buffer.frames), frames)
+
+    def test_body_count_change(self):
+        nBody = demos.solar_system_scene(NBody(arrays=True))
+        buffer = TripleBuffer()
+        buffer.publish(nBody)
+        nBody.removeBody(nBody[-1])
+        buffer.publish(nBody)
+        self.assertEqual(buffer.latest().N, nBody.N)
+        self.assertEqual(buffer.latest().bodies, nBody.bodies)
+
+    def test_no_torn_frames(self):
+        # Every published frame is uniformly filled with its serial number: a reader must never see a mix.
+        class Fake:
+            N, state, time, bodies, particles = 500, None, 0, [], None
+        fake = Fake()
+        fake.state = type('State', (), {'pos': np.zeros((500, 3)), 'radius': np.zeros(500), 'angle': np.zeros(500)})()
+
+        buffer = TripleBuffer()
+        done = threading.Event()
+        def writer():
+            for k in range(1, 3001):
+                fake.state.pos[:] = k
+                fake.state.angle[:] = k
+                fake.time = k
+                buffer.publish(fake)
+            done.set()
+        thread = threading.Thread(target=writer)
+        thread.start()
+
+        last = 0
+        while not done.is_set() or last < 3000:
+            frame = buffer.latest()
+            if frame.N:
+                value = frame.time
+                self.assertTrue(np.all(frame.pos == value) and np.all(frame.angle == value))
+                self.assertGreaterEqual(value, last)
+                last = value
+        thread.join()
+
+
+
+
+class TestInterpolationBuffer(unittest.TestCase):
+
+    def test_latest_two(self):
+        nBody = demos.solar_system_scene(NBody(arrays=True))
+        buffer = InterpolationBuffer()
+        self.assertEqual(buffer.latestTwo()[1].N, 0)
+        buffer.publish(nBody)
+        previous, latest = buffer.latestTwo()
+        self.assertIsNone(previous)
+        self.assertEqual(latest.serial, 1)
+        for _ in range(4):
+            nBody.update(3600)
+            buffer.publish(nBody)
+        previous, latest = buffer.latestTwo()
+        self.assertEqual((previous.serial, latest.serial), (4, 5))
+        self.assertIs(buffer.latest(), latest)
+
+    def test_read_frames_kept(self):
+        # The two frames being read are never written, however often physics publishes
+        nBody = demos.solar_system_scene(NBody(arrays=True))
+        buffer = InterpolationBuffer()
+        buffer.publish(nBody)
+        nBody.update(3600)
+        buffer.publish(nBody)
+        previous, latest = buffer.latestTwo()
+        copies = previous.pos.copy(), latest.pos.copy()
+        for _ in range(20):
+            nBody.update(3600)
+            buffer.publish(nBody)
+        self.assertTrue(np.array_equal(previous.pos, copies[0]) and np.array_equal(latest.pos, copies[1]))
+        self.assertEqual(buffer.latestTwo()[1].serial, 22)
+
+    def test_interpolate(self):
+        nBody = demos.solar_system_scene(NBody(arrays=True))
+        buffer = InterpolationBuffer()
+        buffer.publish(nBody)
+        start, angle = nBody.state.pos.copy(), nBody.state.angle.copy()
+        nBody.update(3600)
+        buffer.publish(nBody)
+        previous, latest = buffer.latestTwo()
+
+        pos, angles = interpolate(previous, latest, 0.0)
+        self.assertTrue(np.array_equal(pos, start))
+        pos, angles = interpolate(previous, latest, 1.0)
+        np.testing.assert_allclose(pos, nBody.state.pos)
+        np.testing.assert_allclose(np.remainder(angles, 360), nBody.state.angle, atol=1e-9)
+        pos, angles = interpolate(previous, latest, 0.25, np.empty((nBody.N, 3)), np.empty(nBody.N))
+        np.testing.assert_allclose(pos, start + 0.25 * (nBody.state.pos - start))
+
+        previous.angle[0], latest.angle[0] = 359.0, 1.0            # the short way round
+        self.assertAlmostEqual(interpolate(previous, latest, 0.5)[1][0], 360.0)
+
+        nBody.removeBody(nBody[-1])                 # different bodies: the latest state as is
+        buffer.publish(nBody)
+        previous, latest = buffer.latestTwo()
+        self.assertIs(interpolate(previous, latest, 0.5)[0], latest.pos)
+
+    def test_test_particles(self):
+        nBody = demos.asteroid_belt_scene(NBody(integrator='leapfrog'))
+        buffer = InterpolationBuffer()
+        buffer.publish(nBody)
+        start = nBody.particles.pos.copy()
+        nBody.update(86400)
+        buffer.publish(nBody)
+        previous, latest = buffer.latestTwo()
+        np.testing.assert_array_equal(latest.particles, nBody.particles.pos)
+        np.testing.assert_allclose(interpolateParticles(previous, latest, 0.25), start + 0.25 * (nBody.particles.pos - start))
+
+        nBody.particles.add(nBody.particles.copy())             # a reallocated frame for a new particle count, drawn as is
+        buffer.publish(nBody)
+        previous, latest = buffer.latestTwo()
+        self.assertEqual(len(latest.particles), 2 * len(start))
+        self.assertIs(interpolateParticles(previous, latest, 0.5), latest.particles)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
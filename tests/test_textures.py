@@ -0,0 +1,73 @@
+"""
+Tests for the texture cache (the GL side needs a context and is not tested here).
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from src import textures
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+
+class TestTextureCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = textures.TextureCache(os.path.join(self.directory, 'cache'), maxsize=4, workers=2)
+        self.imagepath = os.path.join(self.directory, 'image.jpg')
+        with open(self.imagepath, 'wb') as f:
+            f.write(b'not decoded in these tests')
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def test_missing_image(self):
+        self.assertIsNone(self.cache.load(os.path.join(self.directory, 'missing.jpg')))
+        self.assertIsNone(self.cache.request(os.path.join(self.directory, 'missing.jpg')).result())
+
+    def test_cache_hit(self):
+        data = np.arange(24, dtype=np.uint8).reshape(2, 4, 3)
+        self.cache.store(self.cache.cachePath(self.imagepath), data)
+        loaded = self.cache.request(self.imagepath).result()
+        self.assertIsInstance(loaded, np.memmap)
+        self.assertTrue(np.array_equal(loaded, data))
+        self.assertEqual(self.cache.decoded, 0)
+
+    def test_cache_keys(self):
+        path = self.cache.cachePath(self.imagepath)
+        self.assertNotEqual(textures.TextureCache(self.cache.directory, maxsize=8).cachePath(self.imagepath), path)
+        with open(self.imagepath, 'ab') as f:
+            f.write(b'!')
+        self.assertNotEqual(self.cache.cachePath(self.imagepath), path)
+
+    def test_unwritable_cache(self):
+        cache = textures.TextureCache(os.path.join(self.imagepath, 'cache'))
+        cache.store(cache.cachePath(self.imagepath), textures.FALLBACK)
+        cache.close()
+
+    @unittest.skipIf(Image == None, "needs Pillow")
+    def test_decode(self):
+        pixels = np.zeros((4, 8, 3), dtype=np.uint8)
+        pixels[0] = 255                 # top row white
+        Image.fromarray(pixels).save(os.path.join(self.directory, 'image.png'))
+        data = self.cache.load(os.path.join(self.directory, 'image.png'))
+        self.assertEqual(data.shape, (2, 4, 3))
+        self.assertGreater(data[-1].mean(), data[0].mean())          # top row last, as OpenGL expects
+        self.assertEqual(self.cache.decoded, 1)
+        self.cache.load(os.path.join(self.directory, 'image.png'))
+        self.assertEqual(self.cache.decoded, 1)
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Tests for the trajectory file.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import headless
+from src import runner
+from src.trajectory import Trajectory, TrajectoryWriter, indexPath
+
+
+class TestTrajectory(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, 'run.traj')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def recordRun(self, nBody, steps=40, every=3, chunkframes=4):
+        frames = []
+        def callback(nBody, step):
+            writer(nBody, step)
+            if (step + 1) % every == 0:
+                frames.append((nBody.time, nBody.state.pos.copy()))
+        with TrajectoryWriter(self.filepath, nBody, every=every, chunkframes=chunkframes) as writer:
+            runner.run(nBody, 3600, steps=steps, callback=callback)
+        return frames
+
+    def test_frames_round_trip(self):
+        frames = self.recordRun(headless.loadSystem('solar_system', integrator='leapfrog'))
+        traj = Trajectory(self.filepath)
+        self.assertEqual(len(traj), len(frames))
+        self.assertEqual(traj.N, 9)
+        self.assertEqual(traj.bodies[3]['name'], "Earth")
+        self.assertEqual(traj.bodies[0]['body_type'], "star")
+        for frame, (time, pos) in zip(traj, frames):
+            self.assertEqual(frame['time'], time)
+            self.assertTrue(np.array_equal(frame['pos'], pos))
+
+    def test_time_lookup(self):
+        self.recordRun(headless.loadSystem('trappist_1', integrator='leapfrog'))
+        traj = Trajectory(self.filepath)
+        self.assertIsInstance(traj.times, np.memmap)
+        self.assertEqual(traj.frameIndex(0), 0)
+        self.assertEqual(traj.frameIndex(traj.times[5]), 5)
+        self.assertEqual(traj.frameIndex(traj.times[5] + 1), 5)
+        self.assertEqual(traj.frameIndex(1e12), len(traj) - 1)
+        middle = 0.5 * (traj.times[2] + traj.times[3])
+        self.assertTrue(np.allclose(traj.positionsAt(middle), 0.5 * (traj[2]['pos'] + traj[3]['pos'])))
+
+    def test_missing_index_is_rebuilt(self):
+        self.recordRun(headless.loadSystem('earth_and_moon', integrator='leapfrog'))
+        os.remove(indexPath(self.filepath))
+        traj = Trajectory(self.filepath)
+        self.assertEqual(traj.frameIndex(traj.times[4]), 4)
+
+    def test_list_mode_nbody(self):
+        nBody = headless.loadSystem('earth_and_moon')
+        with TrajectoryWriter(self.filepath, nBody) as writer:
+            runner.run(nBody, 60, steps=5, callback=writer)
+        traj = Trajectory(self.filepath)
+        self.assertEqual(len(traj), 5)
+        self.assertEqual(list(traj[-1]['pos'][1]), [nBody[1].pos.x, nBody[1].pos.y, nBody[1].pos.z])
+
+    def test_body_count_must_not_change(self):
+        nBody = headless.loadSystem('earth_and_moon', engine='direct')
+        with TrajectoryWriter(self.filepath, nBody) as writer:
+            nBody.removeBody(nBody[1])
+            self.assertRaises(ValueError, writer.record, nBody)
+
+    def test_cli(self):
+        headless.main(['earth_and_moon', '--dt', '60', '--steps', '20', '--every', '5', '--trajectory', self.filepath])
+        self.assertEqual(len(Trajectory(self.filepath)), 5)
+
+    def test_cli_frames_are_evenly_spaced(self):
+        # The initial conditions, then every "every"-th step
+        headless.main(['earth_and_moon', '--dt', '10', '--steps', '12', '--every', '5', '--trajectory', self.filepath])
+        self.assertEqual(list(Trajectory(self.filepath).times), [0, 50, 100])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,7 +6,9 @@ Yes, this is likely quite excessive.
 import math
 import unittest
 
-from src.vector import Vector
+import numpy as np
+
+from src.vector import Vector, VectorArray
 
 
 class TestVectorAccess(unittest.TestCase):
@@ -156,6 +158,84 @@ class TestVectorString(unittest.TestCase):
 
 
 
+class TestVectorInPlace(unittest.TestCase):
+
+    def test_vector_in_place_addition(self):
+        v = Vector(1, 2, 3)
+        w = v
+        v += Vector(1, 1, 1)
+        self.assertIs(v, w, msg="In-place addition must not create a new vector.")
+        self.assertEqual(v, Vector(2, 3, 4), msg="In-place addition failed.")
+
+    def test_vector_in_place_subtraction(self):
+        v = Vector(1, 2, 3)
+        w = v
+        v -= Vector(1, 1, 1)
+        self.assertIs(v, w, msg="In-place subtraction must not create a new vector.")
+        self.assertEqual(v, Vector(0, 1, 2), msg="In-place subtraction failed.")
+
+    def test_vector_in_place_multiplication(self):
+        v = Vector(1, 2, 3)
+        w = v
+        v *= 2
+        self.assertIs(v, w, msg="In-place multiplication must not create a new vector.")
+        self.assertEqual(v, Vector(2, 4, 6), msg="In-place multiplication failed.")
+
+    def test_vector_in_place_with_scalar(self):
+        v = Vector(1, 2, 3)
+        with self.assertRaises(TypeError, msg="In-place addition with a scalar should not be possible."):
+            v += 1
+        with self.assertRaises(TypeError, msg="In-place multiplication with a vector should not be possible."):
+            v *= Vector(1, 2, 3)
+
+    def test_vector_axpy(self):
+        v = Vector(1, 2, 3)
+        self.assertIs(v.axpy(2, Vector(1, -1, 0.5)), v, msg="axpy must return the vector itself.")
+        self.assertEqual(v, Vector(3, 0, 4), msg="axpy failed.")
+
+    def test_vector_numpy_scalar(self):
+        self.assertEqual(np.float64(2) * Vector(1, 2, 3), Vector(2, 4, 6), msg="NumPy scalars must multiply vectors like floats.")
+        self.assertIsInstance(np.float64(2) * Vector(1, 2, 3), Vector, msg="NumPy scalars must not turn vectors into arrays.")
+
+    def test_vector_slots(self):
+        with self.assertRaises(AttributeError, msg="Vectors only have x, y and z attributes."):
+            Vector(1, 2, 3).w = 4
+
+
+
+class TestVectorArray(unittest.TestCase):
+
+    def test_vector_array_from_vectors(self):
+        a = VectorArray([Vector(1, 2, 3), Vector(4, 5)])
+        self.assertEqual(a.data.shape, (2, 3), msg="VectorArray must hold an (N, 3) array.")
+        self.assertEqual(a[1], Vector(4, 5, 0), msg="VectorArray indexing must return the row as a Vector.")
+        self.assertEqual(list(a), [Vector(1, 2, 3), Vector(4, 5)], msg="VectorArray iteration must return the rows as Vectors.")
+
+    def test_vector_array_arithmetic(self):
+        a = VectorArray([[1, 2, 3], [4, 5, 6]])
+        self.assertEqual(a + a, VectorArray([[2, 4, 6], [8, 10, 12]]), msg="VectorArray addition failed.")
+        self.assertEqual(a - Vector(1, 1, 1), VectorArray([[0, 1, 2], [3, 4, 5]]), msg="VectorArray subtraction of a Vector failed.")
+        self.assertEqual(a * np.array([1, 2]), VectorArray([[1, 2, 3], [8, 10, 12]]), msg="VectorArray multiplication with per-row scalars failed.")
+        with self.assertRaises(TypeError, msg="VectorArray addition with a scalar should not be possible."):
+            a + 1
+
+    def test_vector_array_in_place(self):
+        a = VectorArray([[1, 2, 3], [4, 5, 6]])
+        data = a.data
+        a += Vector(1, 1, 1)
+        a *= 2
+        a.axpy(np.array([1, 0]), VectorArray([[1, 1, 1], [1, 1, 1]]))
+        self.assertIs(a.data, data, msg="In-place VectorArray operations must not reallocate.")
+        self.assertEqual(a, VectorArray([[5, 7, 9], [10, 12, 14]]), msg="In-place VectorArray operations failed.")
+
+    def test_vector_array_products(self):
+        a = VectorArray([Vector(1, 2, 3), Vector(-9, 6, -2)])
+        self.assertEqual(a.dot(Vector(4.45, 5.1, 6.8))[0], Vector(1, 2, 3).dot(Vector(4.45, 5.1, 6.8)), msg="VectorArray dot product failed.")
+        self.assertAlmostEqual(a.cross(Vector(4.45, 5.1, 6.8))[0], Vector(-1.7, 6.55, -3.8), msg="VectorArray cross product failed.")
+        self.assertEqual(a.norm()[1], 11, msg="VectorArray norm failed.")
+
+
+
 if __name__ == '__main__':
     unittest.main()
 